@@ -45,7 +45,8 @@ setup(
     url='https://github.com/cmmeyer/cfn-safeset',
     package_dir={'': 'src'},
     package_data={'cfnsafeset': [
-        'data/stateful-resources.yaml'
+        'data/stateful-resources.yaml',
+        'data/replacement-index.json'
     ]},
     packages=find_packages('src'),
     zip_safe=False,
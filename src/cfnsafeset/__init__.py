@@ -16,5 +16,12 @@
 """
 
 import logging
+# First, so the import phase covers the rest of the package
+import cfnsafeset.metrics  # noqa: F401  pylint: disable=C0411
+from cfnsafeset.api import scan, scan_change_set, scan_file  # noqa: F401
+from cfnsafeset.core import Finding  # noqa: F401
+from cfnsafeset.exceptions import (  # noqa: F401
+    ArchiveError, CfnSafesetError, ChangeSetFileError, ChangeSetNotFoundError,
+    ChangeSetRetrievalError, ConfigError, CredentialsError, TemplateError)
 
 LOGGER = logging.getLogger(__name__)
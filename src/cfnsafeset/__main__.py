@@ -14,32 +14,253 @@
   OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
   SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
+import io
+import json
 import logging
 import sys
+import cfnsafeset.archive
 import cfnsafeset.core
+import cfnsafeset.classifier
+import cfnsafeset.batch
+import cfnsafeset.clients
+import cfnsafeset.credentials
+import cfnsafeset.daemon
+import cfnsafeset.files
+import cfnsafeset.incremental
+import cfnsafeset.metrics
+import cfnsafeset.nested
+import cfnsafeset.predict
+import cfnsafeset.results
+import cfnsafeset.rootcause
+import cfnsafeset.sweep
+import cfnsafeset.throttle
+import cfnsafeset.watch
+from cfnsafeset.exceptions import CfnSafesetError
+from cfnsafeset.metrics import METRICS
 
 LOGGER = logging.getLogger('cfnsafeset')
-CONFIG_FILE = '/data/stateful-resources.yaml'
+CONFIG_FILE = cfnsafeset.core.CONFIG_FILE
+
+
+def run_with_daemon(args):
+    """ Check via a running daemon; None means fall back to in-process """
+    socket_path = cfnsafeset.daemon.get_socket_path(args.daemon_socket)
+    try:
+        request = cfnsafeset.daemon.build_request(args)
+    except IOError:
+        # Let the in-process path report unreadable files
+        return None
+    response = cfnsafeset.daemon.request_check(
+        request, socket_path, (args.wait_timeout or 0) + cfnsafeset.daemon.ANSWER_MARGIN)
+    if response is None:
+        LOGGER.info('No cfn-safeset daemon available, checking in-process')
+        if args.file and args.file[0] == '-':
+            # Standard input is used up; hand the document to the in-process check
+            document = request['Document']
+            if isinstance(document, bytes):  # Python 2
+                document = document.decode('utf-8')
+            sys.stdin = io.StringIO(document)
+        return None
+    return cfnsafeset.daemon.replay(response)
+
+
+def serve(args, classifier):
+    """ Run the daemon with the configured classifier """
+    # Capture info records for clients running with -i; console output
+    # still follows -i/-d
+    for handler in LOGGER.handlers:
+        handler.setLevel(LOGGER.level)
+    LOGGER.setLevel(min(LOGGER.level, logging.INFO))
+    socket_path = cfnsafeset.daemon.get_socket_path(args.daemon_socket)
+    try:
+        return cfnsafeset.daemon.serve(
+            socket_path, classifier, client_pool(args))
+    except (ValueError, OSError) as err:
+        LOGGER.error('Cannot start daemon: %s', err)
+        return 1
+
+
+def client_pool(args):
+    """ Client pool for --endpoint-url, with --role credentials cached on disk """
+    return cfnsafeset.clients.ClientPool(
+        args.endpoint_url, cfnsafeset.credentials.CredentialCache(
+            session_name=args.role_session_name, duration=args.role_duration))
+
+
+def api_client(args, role=None):
+    """ Client for --endpoint-url or a role, or None so a client is only made when needed """
+    if role:
+        return client_pool(args).get(args.region, args.profile, role)
+    if not args.endpoint_url:
+        return None
+    return cfnsafeset.core.get_client(args.region, args.profile, args.endpoint_url)
+
+
+def build_replacement_index(spec_file):
+    """ Print a replacement index built from a resource specification file """
+    try:
+        with open(spec_file) as spec_stream:
+            spec = json.load(spec_stream)
+    except (IOError, ValueError) as err:
+        LOGGER.error('Cannot read resource specification %s: %s', spec_file, err)
+        return 1
+    json.dump(cfnsafeset.predict.build_index(spec), sys.stdout, indent=2, sort_keys=True)
+    sys.stdout.write('\n')
+    return 0
+
+
+def report_metrics(args, exit_code):
+    """ Log phase timings and API counters, and export them if asked """
+    stats = cfnsafeset.throttle.STATS.snapshot()
+    if stats['api_calls']:
+        LOGGER.debug('CloudFormation API calls: %(api_calls)d, attempts: %(attempts)d, '
+                     'throttles: %(throttles)d, retries: %(retries)d', stats)
+    sample = cfnsafeset.metrics.collect(METRICS, stats, exit_code)
+    LOGGER.debug('Phase timings: %s', ', '.join(
+        '%s %.3fs' % (name, seconds) for name, seconds in sorted(sample['phases'].items())))
+    if args is not None and args.metrics:
+        cfnsafeset.metrics.export(args.metrics, sample)
 
 
 def main():
     """Main function"""
-    args = cfnsafeset.core.get_args()
-    config = cfnsafeset.core.init_config(CONFIG_FILE)
-    monitored_change_types = config['ChangeTypes']
-    LOGGER.debug('Monitored change types from config: %s',
-                 monitored_change_types)
-    stateful_resources = set(config['StatefulResources'])
-    LOGGER.debug('Stateful resources from config: %s', stateful_resources)
+    METRICS.record('import', cfnsafeset.metrics.since_import())
+    args = None
+    exit_code = 1
+    try:
+        args = cfnsafeset.core.get_args()
+        exit_code = run(args)
+        return exit_code
+    except CfnSafesetError as err:
+        LOGGER.error(err)
+        return 1
+    finally:
+        report_metrics(args, exit_code)
+
+
+def import_archive(archive_path, filenames):
+    """ Add change set files to an archive, returning 1 if any could not be read """
+    if not filenames:
+        LOGGER.error('--archive-import needs change set files (-f)')
+        return 1
+    imported, skipped, failed = cfnsafeset.archive.import_files(archive_path, filenames)
+    print('Archived %d change sets in %s (%d already archived, %d failed)' % (
+        imported, archive_path, skipped, failed))
+    return 1 if failed else 0
+
+
+def run(args):
+    """ Run the checks selected on the command line """
+    filenames = cfnsafeset.files.expand_paths(args.file) if args.file else []
+    if args.use_daemon and cfnsafeset.daemon.can_forward(
+            args, filenames, cfnsafeset.core.create_parser()):
+        exit_code = run_with_daemon(args)
+        if exit_code is not None:
+            return exit_code
+    if args.build_replacement_index:
+        return build_replacement_index(args.build_replacement_index)
+    if args.archive_import:
+        return import_archive(args.archive_import, filenames)
+    try:
+        roles = cfnsafeset.credentials.load_roles(args.role, args.roles)
+    except ValueError as err:
+        LOGGER.error(err)
+        return 1
+    if len(roles) > 1 and not args.sweep:
+        LOGGER.error('Several roles can only be used with --sweep; '
+                     'give batch entries a Role instead')
+        return 1
+    role = roles[0] if roles else None
+    with METRICS.phase('config'):
+        config = cfnsafeset.core.init_config(
+            CONFIG_FILE, use_cache=not args.no_config_cache)
+        if args.policy:
+            config = cfnsafeset.core.load_policy(config, args.policy)
+        LOGGER.debug('Monitored change types from config: %s',
+                     config['ChangeTypes'])
+        LOGGER.debug('Stateful resources from config: %s', config['StatefulResources'])
+        classifier = cfnsafeset.classifier.compile_config(config)
+    jobs = args.jobs or cfnsafeset.core.DEFAULT_JOBS
+    monitored_change_types = classifier.extractors
+    stateful_resources = classifier
     if args.list:
         cfnsafeset.core.show_stateful_resources(stateful_resources)
         return 0
-    if args.file:
-        changes = cfnsafeset.core.load_cs_file(args.file)
+    if args.archive_query:
+        with cfnsafeset.archive.Archive(args.archive_query) as archive:
+            with METRICS.phase('detect'):
+                stats = cfnsafeset.archive.query(archive, classifier, args.resource_type)
+            cfnsafeset.archive.report_query(archive, stats)
+        return 0
+    if args.serve:
+        return serve(args, classifier)
+    if args.watch:
+        return cfnsafeset.watch.watch(
+            args.watch, cfnsafeset.results.config_digest(config), classifier,
+            args.watch_report, args.poll_interval, args.poll)
+    if args.sweep:
+        results = cfnsafeset.sweep.sweep(
+            args.regions or [args.region], args.profile, classifier, jobs,
+            client_pool(args), roles)
+        return cfnsafeset.sweep.report_sweep(results, args.fail_fast)
+    if args.batch:
+        try:
+            entries = cfnsafeset.batch.load_manifest(
+                args.batch, args.region, args.profile, role)
+        except ValueError as err:
+            LOGGER.error(err)
+            return 1
+        return cfnsafeset.batch.run_batch(
+            entries, monitored_change_types, stateful_resources, jobs,
+            clients=client_pool(args),
+            wait_timeout=args.wait_timeout, fail_fast=args.fail_fast)
+    if len(filenames) > 1:
+        if args.root_cause:
+            LOGGER.error('--root-cause only applies to a single change set, '
+                         'but %s expands to %d files', ' '.join(args.file), len(filenames))
+            return 1
+        with METRICS.phase('detect'):
+            return cfnsafeset.files.report_files(
+                cfnsafeset.files.scan_files(filenames, config, args.jobs, args.fail_fast),
+                args.fail_fast)
+    if filenames:
+        changes = METRICS.timed_iter(cfnsafeset.core.load_cs_file(filenames[0]), 'parse')
+    elif args.predict:
+        with METRICS.phase('parse'):
+            changes = cfnsafeset.predict.predict(
+                args.predict[0], args.predict[1], args.replacement_index)
+    elif args.nested:
+        nodes = cfnsafeset.nested.scan_tree(
+            args.changeset, args.stack, args.region, args.profile,
+            api_client(args, role), classifier, jobs,
+            wait_timeout=args.wait_timeout, fail_fast=args.fail_fast)
+        return cfnsafeset.nested.report_tree(nodes)
+    elif args.incremental:
+        if cfnsafeset.incremental.check_change_set(
+                args, cfnsafeset.results.config_digest(config), classifier,
+                cf_client=api_client(args, role), fail_fast=args.fail_fast):
+            return 2
+        return 0
+    elif args.cache:
+        if cfnsafeset.results.check_change_set(
+                args, cfnsafeset.results.config_digest(config),
+                monitored_change_types, stateful_resources,
+                cf_client=api_client(args, role), fail_fast=args.fail_fast):
+            return 2
+        return 0
     else:
-        changes = cfnsafeset.core.get_change_set(
-            args.changeset, args.stack, args.region, args.profile)
-    if cfnsafeset.core.detect_stateful_replace(changes, monitored_change_types, stateful_resources):
+        changes = METRICS.timed_iter(cfnsafeset.core.get_change_set(
+            args.changeset, args.stack, args.region, args.profile,
+            cf_client=api_client(args, role), wait_timeout=args.wait_timeout), 'retrieve')
+    if args.root_cause:
+        # Causes can point anywhere in the change set, so keep all of it
+        changes = list(changes)
+    with METRICS.phase('detect'):
+        detected = cfnsafeset.core.detect_stateful_replace(
+            changes, monitored_change_types, stateful_resources, args.fail_fast)
+    if args.root_cause:
+        cfnsafeset.rootcause.report(changes, classifier)
+    if detected:
         return 2
     return 0
 
@@ -0,0 +1,57 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import cfnsafeset.core
+from cfnsafeset.classifier import Classifier, compile_config
+
+_DEFAULT = {}
+_DEFAULT_LOCK = threading.Lock()
+
+
+def get_classifier(config=None):
+    """ Classifier for a config: None for the packaged one, a dict or a Classifier """
+    if isinstance(config, Classifier):
+        return config
+    if config is not None:
+        return compile_config(config)
+    with _DEFAULT_LOCK:
+        if 'classifier' not in _DEFAULT:
+            _DEFAULT['classifier'] = compile_config(
+                cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE))
+        return _DEFAULT['classifier']
+
+
+def scan(changes, config=None):
+    """ Return a Finding for each stateful resource the changes remove or replace
+
+    changes is any iterable of change set Changes entries. Nothing is printed
+    and nothing exits; bad config raises ConfigError. Any Policies in config
+    are applied.
+    """
+    classifier = get_classifier(config)
+    return list(cfnsafeset.core.iter_findings(changes, classifier.extractors, classifier))
+
+
+def scan_file(filename, config=None):
+    """ Scan an exported change set file; raises ChangeSetFileError """
+    return scan(cfnsafeset.core.load_cs_file(filename), config)
+
+
+def scan_change_set(change_set, stack, region, profile=None, config=None, cf_client=None):
+    """ Scan a live change set; raises ChangeSetNotFoundError or ChangeSetRetrievalError """
+    return scan(cfnsafeset.core.get_change_set(
+        change_set, stack, region, profile, cf_client=cf_client), config)
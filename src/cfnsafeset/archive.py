@@ -0,0 +1,403 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import array
+import collections
+import fnmatch
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+import cfnsafeset.cache
+import cfnsafeset.core
+import cfnsafeset.watch
+from cfnsafeset.exceptions import ArchiveError, CfnSafesetError
+
+LOGGER = logging.getLogger('cfnsafeset')
+MAGIC = b'CFNSSARC'
+VERSION = 1
+ALIGN = 8
+UINT8 = 'B'
+UINT32 = 'I' if array.array('I').itemsize == 4 else 'L'
+# Interned string tables; columns of the same name hold their indexes
+TABLES = ('LogicalId', 'ResourceType', 'Action', 'Replacement',
+          'Property', 'Recreation', 'ChangeSource', 'Evaluation')
+# One row per resource change; its details run up to DetailEnd
+ROW_COLUMNS = (
+    ('Source', UINT32),
+    ('LogicalId', UINT32),
+    ('ResourceType', UINT32),
+    ('Action', UINT8),
+    ('Replacement', UINT8),
+    ('DetailEnd', UINT32),
+)
+# One row per Properties detail that can force recreation
+DETAIL_COLUMNS = (
+    ('Property', UINT32),
+    ('Recreation', UINT8),
+    ('ChangeSource', UINT8),
+    ('Evaluation', UINT8),
+)
+COLUMNS = ROW_COLUMNS + DETAIL_COLUMNS
+
+
+def _pad(length):
+    """ Bytes needed to align length """
+    return -length % ALIGN
+
+
+def _to_bytes(values):
+    """ Raw bytes of an array """
+    return values.tobytes() if hasattr(values, 'tobytes') else values.tostring()
+
+
+def _from_bytes(typecode, data):
+    """ Array of a column copied out of raw bytes """
+    values = array.array(typecode)
+    if hasattr(values, 'frombytes'):
+        values.frombytes(data)
+    else:  # Python 2
+        values.fromstring(data)  # pylint: disable=E1101
+    return values
+
+
+class Archive(object):
+    """ Read-only, memory-mapped columnar archive of resource changes
+
+    Columns are zero-copy views of the mapped file where the platform
+    allows it, so opening an archive costs the same for any size and the OS
+    pages in only the columns a query reads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._views = []
+        try:
+            with open(path, 'rb') as archive_file:
+                self._mmap = mmap.mmap(archive_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError) as err:
+            raise ArchiveError('Cannot open archive %s: %s' % (path, err))
+        try:
+            self._read_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self):
+        """ Parse the header and map every column """
+        prefix = len(MAGIC) + 4
+        if len(self._mmap) < prefix or self._mmap[:len(MAGIC)] != MAGIC:
+            raise ArchiveError('%s is not a change set archive' % self.path)
+        length = struct.unpack('<I', self._mmap[len(MAGIC):prefix])[0]
+        try:
+            header = json.loads(self._mmap[prefix:prefix + length].decode('utf-8'))
+        except ValueError as err:
+            raise ArchiveError('Corrupt archive header in %s: %s' % (self.path, err))
+        if not isinstance(header, dict):
+            raise ArchiveError('Corrupt archive header in %s' % self.path)
+        if header.get('Version') != VERSION:
+            raise ArchiveError('Unsupported archive version in %s: %s' % (
+                self.path, header.get('Version')))
+        data = prefix + length + _pad(prefix + length)
+        try:
+            native = header['ByteOrder'] == sys.byteorder
+            self.tables = header['Tables']
+            self.sources = header['Sources']
+            extents = []
+            for name, typecode in COLUMNS:
+                offset, count = header['Columns'][name]
+                extents.append((name, typecode, int(offset), int(count)))
+        except (KeyError, TypeError, ValueError) as err:
+            raise ArchiveError('Corrupt archive header in %s: missing or invalid %s' % (
+                self.path, err))
+        self.columns = {}
+        for name, typecode, offset, count in extents:
+            start = data + offset
+            end = start + count * array.array(typecode).itemsize
+            if end > len(self._mmap):
+                raise ArchiveError('Truncated archive %s' % self.path)
+            self.columns[name] = self._map(typecode, start, end, native)
+        self.rows = len(self.columns['Source'])
+
+    def _map(self, typecode, start, end, native):
+        """ Column view of the mapped file, or a copy where views are not possible """
+        if native and hasattr(memoryview, 'cast'):
+            base = memoryview(self._mmap)
+            window = base[start:end]
+            view = window.cast(typecode)
+            self._views.extend([view, window, base])
+            return view
+        values = _from_bytes(typecode, self._mmap[start:end])
+        if not native:
+            values.byteswap()
+        return values
+
+    def close(self):
+        """ Release the column views and unmap the file """
+        for view in self._views:
+            view.release()
+        self._views = []
+        self.columns = {}
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ArchiveBuilder(object):
+    """ Accumulate change sets as interned, integer-coded columns """
+
+    def __init__(self):
+        self.tables = dict((name, []) for name in TABLES)
+        self._index = dict((name, {}) for name in TABLES)
+        self.columns = collections.OrderedDict(
+            (name, array.array(typecode)) for name, typecode in COLUMNS)
+        self.sources = []
+        self.digests = set()
+
+    @classmethod
+    def from_archive(cls, archive):
+        """ Builder holding a copy of everything in an open Archive """
+        builder = cls()
+        for name in TABLES:
+            for value in archive.tables[name]:
+                builder._intern(name, value)
+        for name, typecode in COLUMNS:
+            builder.columns[name] = array.array(typecode, archive.columns[name])
+        builder.sources = [list(source) for source in archive.sources]
+        builder.digests = set(digest for _, digest in builder.sources)
+        return builder
+
+    def _intern(self, table, value):
+        """ Index of value in a string table, adding it if needed """
+        index = self._index[table].get(value)
+        if index is None:
+            index = len(self.tables[table])
+            self.tables[table].append(value)
+            self._index[table][value] = index
+        return index
+
+    def add_change_set(self, name, digest, changes):
+        """ Append the resource changes of one change set; returns the rows added """
+        source = len(self.sources)
+        columns = self.columns
+        rows = 0
+        for change in changes:
+            if change.get('Type') != 'Resource':
+                continue
+            resource_change = change['ResourceChange']
+            for detail in resource_change.get('Details', []):
+                target = detail['Target']
+                if target.get('Attribute') != 'Properties' or \
+                        target.get('RequiresRecreation') == 'Never':
+                    continue
+                columns['Property'].append(self._intern('Property', target['Name']))
+                columns['Recreation'].append(
+                    self._intern('Recreation', target.get('RequiresRecreation')))
+                columns['ChangeSource'].append(
+                    self._intern('ChangeSource', detail.get('ChangeSource')))
+                columns['Evaluation'].append(
+                    self._intern('Evaluation', detail.get('Evaluation')))
+            columns['Source'].append(source)
+            columns['LogicalId'].append(
+                self._intern('LogicalId', resource_change['LogicalResourceId']))
+            columns['ResourceType'].append(
+                self._intern('ResourceType', resource_change['ResourceType']))
+            columns['Action'].append(self._intern('Action', resource_change['Action']))
+            columns['Replacement'].append(
+                self._intern('Replacement', resource_change.get('Replacement')))
+            columns['DetailEnd'].append(len(columns['Property']))
+            rows += 1
+        self.sources.append([name, digest])
+        self.digests.add(digest)
+        return rows
+
+    def to_bytes(self):
+        """ Serialised archive """
+        for name, typecode in COLUMNS:
+            if typecode == UINT8 and len(self.tables[name]) > 256:
+                raise ArchiveError('Too many distinct %s values for an archive' % name)
+        layout = {}
+        chunks = []
+        offset = 0
+        for name, values in self.columns.items():
+            data = _to_bytes(values)
+            layout[name] = [offset, len(values)]
+            chunks.extend([data, b'\0' * _pad(len(data))])
+            offset += len(data) + _pad(len(data))
+        header = json.dumps({
+            'Version': VERSION,
+            'ByteOrder': sys.byteorder,
+            'Tables': self.tables,
+            'Sources': self.sources,
+            'Columns': layout,
+        }).encode('utf-8')
+        prefix = MAGIC + struct.pack('<I', len(header)) + header
+        return b''.join([prefix, b'\0' * _pad(len(prefix))] + chunks)
+
+
+def import_files(archive_path, filenames):
+    """ Add change set files to an archive, creating it if needed
+
+    Files already imported (by content) are skipped, and a file that cannot
+    be parsed is reported without adding any of its changes. The archive is
+    rewritten atomically. Returns (imported, skipped, failed) file counts.
+    """
+    if os.path.exists(archive_path):
+        with Archive(archive_path) as archive:
+            builder = ArchiveBuilder.from_archive(archive)
+    else:
+        builder = ArchiveBuilder()
+    imported = skipped = failed = 0
+    for filename in filenames:
+        try:
+            if filename == '-':
+                raise ArchiveError('Cannot import change sets from standard input')
+            digest = cfnsafeset.watch.file_digest(filename)
+            if digest in builder.digests:
+                LOGGER.info('Already archived: %s', filename)
+                skipped += 1
+                continue
+            changes = list(cfnsafeset.core.load_cs_file(filename))
+        except (IOError, OSError) as err:
+            LOGGER.error('Cannot read %s: %s', filename, err)
+            failed += 1
+            continue
+        except CfnSafesetError as err:
+            LOGGER.error(err)
+            failed += 1
+            continue
+        rows = builder.add_change_set(filename, digest, changes)
+        LOGGER.info('Archived %d resource changes from %s', rows, filename)
+        imported += 1
+    if imported:
+        if os.path.exists(archive_path):
+            mode = os.stat(archive_path).st_mode & 0o777
+        else:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        cfnsafeset.cache.atomic_write(archive_path, builder.to_bytes())
+        # atomic_write creates private files; archives are shared like any output
+        os.chmod(archive_path, mode)
+    return imported, skipped, failed
+
+
+class TypeStats(object):
+    """ Stateful Removes and Replaces of one resource type in an archive """
+    __slots__ = ('removed', 'replaced', 'change_sets', 'properties')
+
+    def __init__(self):
+        self.removed = 0
+        self.replaced = 0
+        self.change_sets = set()
+        self.properties = collections.Counter()
+
+
+def query(archive, classifier, type_pattern=None):
+    """ Reapply the stateful classification to every archived change
+
+    Returns an OrderedDict of resource type -> TypeStats. Classification is
+    decided once per interned resource type, so rows are only compared as
+    integers; rows of types with a replacement policy are rebuilt and run
+    through replace_finding.
+    """
+    if 'Resource' not in classifier.extractors:
+        return collections.OrderedDict()
+    tables = archive.tables
+    policies = getattr(classifier, 'policies', None)
+    types = tables['ResourceType']
+    selected = [
+        resource_type in classifier and (
+            type_pattern is None or fnmatch.fnmatchcase(resource_type, type_pattern))
+        for resource_type in types]
+    with_policy = [bool(policies and policies.get(resource_type)) for resource_type in types]
+    remove = tables['Action'].index('Remove') if 'Remove' in tables['Action'] else -1
+    replace = tables['Replacement'].index('True') if 'True' in tables['Replacement'] else -1
+
+    columns = archive.columns
+    properties = columns['Property']
+    detail_ends = columns['DetailEnd']
+    stats = {}
+    for row, (type_code, action, replacement) in enumerate(zip(
+            columns['ResourceType'], columns['Action'], columns['Replacement'])):
+        if not selected[type_code] or (action != remove and replacement != replace):
+            continue
+        start = detail_ends[row - 1] if row else 0
+        if with_policy[type_code]:
+            finding = cfnsafeset.core.replace_finding(
+                _resource_change(archive, row, start), policies)
+            if finding is None:
+                continue
+            action_name, names = finding.action, finding.properties
+        elif action == remove:
+            action_name, names = 'Remove', ()
+        else:
+            action_name = 'Replace'
+            names = set(tables['Property'][code]
+                        for code in properties[start:detail_ends[row]])
+        entry = stats.get(type_code)
+        if entry is None:
+            entry = stats[type_code] = TypeStats()
+        if action_name == 'Remove':
+            entry.removed += 1
+        else:
+            entry.replaced += 1
+            entry.properties.update(names)
+        entry.change_sets.add(columns['Source'][row])
+    return collections.OrderedDict(
+        (types[code], stats[code]) for code in sorted(stats, key=lambda code: types[code]))
+
+
+def _resource_change(archive, row, start):
+    """ ResourceChange rebuilt from one archived row """
+    tables = archive.tables
+    columns = archive.columns
+    details = []
+    for index in range(start, columns['DetailEnd'][row]):
+        details.append({
+            'Target': {
+                'Attribute': 'Properties',
+                'Name': tables['Property'][columns['Property'][index]],
+                'RequiresRecreation': tables['Recreation'][columns['Recreation'][index]],
+            },
+            'ChangeSource': tables['ChangeSource'][columns['ChangeSource'][index]],
+            'Evaluation': tables['Evaluation'][columns['Evaluation'][index]],
+        })
+    return {
+        'LogicalResourceId': tables['LogicalId'][columns['LogicalId'][row]],
+        'ResourceType': tables['ResourceType'][columns['ResourceType'][row]],
+        'Action': tables['Action'][columns['Action'][row]],
+        'Replacement': tables['Replacement'][columns['Replacement'][row]],
+        'Details': details,
+    }
+
+
+def report_query(archive, stats):
+    """ Print query results per resource type """
+    print('Stateful changes in %d change sets (%d resource changes):' % (
+        len(archive.sources), archive.rows))
+    for resource_type, entry in stats.items():
+        print('  %s: %d replaced, %d removed, in %d change sets' % (
+            resource_type, entry.replaced, entry.removed, len(entry.change_sets)))
+        for name, count in sorted(entry.properties.items(), key=lambda item: (-item[1], item[0])):
+            print('    %-30s %d' % (name, count))
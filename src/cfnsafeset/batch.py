@@ -0,0 +1,117 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import logging
+import yaml
+import cfnsafeset.core
+import cfnsafeset.credentials
+from cfnsafeset.clients import ClientPool
+from cfnsafeset.exceptions import CfnSafesetError
+
+LOGGER = logging.getLogger('cfnsafeset')
+
+
+def load_manifest(filename, default_region, default_profile, default_role=None):
+    """ Read the list of change sets to check from a YAML or JSON manifest
+
+    The manifest is either a list of entries or a mapping with a ChangeSets
+    list. Each entry needs ChangeSet and Stack; Region, Profile and Role (an
+    IAM role ARN to assume) fall back to the command line values.
+    """
+    try:
+        with open(filename) as manifest_file:
+            manifest = yaml.safe_load(manifest_file)
+    except IOError as err:
+        raise ValueError('Cannot read batch manifest %s: %s' % (filename, err))
+    if isinstance(manifest, dict):
+        manifest = manifest.get('ChangeSets')
+    if not isinstance(manifest, list):
+        raise ValueError('Batch manifest %s must contain a list of change sets' % filename)
+
+    entries = []
+    for index, entry in enumerate(manifest):
+        if not isinstance(entry, dict) or not entry.get('ChangeSet') or not entry.get('Stack'):
+            raise ValueError('Batch manifest entry %d needs ChangeSet and Stack' % index)
+        if entry.get('Role') and not cfnsafeset.credentials.ROLE_ARN.match(entry['Role']):
+            raise ValueError('Batch manifest entry %d has an invalid Role ARN: %s' % (
+                index, entry['Role']))
+        entries.append({
+            'ChangeSet': entry['ChangeSet'],
+            'Stack': entry['Stack'],
+            'Region': entry.get('Region', default_region),
+            'Profile': entry.get('Profile', default_profile),
+            'Role': entry.get('Role', default_role),
+        })
+    return entries
+
+
+def check_change_set(entry, clients, monitored_change_types, stateful_resources,
+                     wait_timeout=None, fail_fast=False):
+    """ Fetch and scan one manifest entry, returning its exit code """
+    try:
+        changes = cfnsafeset.core.get_change_set(
+            entry['ChangeSet'], entry['Stack'], entry['Region'], entry['Profile'],
+            cf_client=clients.get(entry['Region'], entry['Profile'], entry.get('Role')),
+            wait_timeout=wait_timeout)
+        if cfnsafeset.core.detect_stateful_replace(
+                changes, monitored_change_types, stateful_resources, fail_fast):
+            return 2
+        return 0
+    except CfnSafesetError as err:
+        LOGGER.error(err)
+        return 1
+    except Exception as err:  # pylint: disable=W0703
+        LOGGER.error('Unexpected error checking change set %s for stack %s: %s',
+                     entry['ChangeSet'], entry['Stack'], err)
+        return 1
+
+
+def run_batch(entries, monitored_change_types, stateful_resources, jobs, clients=None,
+              wait_timeout=None, fail_fast=False):
+    """ Check many change sets concurrently and return the combined exit code
+
+    2 if any change set touches a stateful resource, otherwise 1 if any
+    change set could not be checked, otherwise 0. With fail_fast, the first
+    stateful change set stops the batch and unchecked entries are reported
+    as skipped.
+    """
+    from multiprocessing.pool import ThreadPool  # pylint: disable=C0415
+    if clients is None:
+        clients = ClientPool()
+    pool = ThreadPool(max(1, min(jobs, len(entries) or 1)))
+    results = [None] * len(entries)
+    try:
+        for index, result in pool.imap_unordered(
+                lambda item: (item[0], check_change_set(
+                    item[1], clients, monitored_change_types, stateful_resources,
+                    wait_timeout, fail_fast)),
+                enumerate(entries)):
+            results[index] = result
+            if fail_fast and result == 2:
+                break
+    finally:
+        pool.terminate()
+
+    labels = {None: 'SKIPPED', 0: 'OK', 1: 'ERROR', 2: 'STATEFUL'}
+    print('Batch results:')
+    for entry, result in zip(entries, results):
+        where = 'region %s' % entry['Region']
+        if entry.get('Role'):
+            where += ', account %s' % cfnsafeset.credentials.account_id(entry['Role'])
+        print(' %-8s %s (stack %s, %s)' % (
+            labels.get(result, result), entry['ChangeSet'], entry['Stack'], where))
+    return max([result for result in results if result is not None] or [0])
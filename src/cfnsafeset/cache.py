@@ -0,0 +1,88 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import hashlib
+import logging
+import marshal
+import os
+import sys
+import tempfile
+
+LOGGER = logging.getLogger('cfnsafeset')
+CONFIG_CACHE_VERSION = 1
+
+
+def get_cache_dir():
+    """ Directory for cfn-safeset caches, following XDG_CACHE_HOME """
+    cache_dir = os.environ.get('CFN_SAFESET_CACHE_DIR')
+    if not cache_dir:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.join(
+            os.path.expanduser('~'), '.cache')
+        cache_dir = os.path.join(base, 'cfn-safeset')
+    return cache_dir
+
+
+def atomic_write(path, data, mode=None):
+    """ Write bytes to path so readers never see a partial file
+
+    The file is created with mode 0600 unless another mode is given.
+    """
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as temp_file:
+            temp_file.write(data)
+        if mode is not None:
+            os.chmod(temp_path, mode)
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def _config_cache_path(filename):
+    """ Cache file for a config file, specific to this Python version """
+    key = hashlib.sha1(os.path.abspath(filename).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(get_cache_dir(), 'config-%s-py%d%d.marshal' % (
+        key, sys.version_info[0], sys.version_info[1]))
+
+
+def load_config(filename, mtime, digest):
+    """ Return the cached parsed config, or None if missing or stale """
+    path = _config_cache_path(filename)
+    try:
+        with open(path, 'rb') as cache_file:
+            version, cached_name, cached_mtime, cached_digest, cfg = marshal.load(cache_file)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if (version, cached_name, cached_mtime, cached_digest) != (
+            CONFIG_CACHE_VERSION, os.path.abspath(filename), mtime, digest):
+        LOGGER.debug('Config cache %s is stale', path)
+        return None
+    LOGGER.debug('Loaded config from cache: %s', path)
+    return cfg
+
+
+def store_config(filename, mtime, digest, cfg):
+    """ Cache a parsed config; failures only cost the next run a YAML parse """
+    path = _config_cache_path(filename)
+    try:
+        atomic_write(path, marshal.dumps((
+            CONFIG_CACHE_VERSION, os.path.abspath(filename), mtime, digest, cfg)))
+    except (IOError, OSError, ValueError) as err:
+        LOGGER.debug('Could not write config cache %s: %s', path, err)
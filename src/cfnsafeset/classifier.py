@@ -0,0 +1,252 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import logging
+from operator import itemgetter
+from cfnsafeset.exceptions import ConfigError
+
+LOGGER = logging.getLogger('cfnsafeset')
+WILDCARD = '*'
+SEPARATOR = '::'
+CHANGE_SOURCES = frozenset([
+    'ResourceReference', 'ParameterReference', 'ResourceAttribute',
+    'DirectModification', 'Automatic',
+])
+EVALUATIONS = frozenset(['Static', 'Dynamic'])
+RULE_KEYS = frozenset(['Properties', 'ChangeSource', 'Evaluation'])
+
+
+def compile_change_types(change_types):
+    """ Map each monitored change type to a function returning its resource change
+
+    Values that are already callable are kept, so compiling twice is harmless.
+    """
+    return dict(
+        (change_type, key if callable(key) else itemgetter(key))
+        for change_type, key in change_types.items()
+    )
+
+
+def _compile_set(rule, key, allowed=None):
+    """ frozenset of a rule condition, or None when the rule leaves it open """
+    values = rule.get(key)
+    if values is None:
+        return None
+    if not isinstance(values, list):
+        values = [values]
+    values = frozenset(values)
+    if allowed is not None and not values <= allowed:
+        raise ConfigError('Unknown %s in policy rule: %s' % (
+            key, ', '.join(sorted(values - allowed))))
+    return values
+
+
+def compile_rule(rule):
+    """ (properties, change sources, evaluations) for one Allow or Deny rule
+
+    A plain list of property names is shorthand for {'Properties': [...]}.
+    Each part is a frozenset, or None to match anything.
+    """
+    if isinstance(rule, list):
+        rule = {'Properties': rule}
+    if not isinstance(rule, dict) or not set(rule) <= RULE_KEYS:
+        raise ConfigError('Policy rules must be a list of properties or a mapping '
+                          'of %s: %r' % (', '.join(sorted(RULE_KEYS)), rule))
+    return (_compile_set(rule, 'Properties'),
+            _compile_set(rule, 'ChangeSource', CHANGE_SOURCES),
+            _compile_set(rule, 'Evaluation', EVALUATIONS))
+
+
+def _matches(rule, name, source, evaluation):
+    """ Boolean check if a compiled rule covers one detail """
+    properties, sources, evaluations = rule
+    return ((properties is None or name in properties)
+            and (sources is None or source in sources)
+            and (evaluations is None or evaluation in evaluations))
+
+
+class TypePolicy(object):
+    """ Compiled Allow and Deny rules for one resource type
+
+    Rules without ChangeSource or Evaluation conditions are folded into the
+    allow_always and deny_always frozensets, so a change is usually judged
+    with two set operations; only conditional rules are checked per detail.
+    Deny wins over Allow.
+    """
+    __slots__ = ('allow_always', 'deny_always', 'allow_rules', 'deny_rules', 'deny_all')
+
+    def __init__(self, allow=(), deny=()):
+        allow = [compile_rule(rule) for rule in allow]
+        deny = [compile_rule(rule) for rule in deny]
+        self.deny_all = any(rule == (None, None, None) for rule in deny)
+        self.allow_always = frozenset().union(*[
+            rule[0] for rule in allow if rule[0] is not None and rule[1:] == (None, None)])
+        self.deny_always = frozenset().union(*[
+            rule[0] for rule in deny if rule[0] is not None and rule[1:] == (None, None)])
+        self.allow_rules = tuple(
+            rule for rule in allow if rule[0] is None or rule[1:] != (None, None))
+        self.deny_rules = tuple(
+            rule for rule in deny if rule[0] is None or rule[1:] != (None, None))
+
+    def unapproved(self, details):
+        """ Names of the recreating properties in details that no rule approves """
+        triggers = [
+            (detail['Target']['Name'], detail.get('ChangeSource'), detail.get('Evaluation'))
+            for detail in details
+            if detail['Target'].get('Attribute') == 'Properties'
+            and detail['Target'].get('RequiresRecreation') != 'Never']
+        names = frozenset(trigger[0] for trigger in triggers)
+        if self.deny_all:
+            return names
+        if not self.allow_rules and not self.deny_rules:
+            return (names - self.allow_always) | (names & self.deny_always)
+        unapproved = set(names & self.deny_always)
+        for name, source, evaluation in triggers:
+            if name in unapproved:
+                continue
+            if any(_matches(rule, name, source, evaluation) for rule in self.deny_rules):
+                unapproved.add(name)
+            elif name not in self.allow_always and not any(
+                    _matches(rule, name, source, evaluation) for rule in self.allow_rules):
+                unapproved.add(name)
+        return unapproved
+
+
+class Policies(object):
+    """ Compiled Policies config: TypePolicy per exact type or namespace
+
+    Lookups prefer the exact type, then the longest matching namespace, and
+    are memoised per type.
+    """
+    __slots__ = ('exact', 'namespaces', '_lookups')
+
+    def __init__(self, policies):
+        self.exact = {}
+        self.namespaces = {}
+        self._lookups = {}
+        for pattern, policy in sorted((policies or {}).items()):
+            if not isinstance(policy, dict) or not set(policy) <= set(['Allow', 'Deny']):
+                raise ConfigError('Policy for %s must be a mapping of Allow and Deny' % pattern)
+            compiled = TypePolicy(policy.get('Allow') or (), policy.get('Deny') or ())
+            if WILDCARD not in pattern:
+                self.exact[pattern] = compiled
+            elif pattern == WILDCARD or pattern.endswith(SEPARATOR + WILDCARD):
+                self.namespaces[pattern[:-len(WILDCARD)]] = compiled
+            else:
+                raise ConfigError(
+                    'Unsupported policy pattern %s: wildcards are only allowed as '
+                    'a whole namespace level (AWS::EC2::*)' % pattern)
+
+    def get(self, resource_type):
+        """ TypePolicy for a resource type, or None """
+        try:
+            return self._lookups[resource_type]
+        except KeyError:
+            pass
+        policy = self.exact.get(resource_type)
+        if policy is None and self.namespaces:
+            end = resource_type.rfind(SEPARATOR)
+            while policy is None and end != -1:
+                policy = self.namespaces.get(resource_type[:end + len(SEPARATOR)])
+                end = resource_type.rfind(SEPARATOR, 0, end)
+            if policy is None:
+                policy = self.namespaces.get('')
+        self._lookups[resource_type] = policy
+        return policy
+
+    def __len__(self):
+        return len(self.exact) + len(self.namespaces)
+
+
+class Classifier(object):
+    """ Compiled form of the ChangeTypes and StatefulResources config
+
+    StatefulResources entries are either exact resource types or namespace
+    patterns such as AWS::RDS::*. Exact types go into a set and namespaces
+    into a prefix index, so a lookup costs one probe per namespace level no
+    matter how many patterns are configured. Verdicts are memoised per type.
+    Property-level Policies, if any, are compiled alongside.
+    """
+    __slots__ = ('extractors', 'exact', 'namespaces', 'patterns', 'policies', '_verdicts')
+
+    def __init__(self, change_types, stateful_resources, policies=None):
+        self.extractors = compile_change_types(change_types)
+        self.policies = Policies(policies) if policies else None
+        self.exact = set()
+        self.namespaces = set()
+        self.patterns = sorted(set(stateful_resources))
+        self._verdicts = {}
+        for pattern in self.patterns:
+            if WILDCARD not in pattern:
+                self.exact.add(pattern)
+            elif pattern == WILDCARD or pattern.endswith(SEPARATOR + WILDCARD):
+                # Keep the trailing separator so AWS::RDS::* does not match AWS::RDSX
+                self.namespaces.add(pattern[:-len(WILDCARD)])
+            else:
+                raise ConfigError(
+                    'Unsupported stateful resource pattern %s: wildcards are '
+                    'only allowed as a whole namespace level (AWS::RDS::*)' % pattern)
+
+    def is_stateful_type(self, resource_type):
+        """ Boolean check if a resource type is configured as stateful """
+        verdict = self._verdicts.get(resource_type)
+        if verdict is None:
+            verdict = resource_type in self.exact or self._in_namespace(resource_type)
+            self._verdicts[resource_type] = verdict
+        return verdict
+
+    def _in_namespace(self, resource_type):
+        """ Check every namespace prefix of a resource type against the index """
+        if not self.namespaces:
+            return False
+        if '' in self.namespaces:
+            return True
+        end = resource_type.find(SEPARATOR)
+        while end != -1:
+            end += len(SEPARATOR)
+            if resource_type[:end] in self.namespaces:
+                return True
+            end = resource_type.find(SEPARATOR, end)
+        return False
+
+    def __contains__(self, resource_type):
+        return self.is_stateful_type(resource_type)
+
+    def __iter__(self):
+        return iter(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+
+def compile_config(config):
+    """ Build a Classifier from a loaded stateful-resources config """
+    return Classifier(config['ChangeTypes'], config['StatefulResources'],
+                      config.get('Policies'))
+
+
+def merge_policies(config, policy_config):
+    """ Config with the Policies of a policy file layered over its own
+
+    A type in the policy file replaces that type's rules from the config.
+    """
+    if not isinstance(policy_config, dict) or not isinstance(
+            policy_config.get('Policies', {}), dict):
+        raise ConfigError('Policy file must be a mapping with a Policies mapping')
+    merged = dict(config)
+    merged['Policies'] = dict(config.get('Policies') or {})
+    merged['Policies'].update(policy_config.get('Policies') or {})
+    return merged
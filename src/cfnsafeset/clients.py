@@ -0,0 +1,104 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import logging
+import threading
+import cfnsafeset.credentials
+import cfnsafeset.throttle
+from cfnsafeset.exceptions import CredentialsError
+
+LOGGER = logging.getLogger('cfnsafeset')
+
+
+class ClientPool(object):
+    """ Share one CloudFormation client per region and profile
+
+    boto3 clients are thread safe once created, but sessions are not, so
+    creation is serialised and every caller for the same region and profile
+    gets the same client back. With a role, the client uses temporary
+    credentials from a CredentialCache and is replaced once they are renewed.
+    """
+
+    def __init__(self, endpoint_url=None, credentials=None):
+        self.endpoint_url = endpoint_url
+        self.credentials = credentials or cfnsafeset.credentials.CredentialCache()
+        self._lock = threading.Lock()
+        self._sessions = {}
+        self._role_sessions = {}
+        self._clients = {}
+
+    def _session(self, profile):
+        """ Return the cached session for a profile (None is the default chain)
+
+        Raises CredentialsError if the profile cannot be loaded.
+        """
+        if profile not in self._sessions:
+            from boto3 import Session  # pylint: disable=C0415
+            from botocore.exceptions import BotoCoreError  # pylint: disable=C0415
+            try:
+                if profile:
+                    self._sessions[profile] = Session(profile_name=profile)
+                else:
+                    self._sessions[profile] = Session()
+            except BotoCoreError as err:
+                raise CredentialsError('Cannot load profile %s: %s' % (profile, err))
+        return self._sessions[profile]
+
+    def _role_session(self, credentials):
+        """ Return the session for a set of temporary role credentials """
+        key = (credentials['Profile'], credentials['RoleArn'])
+        cached = self._role_sessions.get(key)
+        if cached is None or cached[0] is not credentials:
+            from boto3 import Session  # pylint: disable=C0415
+            cached = (credentials, Session(
+                aws_access_key_id=credentials['AccessKeyId'],
+                aws_secret_access_key=credentials['SecretAccessKey'],
+                aws_session_token=credentials['SessionToken']))
+            self._role_sessions[key] = cached
+        return cached[1]
+
+    def _role_credentials(self, region, profile, role):
+        """ Credentials for a role, assumed outside the pool lock """
+        def sts_client():
+            """ STS client of the source profile """
+            with self._lock:
+                return self._session(profile).client(
+                    'sts', region_name=region,
+                    config=cfnsafeset.throttle.client_config())
+        return self.credentials.get(role, profile, sts_client)
+
+    def get(self, region, profile=None, role=None):
+        """ Return the CloudFormation client for a region, profile and optional role
+
+        Raises CredentialsError if the profile cannot be loaded or the role
+        cannot be assumed.
+        """
+        credentials = self._role_credentials(region, profile, role) if role else None
+        key = (region, profile, role)
+        with self._lock:
+            cached = self._clients.get(key)
+            if cached is None or cached[1] is not credentials:
+                LOGGER.debug('Creating CloudFormation client for region %s, '
+                             'profile %s and role %s', region, profile, role)
+                if credentials is None:
+                    session = self._session(profile)
+                else:
+                    session = self._role_session(credentials)
+                # Each account has its own API limits, so roles get their own bucket
+                cached = (cfnsafeset.throttle.create_client(
+                    session, region, role or profile, self.endpoint_url), credentials)
+                self._clients[key] = cached
+            return cached[0]
@@ -20,13 +20,32 @@ import argparse
 import sys
 import os
 import json
-import pkg_resources
-from boto3 import client, Session
-from botocore.exceptions import ClientError
+import threading
+import time
+import random
+import hashlib
 import yaml
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+import cfnsafeset.cache
+import cfnsafeset.metrics
+import cfnsafeset.throttle
+from cfnsafeset.classifier import compile_change_types, merge_policies
+from cfnsafeset.exceptions import (
+    ChangeSetFileError, ChangeSetNotFoundError, ChangeSetRetrievalError, ConfigError)
+from cfnsafeset.metrics import METRICS
 from cfnsafeset.version import __version__
 
 LOGGER = logging.getLogger('cfnsafeset')
+CONFIG_FILE = '/data/stateful-resources.yaml'
+PENDING_STATUSES = ('CREATE_PENDING', 'CREATE_IN_PROGRESS')
+DEFAULT_JOBS = 8
+# StatusReason of a change set that failed only because nothing changed
+NO_CHANGES_REASON = "didn't contain changes"
+# Prefer the libyaml loader when PyYAML was built with it
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 
 def init_logger(use_info, use_debug):
@@ -50,19 +69,38 @@ def init_logger(use_info, use_debug):
     LOGGER.addHandler(handler)
 
 
-def init_config(config_file):
-    """ Load resource data """
+def init_config(config_file, use_cache=True):
+    """ Load resource data, reusing the cached parse when the file is unchanged """
     LOGGER.debug('Loading config from file: %s', config_file)
-    filename = pkg_resources.resource_filename(
-        __name__,
-        config_file
+    filename = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)),
+        config_file.lstrip('/')
     )
 
-    with open(filename) as ymlfile:
-        cfg = yaml.safe_load(ymlfile)
+    with open(filename, 'rb') as ymlfile:
+        mtime = os.fstat(ymlfile.fileno()).st_mtime
+        contents = ymlfile.read()
+    digest = hashlib.sha1(contents).hexdigest()
+    if use_cache:
+        cfg = cfnsafeset.cache.load_config(filename, mtime, digest)
+        if cfg is not None:
+            return cfg
+    cfg = yaml.load(contents, Loader=YAML_LOADER)
+    if use_cache:
+        cfnsafeset.cache.store_config(filename, mtime, digest, cfg)
     return cfg
 
 
+def load_policy(config, policy_file):
+    """ Layer the Policies from a policy file over a loaded config """
+    try:
+        with open(policy_file, 'rb') as policy_stream:
+            policy_config = yaml.load(policy_stream, Loader=YAML_LOADER)
+    except (IOError, yaml.YAMLError) as err:
+        raise ConfigError('Cannot load policy file %s: %s' % (policy_file, err))
+    return merge_policies(config, policy_config)
+
+
 def create_parser():
     """ Set up command line arguments """
     parser = argparse.ArgumentParser(
@@ -78,26 +116,142 @@ def create_parser():
         '-s', '--stack', metavar='STACKNAME',
         help='The stack name associated with this change set')
     standard.add_argument(
-        '-f', '--file', metavar='FILENAME',
-        help='File containing a valid CloudFormation change set')
+        '-f', '--file', metavar='FILENAME', nargs='+',
+        help='Files or globs of valid CloudFormation change sets (- for stdin)')
+    standard.add_argument(
+        '-b', '--batch', metavar='MANIFEST',
+        help='YAML or JSON manifest listing many change sets to check')
+    standard.add_argument(
+        '--predict', metavar=('DEPLOYED', 'PROPOSED'), nargs=2,
+        help='Predict replacements from the deployed and proposed templates '
+        'without creating a change set')
+    standard.add_argument(
+        '--watch', metavar='DIR',
+        help='Keep scanning new or changed change set files in a directory')
+    standard.add_argument(
+        '--archive-import', metavar='ARCHIVE',
+        help='Add the -f change set files to a columnar archive')
+    standard.add_argument(
+        '--archive-query', metavar='ARCHIVE',
+        help='Count stateful Removes and Replaces in an archive per resource type')
+    standard.add_argument(
+        '--sweep', action='store_true',
+        help='Scan every pending change set in the account (see --regions)')
+    standard.add_argument(
+        '--regions', metavar='REGION', nargs='+',
+        help='Regions to sweep (defaults to --region)')
     standard.add_argument(
         '-r', '--region', metavar='REGION', default='us-east-1',
         help='The region where this change set exists')
     standard.add_argument(
         '-p', '--profile', metavar='PROFILE',
         help='The profile to use for authentication')
+    standard.add_argument(
+        '--role', metavar='ARN', action='append',
+        help='IAM role to assume with the profile; repeat to --sweep several accounts')
+    standard.add_argument(
+        '--roles', metavar='FILE',
+        help='File of IAM role ARNs to assume, one per line')
     standard.add_argument(
         '-v', '--version', help='Version of cfn-safeset', action='version',
         version='%(prog)s {version}'.format(version=__version__))
+    advanced.add_argument(
+        '-j', '--jobs', metavar='JOBS', type=int,
+        help='Number of change sets to retrieve concurrently in batch, nested and sweep mode '
+        '(default %d), or of processes scanning files (default one per CPU)' % DEFAULT_JOBS)
+    advanced.add_argument(
+        '--endpoint-url', metavar='URL',
+        help='Send CloudFormation API calls to this endpoint, e.g. a local stand-in')
+    advanced.add_argument(
+        '--policy', metavar='FILE',
+        help='YAML file of per-type Allow/Deny property rules for replacements')
+    advanced.add_argument(
+        '--fail-fast', action='store_true',
+        help='Stop fetching and scanning at the first stateful Remove or Replace')
+    advanced.add_argument(
+        '--role-session-name', metavar='NAME', default='cfn-safeset',
+        help='Session name used when assuming roles')
+    advanced.add_argument(
+        '--role-duration', metavar='SECONDS', type=int, default=3600,
+        help='Lifetime requested for assumed role credentials')
+    advanced.add_argument(
+        '--wait', help='Wait for a pending change set to be created before checking it',
+        action='store_true')
+    advanced.add_argument(
+        '--wait-timeout', metavar='SECONDS', type=int, default=600,
+        help='Give up waiting after this many seconds')
+    advanced.add_argument(
+        '--replacement-index', metavar='FILE',
+        help='Replacement index used by --predict')
+    advanced.add_argument(
+        '--build-replacement-index', metavar='SPEC',
+        help='Print a replacement index built from a CloudFormation resource '
+        'specification file')
+    advanced.add_argument(
+        '--watch-report', metavar='FILE',
+        help='Append a JSON line per file scanned by --watch (default stdout)')
+    advanced.add_argument(
+        '--poll', action='store_true',
+        help='Poll the --watch directory instead of using inotify, e.g. on NFS')
+    advanced.add_argument(
+        '--poll-interval', metavar='SECONDS', type=float, default=2.0,
+        help='Seconds between polls of the --watch directory')
+    advanced.add_argument(
+        '--metrics', metavar='TARGET', type=metrics_target,
+        help='Export phase timings and counters to prometheus:PATH (textfile), '
+        'statsd:HOST:PORT or json:HOST:PORT (JSON lines over UDP)')
+    advanced.add_argument(
+        '--resource-type', metavar='PATTERN',
+        help='Only query these resource types, e.g. AWS::RDS::*')
+    advanced.add_argument(
+        '--root-cause', action='store_true',
+        help='Trace each stateful Remove or Replace back to the parameter, template '
+             'edit or other resource change behind it')
+    advanced.add_argument(
+        '--nested', help='Also scan the change sets of nested stacks',
+        action='store_true')
     advanced.add_argument(
         '-i', '--info', help='Enable info logging', action='store_true')
     advanced.add_argument(
         '-d', '--debug', help='Enable debug logging', action='store_true')
+    advanced.add_argument(
+        '--cache', help='Cache retrieved change sets and verdicts by ChangeSetId',
+        action='store_true')
+    advanced.add_argument(
+        '--incremental', action='store_true',
+        help='Re-check only the changes that differ from the last change set of the '
+             'stack and report what changed since its verdict')
+    advanced.add_argument(
+        '--cache-max-age', metavar='SECONDS', type=int, default=7 * 24 * 3600,
+        help='Evict cached change sets older than this')
+    advanced.add_argument(
+        '--cache-max-entries', metavar='COUNT', type=int, default=1000,
+        help='Keep at most this many cached change sets')
+    advanced.add_argument(
+        '--serve', help='Run as a daemon serving checks on a local socket',
+        action='store_true')
+    advanced.add_argument(
+        '--use-daemon', help='Send the check to a running daemon, '
+        'falling back to checking in-process', action='store_true')
+    advanced.add_argument(
+        '--daemon-socket', metavar='PATH',
+        help='Socket used by --serve and --use-daemon')
+    advanced.add_argument(
+        '--no-config-cache', help='Always parse the config instead of using the cache',
+        action='store_true')
     advanced.add_argument(
         '-l', '--list', help='List resources considered stateful', action='store_true')
     return parser
 
 
+def metrics_target(value):
+    """ argparse type for --metrics """
+    try:
+        return cfnsafeset.metrics.parse_target(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
 def get_args():
     """ Do first round of parsing parameters to set options """
     parser = create_parser()
@@ -106,67 +260,370 @@ def get_args():
         return args
 
     init_logger(args.info, args.debug)
-
-    if (not args.changeset and not args.stack) and not args.file:
-        LOGGER.error('%s: You must specify a valid change set and stack name (-c/-s) '
-                     'or file location (-f)',
+    # Only --wait turns waiting on; None keeps the single describe call
+    args.wait_timeout = args.wait_timeout if args.wait else None
+    if args.incremental and args.cache:
+        parser.error('--incremental and --cache cannot be combined')
+    if args.root_cause and (
+            args.nested or args.cache or args.incremental or args.batch or args.sweep
+            or args.watch or args.serve or args.archive_query
+            or (args.file and len(args.file) > 1)):
+        parser.error('--root-cause only applies to a single change set '
+                     '(-c/-s, one -f file or --predict)')
+
+    if args.serve or args.build_replacement_index:
+        return args
+    if (not args.changeset and not args.stack) and not (
+            args.file or args.batch or args.sweep or args.predict or args.watch
+            or args.archive_query):
+        LOGGER.error('%s: You must specify a valid change set and stack name (-c/-s), '
+                     'file location (-f), batch manifest (-b), --predict, --watch, '
+                     '--archive-query or --sweep',
                      os.path.basename(sys.argv[0]))
         sys.exit(1)
     return args
 
 
-def get_change_set(change_set, stack, region, profile):
-    """ Retrieve change set data via API """
-    LOGGER.debug('Retrieving change set %s for stack %s in region %s',
-                 change_set, stack, region)
+def get_client(region, profile, endpoint_url=None):
+    """ Create a CloudFormation client for a region and optional profile
+
+    Raises ChangeSetRetrievalError if the profile cannot be loaded or the
+    client cannot be created.
+    """
+    # boto3 is imported here so file-only runs never pay for it
+    from boto3 import Session  # pylint: disable=C0415
+    from botocore.exceptions import BotoCoreError  # pylint: disable=C0415
     try:
         if profile:
             session = Session(profile_name=profile)
-            cf_client = session.client(
-                'cloudformation', region_name=region)
         else:
-            cf_client = client('cloudformation', region_name=region)
-
-        response = cf_client.describe_change_set(
-            ChangeSetName=change_set,
-            StackName=stack
-        )
-        LOGGER.debug(response['Changes'])
-        return response['Changes']
-
-    except cf_client.exceptions.ChangeSetNotFoundException:
-        LOGGER.error('Change set %s not found for stack %s in region %s',
-                     change_set, stack, region)
-        sys.exit(1)
+            session = Session()
+        return cfnsafeset.throttle.create_client(session, region, profile, endpoint_url)
+    except BotoCoreError as err:
+        raise ChangeSetRetrievalError(
+            'Cannot create a CloudFormation client for region %s: %s' % (region, err))
+
+
+def iter_change_set_pages(cf_client, change_set, stack, wait_timeout=None):
+    """ Yield each describe_change_set response, following NextToken
+
+    With wait_timeout, first wait for the change set to finish being created;
+    the response that shows it ready is reused as the first page.
+    """
+    kwargs = {'ChangeSetName': change_set}
+    if stack:
+        # Optional when change_set is an ARN, as for nested stacks
+        kwargs['StackName'] = stack
+    if wait_timeout is not None:
+        response = wait_for_change_set(cf_client, kwargs, wait_timeout)
+    else:
+        with METRICS.phase('describe_change_set'):
+            response = cf_client.describe_change_set(**kwargs)
+    while True:
+        yield response
+        next_token = response.get('NextToken')
+        if not next_token:
+            return
+        kwargs['NextToken'] = next_token
+        with METRICS.phase('describe_change_set'):
+            response = cf_client.describe_change_set(**kwargs)
+
+
+def wait_for_change_set(cf_client, kwargs, timeout, initial_delay=2.0, max_delay=20.0,
+                        sleep=time.sleep, clock=time.time):
+    """ Poll describe_change_set until the change set has been created
+
+    Polls back off exponentially from initial_delay to max_delay with jitter
+    so many waiting jobs do not poll in lockstep. Returns the first response
+    whose Status is no longer pending.
+    """
+    deadline = clock() + timeout
+    delay = initial_delay
+    while True:
+        with METRICS.phase('describe_change_set'):
+            response = cf_client.describe_change_set(**kwargs)
+        status = response.get('Status')
+        if status not in PENDING_STATUSES:
+            if status == 'FAILED':
+                reason = response.get('StatusReason', '')
+                if NO_CHANGES_REASON not in reason:
+                    raise ChangeSetRetrievalError(
+                        'Change set %s failed: %s' % (kwargs['ChangeSetName'], reason))
+                response.setdefault('Changes', [])
+            LOGGER.debug('Change set %s is %s (execution status %s)',
+                         kwargs['ChangeSetName'], status, response.get('ExecutionStatus'))
+            return response
+        remaining = deadline - clock()
+        if remaining <= 0:
+            raise ChangeSetRetrievalError(
+                'Timed out after %ds waiting for change set %s (status %s)' % (
+                    timeout, kwargs['ChangeSetName'], status))
+        pause = min(remaining, random.uniform(delay / 2, delay))
+        LOGGER.debug('Change set %s is %s, checking again in %.1fs',
+                     kwargs['ChangeSetName'], status, pause)
+        sleep(pause)
+        delay = min(max_delay, delay * 2)
+
+
+def prefetch(iterable, depth=1):
+    """ Iterate in a background thread, keeping up to depth items ready
+
+    Exceptions raised by the producer are re-raised in the consumer.
+    Closing the returned generator stops the producer after its current item.
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    done = object()
+
+    def put(item):
+        """ Queue an item unless the consumer has gone away """
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        """ Fill the queue until the iterable is exhausted or we are told to stop """
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except BaseException:  # pylint: disable=W0703
+            put((done, sys.exc_info()))
+            return
+        put((done, None))
+
+    worker = threading.Thread(target=produce, name='cfnsafeset-prefetch')
+    worker.daemon = True
+    worker.start()
+    try:
+        while True:
+            item, exc_info = items.get()
+            if item is done:
+                if exc_info:
+                    _reraise(exc_info)
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def _capture(func, item):
+    """ Call func(item), returning the outcome instead of raising """
+    try:
+        return True, func(item)
+    except Exception as err:  # pylint: disable=W0703
+        return False, err
+
+
+def imap_unordered_bounded(pool, func, iterable, limit):
+    """ Like pool.imap_unordered, but with at most limit items in flight
+
+    Items are only pulled from iterable as results are consumed, so a long
+    or endless input never piles up in memory. Exceptions raised by func are
+    re-raised in the consumer.
+    """
+    results = queue.Queue()
+    iterator = iter(iterable)
+    in_flight = 0
+    exhausted = False
+    while True:
+        while not exhausted and in_flight < limit:
+            try:
+                item = next(iterator)
+            except StopIteration:
+                exhausted = True
+                break
+            pool.apply_async(_capture, (func, item), callback=results.put)
+            in_flight += 1
+        if not in_flight:
+            return
+        succeeded, value = results.get()
+        in_flight -= 1
+        if not succeeded:
+            raise value
+        yield value
+
+
+def _reraise(exc_info):
+    """ Re-raise an exception captured with sys.exc_info() """
+    exc = exc_info[1]
+    if hasattr(exc, 'with_traceback'):
+        raise exc.with_traceback(exc_info[2])
+    raise exc
+
+
+def get_change_set(change_set, stack, region, profile, cf_client=None, metadata=None,
+                   wait_timeout=None):
+    """ Retrieve change set data via API, one change at a time
+
+    Pages are fetched in the background so scanning can start on the
+    first page while the next one is still being retrieved. Pass cf_client
+    to reuse an existing client instead of creating one, and a metadata dict
+    to receive the top-level fields (ChangeSetId, Status, ...) of the response.
+    wait_timeout waits up to that many seconds for a pending change set.
+    Raises ChangeSetNotFoundError or ChangeSetRetrievalError on API, credential
+    and connection errors.
+    """
+    from botocore.exceptions import BotoCoreError, ClientError  # pylint: disable=C0415
+    LOGGER.debug('Retrieving change set %s for stack %s in region %s',
+                 change_set, stack, region)
+    try:
+        if cf_client is None:
+            cf_client = get_client(region, profile)
+        pages = prefetch(iter_change_set_pages(
+            cf_client, change_set, stack, wait_timeout=wait_timeout))
+        for page_number, response in enumerate(pages, 1):
+            LOGGER.debug('Page %d: %s', page_number, response['Changes'])
+            if metadata is not None:
+                metadata.update(
+                    (key, value) for key, value in response.items()
+                    if key not in ('Changes', 'NextToken', 'ResponseMetadata'))
+            for change in response['Changes']:
+                yield change
+
     except ClientError as err:
+        if cf_client is not None and isinstance(
+                err, cf_client.exceptions.ChangeSetNotFoundException):
+            raise ChangeSetNotFoundError(
+                'Change set %s not found for stack %s in region %s' % (
+                    change_set, stack, region))
         if err.response['Error']['Code'] == 'ValidationError':
-            LOGGER.error('Cannot retrieve stack %s in region %s',
-                         stack, region)
+            raise ChangeSetRetrievalError(
+                'Cannot retrieve stack %s in region %s' % (stack, region))
+        if cfnsafeset.throttle.is_throttle(err.response):
+            raise ChangeSetRetrievalError(
+                'CloudFormation kept throttling requests for change set %s '
+                'in region %s' % (change_set, region))
+        raise ChangeSetRetrievalError('Unexpected error: %s' % err)
+    except BotoCoreError as err:
+        # No credentials, unreachable endpoint, invalid parameters, ...
+        raise ChangeSetRetrievalError(
+            'Cannot retrieve change set %s for stack %s in region %s: %s' % (
+                change_set, stack, region, err))
+
+
+def iter_json_list(stream, key, chunk_size=65536):
+    """ Yield the items of a top-level list in a JSON object one at a time
+
+    Only the item being decoded is held in memory; sibling values are decoded
+    and discarded as they are passed. Anything but whitespace after the object
+    is an error.
+    """
+    decoder = json.JSONDecoder()
+    state = {'buf': '', 'pos': 0, 'eof': False}
+
+    def fill(size=chunk_size):
+        """ Read more of the stream, dropping what has been consumed """
+        chunk = stream.read(size)
+        if not chunk:
+            state['eof'] = True
+        state['buf'] = state['buf'][state['pos']:] + chunk
+        state['pos'] = 0
+
+    def peek():
+        """ Return the next non-whitespace character without consuming it """
+        while True:
+            buf, pos = state['buf'], state['pos']
+            while pos < len(buf) and buf[pos] in ' \t\r\n':
+                pos += 1
+            state['pos'] = pos
+            if pos < len(buf):
+                return buf[pos]
+            if state['eof']:
+                raise ValueError('Unexpected end of JSON document')
+            fill()
+
+    def expect(char):
+        """ Consume a structural character """
+        if peek() != char:
+            raise ValueError('Expected %r at offset %d' % (char, state['pos']))
+        state['pos'] += 1
+
+    def decode():
+        """ Decode the next value, reading more input until it is complete """
+        peek()
+        size = chunk_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(state['buf'], state['pos'])
+                # A value ending exactly at the buffer end may be a truncated number
+                if end < len(state['buf']) or state['eof']:
+                    state['pos'] = end
+                    return value
+            except ValueError:
+                if state['eof']:
+                    raise
+            # Grow reads so a large value is not re-decoded once per chunk
+            fill(size)
+            size *= 2
+
+    found = False
+    expect('{')
+    if peek() == '}':
+        raise ValueError('No %s list in change set' % key)
+    while True:
+        name = decode()
+        expect(':')
+        if name == key and not found:
+            found = True
+            expect('[')
+            if peek() == ']':
+                state['pos'] += 1
+            else:
+                while True:
+                    yield decode()
+                    if peek() == ',':
+                        state['pos'] += 1
+                        continue
+                    expect(']')
+                    break
         else:
-            LOGGER.error('Unexpected error: %s', err)
-        sys.exit(1)
+            decode()
+        if peek() == ',':
+            state['pos'] += 1
+            continue
+        expect('}')
+        break
+    if not found:
+        raise ValueError('No %s list in change set' % key)
+    try:
+        peek()
+    except ValueError:
+        return
+    raise ValueError('Extra data after the JSON document at offset %d' % state['pos'])
 
 
 def load_cs_file(filename):
-    """ Retrieve change set data from a file """
+    """ Retrieve change set data from a file, one change at a time
+
+    A filename of - reads the change set from standard input. Raises
+    ChangeSetFileError if the file cannot be read or parsed.
+    """
     try:
+        if filename == '-':
+            for change in iter_json_list(sys.stdin, 'Changes'):
+                yield change
+            return
         with open(filename) as change_file:
-            change_set = json.load(change_file)
-        return change_set['Changes']
+            for change in iter_json_list(change_file, 'Changes'):
+                yield change
     except IOError as err:
         if err.errno == 2:
-            LOGGER.error('Change set file not found: %s', filename)
+            message = 'Change set file not found: %s' % filename
         elif err.errno == 21:
-            LOGGER.error(
-                'Change set references a directory, not a file: %s', filename)
+            message = 'Change set references a directory, not a file: %s' % filename
         elif err.errno == 13:
-            LOGGER.error(
-                'Permission denied when accessing change set file: %s', filename)
-        sys.exit(1)
-    except Exception as json_err:  # pylint: disable=W0703
-        LOGGER.error(
-            'Tried to parse %s as JSON but got error: %s', filename, str(json_err))
-        sys.exit(1)
+            message = 'Permission denied when accessing change set file: %s' % filename
+        else:
+            message = 'Cannot read change set file %s: %s' % (filename, err)
+        raise ChangeSetFileError(message)
+    except ValueError as json_err:
+        raise ChangeSetFileError(
+            'Tried to parse %s as JSON but got error: %s' % (filename, str(json_err)))
 
 
 def show_stateful_resources(stateful_resources):
@@ -188,49 +645,142 @@ def is_remove(change):
 
 def is_replace(change):
     """ Boolean check if current change references a stateful resource """
-    return change['Replacement'] == 'True'
-
-
-def detect_stateful_replace(changes, monitored_change_types, stateful_resources):
-    """ Iterate through changes and look for stateful resources with replace actions """
-    stateful_replace = False
-    stateful_remove = False
+    # Add actions carry no Replacement field
+    return change.get('Replacement') == 'True'
+
+
+class Finding(object):
+    """ A stateful resource that a change set removes or replaces """
+    __slots__ = ('logical_id', 'resource_type', 'action', 'properties')
+
+    def __init__(self, logical_id, resource_type, action, properties=()):
+        self.logical_id = logical_id
+        self.resource_type = resource_type
+        self.action = action
+        self.properties = tuple(properties)
+
+    def __eq__(self, other):
+        return isinstance(other, Finding) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __reduce__(self):
+        # Slotted objects need this to pickle on Python 2, e.g. across processes
+        return Finding, (self.logical_id, self.resource_type, self.action, self.properties)
+
+    def __repr__(self):
+        return 'Finding(%r, %r, %r, %r)' % (
+            self.logical_id, self.resource_type, self.action, self.properties)
+
+
+def replace_finding(resource_change, policies=None):
+    """ Finding for a stateful resource change, or None if it is kept in place
+
+    With policies (a classifier.Policies), a Replace is dropped when every
+    property that forces it is approved, and approved properties are left
+    out of the Finding.
+    """
+    if is_remove(resource_change):
+        return Finding(
+            resource_change['LogicalResourceId'], resource_change['ResourceType'],
+            'Remove')
+    if not is_replace(resource_change):
+        return None
+    properties = stateful_replace_properties(resource_change)
+    policy = policies.get(resource_change['ResourceType']) if policies else None
+    if policy is not None:
+        unapproved = policy.unapproved(resource_change['Details'])
+        approved = properties - unapproved
+        if approved:
+            LOGGER.info('Policy approves replacing %s (%s) for: %s',
+                        resource_change['LogicalResourceId'],
+                        resource_change['ResourceType'], sorted(approved))
+        if properties and not properties & unapproved:
+            return None
+        properties &= unapproved
+    return Finding(
+        resource_change['LogicalResourceId'], resource_change['ResourceType'],
+        'Replace', sorted(properties))
+
+
+def iter_findings(changes, monitored_change_types, stateful_resources):
+    """ Yield a Finding for each stateful resource removed or replaced """
+    extractors = compile_change_types(monitored_change_types)
+    policies = getattr(stateful_resources, 'policies', None)
     for change in changes:
-        if change['Type'] in monitored_change_types:
-            LOGGER.debug('Monitored resource type: %s', change['Type'])
-            if is_stateful(
-                    change[monitored_change_types[change['Type']]],
-                    stateful_resources
-            ):
-                LOGGER.info('Stateful resource detected: %s (%s)',
-                            change['ResourceChange']['LogicalResourceId'],
-                            change['ResourceChange']['ResourceType'])
-                if is_remove(
-                        change[monitored_change_types[change['Type']]]):
-                    LOGGER.warning(
-                        'Stateful resource %s (%s) will be removed '
-                        'due to template changes',
-                        change['ResourceChange']['LogicalResourceId'],
-                        change['ResourceChange']['ResourceType'])
-                    stateful_remove = True
-                elif is_replace(
-                        change[monitored_change_types[change['Type']]]):
-                    properties = stateful_replace_properties(
-                        change[monitored_change_types[change['Type']]])
-                    LOGGER.warning(
-                        'Replace required for stateful resource %s (%s) '
-                        'due to changes to these properties: %s',
-                        change['ResourceChange']['LogicalResourceId'],
-                        change['ResourceChange']['ResourceType'],
-                        list(properties))
-                    stateful_replace = True
-                else:
-                    LOGGER.info('Change does not require replacement')
-            else:
-                LOGGER.info('Non-stateful resource skipped: %s (%s)',
-                            change['ResourceChange']['LogicalResourceId'],
-                            change['ResourceChange']['ResourceType'])
-    return stateful_replace or stateful_remove
+        extract = extractors.get(change['Type'])
+        if extract is None:
+            continue
+        resource_change = extract(change)
+        if is_stateful(resource_change, stateful_resources):
+            finding = replace_finding(resource_change, policies)
+            if finding is not None:
+                yield finding
+
+
+def stop_iteration(changes):
+    """ Close a change iterator so pending page fetches are abandoned """
+    close = getattr(changes, 'close', None)
+    if close is not None:
+        close()
+
+
+def detect_stateful_replace(changes, monitored_change_types, stateful_resources,
+                            fail_fast=False):
+    """ Iterate through changes and look for stateful resources with replace actions
+
+    With fail_fast, stop at the first stateful Remove or Replace and close
+    changes so no further pages are fetched.
+    """
+    detected = False
+    extractors = compile_change_types(monitored_change_types)
+    policies = getattr(stateful_resources, 'policies', None)
+    for change in changes:
+        extract = extractors.get(change['Type'])
+        if extract is None:
+            continue
+        LOGGER.debug('Monitored resource type: %s', change['Type'])
+        resource_change = extract(change)
+        METRICS.incr('changes_scanned')
+        if not is_stateful(resource_change, stateful_resources):
+            LOGGER.info('Non-stateful resource skipped: %s (%s)',
+                        resource_change['LogicalResourceId'],
+                        resource_change['ResourceType'])
+            continue
+        LOGGER.info('Stateful resource detected: %s (%s)',
+                    resource_change['LogicalResourceId'],
+                    resource_change['ResourceType'])
+        finding = replace_finding(resource_change, policies)
+        if finding is None:
+            LOGGER.info('Change does not require replacement')
+            continue
+        log_finding(finding)
+        METRICS.incr('stateful_hits')
+        detected = True
+        if fail_fast:
+            LOGGER.info('Stopping at the first stateful change (--fail-fast)')
+            stop_iteration(changes)
+            break
+    return detected
+
+
+def log_finding(finding):
+    """ Warn about a stateful resource being removed or replaced """
+    if finding.action == 'Remove':
+        LOGGER.warning(
+            'Stateful resource %s (%s) will be removed '
+            'due to template changes',
+            finding.logical_id, finding.resource_type)
+    else:
+        LOGGER.warning(
+            'Replace required for stateful resource %s (%s) '
+            'due to changes to these properties: %s',
+            finding.logical_id, finding.resource_type, list(finding.properties))
 
 
 def stateful_replace_properties(change):
@@ -0,0 +1,169 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import calendar
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import cfnsafeset.cache
+from cfnsafeset.exceptions import CredentialsError
+from cfnsafeset.metrics import METRICS
+
+LOGGER = logging.getLogger('cfnsafeset')
+CREDENTIALS_DIR = 'credentials'
+DEFAULT_SESSION_NAME = 'cfn-safeset'
+DEFAULT_DURATION = 3600
+# Credentials this close to expiry are assumed again
+DEFAULT_MARGIN = 300
+ROLE_ARN = re.compile(r'^arn:aws[\w-]*:iam::(\d{12}):role/.+$')
+
+
+def account_id(role_arn):
+    """ Account ID of a role ARN """
+    return ROLE_ARN.match(role_arn).group(1)
+
+
+def load_roles(roles=None, filename=None):
+    """ Role ARNs from the command line and a file of one ARN per line
+
+    Blank lines and lines starting with # are ignored, as are duplicates.
+    Raises ValueError for anything that is not an IAM role ARN.
+    """
+    values = list(roles or [])
+    if filename:
+        try:
+            with open(filename) as roles_file:
+                values.extend(line.strip() for line in roles_file)
+        except IOError as err:
+            raise ValueError('Cannot read roles file %s: %s' % (filename, err))
+    result = []
+    for value in values:
+        if not value or value.startswith('#') or value in result:
+            continue
+        if not ROLE_ARN.match(value):
+            raise ValueError('Not an IAM role ARN: %s' % value)
+        result.append(value)
+    return result
+
+
+def to_epoch(value):
+    """ Seconds since the epoch for an STS Expiration (datetime or number) """
+    if hasattr(value, 'utctimetuple'):
+        return calendar.timegm(value.utctimetuple())
+    return float(value)
+
+
+class CredentialCache(object):
+    """ Temporary credentials per source profile and role, in memory and on disk
+
+    Credentials are reused until margin seconds before they expire, so
+    repeated runs skip the STS round-trip. Each (profile, role) is assumed
+    at most once at a time; different roles are assumed concurrently.
+    Files are created with mode 0600 by tempfile.mkstemp in a 0700 directory.
+    """
+
+    def __init__(self, directory=None, session_name=DEFAULT_SESSION_NAME,
+                 duration=DEFAULT_DURATION, margin=DEFAULT_MARGIN, clock=time.time):
+        self.directory = directory or os.path.join(
+            cfnsafeset.cache.get_cache_dir(), CREDENTIALS_DIR)
+        self.session_name = session_name
+        self.duration = duration
+        self.margin = margin
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._memory = {}
+
+    def fresh(self, credentials):
+        """ True if credentials can still be used """
+        return credentials is not None and credentials['Expiration'] - self.margin > self.clock()
+
+    def _path(self, role_arn, profile):
+        """ Cache file for a role assumed from a profile """
+        key = hashlib.sha1(('%s\0%s' % (profile or '', role_arn)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + '.json')
+
+    def _load(self, role_arn, profile):
+        """ Credentials cached on disk, or None """
+        try:
+            with open(self._path(role_arn, profile)) as cache_file:
+                credentials = json.load(cache_file)
+        except (IOError, OSError, ValueError):
+            return None
+        if not isinstance(credentials, dict) or (
+                credentials.get('RoleArn'), credentials.get('Profile')) != (role_arn, profile):
+            return None
+        if not isinstance(credentials.get('Expiration'), (int, float)):
+            return None
+        return credentials
+
+    def _store(self, credentials):
+        """ Write credentials to disk; failures only cost the next run an STS call """
+        path = self._path(credentials['RoleArn'], credentials['Profile'])
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory, 0o700)
+            cfnsafeset.cache.atomic_write(path, json.dumps(credentials).encode('utf-8'))
+        except (IOError, OSError) as err:
+            LOGGER.debug('Could not write credential cache %s: %s', path, err)
+
+    def _assume(self, sts_client_factory, role_arn, profile):
+        """ Call STS AssumeRole """
+        from botocore.exceptions import BotoCoreError, ClientError  # pylint: disable=C0415
+        LOGGER.debug('Assuming role %s', role_arn)
+        METRICS.incr('assume_role_calls')
+        try:
+            response = sts_client_factory().assume_role(
+                RoleArn=role_arn, RoleSessionName=self.session_name,
+                DurationSeconds=self.duration)
+        except (BotoCoreError, ClientError) as err:
+            raise CredentialsError('Cannot assume role %s: %s' % (role_arn, err))
+        credentials = response['Credentials']
+        return {
+            'RoleArn': role_arn,
+            'Profile': profile,
+            'AccessKeyId': credentials['AccessKeyId'],
+            'SecretAccessKey': credentials['SecretAccessKey'],
+            'SessionToken': credentials['SessionToken'],
+            'Expiration': to_epoch(credentials['Expiration']),
+        }
+
+    def get(self, role_arn, profile, sts_client_factory):
+        """ Credentials for role_arn assumed from profile
+
+        sts_client_factory() is only called when STS has to be asked. The
+        same dict is returned for as long as the credentials stay fresh.
+        Raises CredentialsError if the role cannot be assumed, including when
+        the source profile is missing or has no credentials.
+        """
+        key = (profile, role_arn)
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        with lock:
+            credentials = self._memory.get(key)
+            if not self.fresh(credentials):
+                credentials = self._load(role_arn, profile)
+                if self.fresh(credentials):
+                    LOGGER.debug('Using cached credentials for role %s', role_arn)
+                else:
+                    credentials = self._assume(sts_client_factory, role_arn, profile)
+                    self._store(credentials)
+                self._memory[key] = credentials
+            return credentials
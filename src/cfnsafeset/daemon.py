@@ -0,0 +1,265 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import errno
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import cfnsafeset.cache
+import cfnsafeset.core
+from cfnsafeset.exceptions import CfnSafesetError, ChangeSetFileError, DaemonError
+
+LOGGER = logging.getLogger('cfnsafeset')
+SOCKET_NAME = 'daemon.sock'
+# Seconds a client allows the daemon on top of --wait-timeout
+ANSWER_MARGIN = 300
+# Options a request carries, or that do not change the check the daemon runs
+FORWARDED_OPTIONS = frozenset([
+    'changeset', 'stack', 'file', 'region', 'profile', 'wait', 'wait_timeout',
+    'fail_fast', 'info', 'debug', 'metrics', 'jobs', 'no_config_cache',
+    'use_daemon', 'daemon_socket',
+])
+
+
+def get_socket_path(socket_path=None):
+    """ Daemon socket from the argument, CFN_SAFESET_SOCKET or the cache directory """
+    return socket_path or os.environ.get('CFN_SAFESET_SOCKET') or os.path.join(
+        cfnsafeset.cache.get_cache_dir(), SOCKET_NAME)
+
+
+class _RequestLog(logging.Handler):
+    """ Collect the log records emitted while one request is handled """
+
+    def __init__(self, level):
+        logging.Handler.__init__(self, level)
+        self.thread = threading.current_thread().ident
+        self.records = []
+
+    def emit(self, record):
+        if record.thread == self.thread:
+            self.records.append([record.levelno, record.getMessage()])
+
+
+def _parse_errors(changes):
+    """ Report parse errors in inline documents like file errors """
+    try:
+        for change in changes:
+            yield change
+    except ValueError as err:
+        raise ChangeSetFileError('Cannot parse change set document: %s' % err)
+
+
+def handle_request(request, classifier, clients):
+    """ Run one check request and return the response document
+
+    The response carries the exit code main() would have returned and the
+    log records it would have printed at the caller's log level.
+    """
+    log = _RequestLog(request.get('LogLevel', logging.WARNING))
+    LOGGER.addHandler(log)
+    try:
+        if 'Document' in request:
+            changes = cfnsafeset.core.iter_json_list(
+                io.StringIO(request['Document']), 'Changes')
+            changes = _parse_errors(changes)
+        else:
+            changes = cfnsafeset.core.get_change_set(
+                request['ChangeSet'], request['Stack'], request['Region'],
+                request.get('Profile'),
+                cf_client=clients.get(request['Region'], request.get('Profile')),
+                wait_timeout=request.get('WaitTimeout'))
+        if cfnsafeset.core.detect_stateful_replace(
+                changes, classifier.extractors, classifier, request.get('FailFast', False)):
+            exit_code = 2
+        else:
+            exit_code = 0
+    except CfnSafesetError as err:
+        LOGGER.error(err)
+        exit_code = 1
+    except Exception as err:  # pylint: disable=W0703
+        LOGGER.error('Could not check change set: %s', err)
+        exit_code = 1
+    finally:
+        LOGGER.removeHandler(log)
+    return {'ExitCode': exit_code, 'Log': log.records}
+
+
+def create_server(socket_path, classifier, clients):
+    """ Bind a threaded Unix socket server for check requests
+
+    Each connection sends one JSON request line and receives one JSON
+    response line. The classifier and CloudFormation clients stay warm
+    between requests.
+    """
+    try:
+        import socketserver  # pylint: disable=C0415
+    except ImportError:  # Python 2
+        import SocketServer as socketserver  # pylint: disable=C0415,E0401
+
+    class Handler(socketserver.StreamRequestHandler):
+        """ One check request per connection """
+
+        def handle(self):
+            line = self.rfile.readline()
+            if not line:
+                # Liveness probe from is_running
+                return
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError as err:
+                response = {'ExitCode': 1, 'Log': [[logging.ERROR, 'Invalid request: %s' % err]]}
+            else:
+                response = handle_request(request, classifier, clients)
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """ Threaded Unix socket server """
+        daemon_threads = True
+
+    if is_running(socket_path):
+        raise ValueError('A daemon is already listening on %s' % socket_path)
+    directory = os.path.dirname(socket_path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    umask = os.umask(0o177)
+    try:
+        return Server(socket_path, Handler)
+    finally:
+        os.umask(umask)
+
+
+def serve(socket_path, classifier, clients):
+    """ Serve check requests on a Unix socket until interrupted """
+    server = create_server(socket_path, classifier, clients)
+    # Treat SIGTERM like Ctrl-C so the socket file is cleaned up
+    signal.signal(signal.SIGTERM, signal.getsignal(signal.SIGINT))
+    LOGGER.warning('cfn-safeset daemon listening on %s', socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+    return 0
+
+
+def _connect(socket_path, timeout):
+    """ Connect to the daemon socket, or return None if nothing is listening """
+    if not hasattr(socket, 'AF_UNIX'):
+        return None
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(socket_path)
+    except socket.error as err:
+        conn.close()
+        if err.errno in (errno.ENOENT, errno.ECONNREFUSED):
+            return None
+        raise
+    return conn
+
+
+def is_running(socket_path):
+    """ Boolean check if a daemon is listening on the socket """
+    conn = _connect(socket_path, 1.0)
+    if conn is None:
+        return False
+    conn.close()
+    return True
+
+
+def request_check(request, socket_path, timeout=None):
+    """ Send a check request to the daemon
+
+    Returns the response document, or None when no daemon is running so the
+    caller can fall back to checking in-process. Raises DaemonError if the
+    daemon does not answer within timeout seconds (None waits forever), as
+    it may still be checking and a fallback would repeat every API call.
+    """
+    try:
+        conn = _connect(socket_path, timeout)
+    except socket.error as err:
+        LOGGER.debug('Cannot reach daemon on %s: %s', socket_path, err)
+        return None
+    if conn is None:
+        LOGGER.debug('No daemon listening on %s', socket_path)
+        return None
+    try:
+        conn.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        reader = conn.makefile('rb')
+        line = reader.readline()
+        reader.close()
+    except socket.timeout:
+        raise DaemonError('Daemon on %s did not answer within %ss' % (socket_path, timeout))
+    except socket.error as err:
+        LOGGER.debug('Daemon on %s failed to answer: %s', socket_path, err)
+        return None
+    finally:
+        conn.close()
+    if not line:
+        LOGGER.debug('Daemon on %s closed the connection', socket_path)
+        return None
+    return json.loads(line.decode('utf-8'))
+
+
+def can_forward(args, filenames, parser):
+    """ Boolean check if args are a plain check of one -f file or one -c/-s change set
+
+    Any option outside FORWARDED_OPTIONS that differs from its parser default
+    keeps the run in-process, so new options are never silently dropped by
+    the daemon.
+    """
+    for name, value in vars(args).items():
+        if name not in FORWARDED_OPTIONS and value != parser.get_default(name):
+            return False
+    if args.file:
+        return len(filenames) == 1
+    return bool(args.changeset and args.stack)
+
+
+def build_request(args):
+    """ Turn command line arguments into a daemon request document """
+    request = {'LogLevel': LOGGER.getEffectiveLevel(), 'FailFast': args.fail_fast}
+    if args.file:
+        if args.file[0] == '-':
+            request['Document'] = sys.stdin.read()
+        else:
+            with open(args.file[0]) as change_file:
+                request['Document'] = change_file.read()
+    else:
+        request.update({
+            'ChangeSet': args.changeset,
+            'Stack': args.stack,
+            'Region': args.region,
+            'Profile': args.profile,
+            'WaitTimeout': args.wait_timeout,
+        })
+    return request
+
+
+def replay(response):
+    """ Log the daemon's records locally and return its exit code """
+    for level, message in response['Log']:
+        LOGGER.log(level, '%s', message)
+    return response['ExitCode']
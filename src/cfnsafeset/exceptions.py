@@ -0,0 +1,52 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+
+
+class CfnSafesetError(Exception):
+    """ Base class for errors that stop a change set from being checked """
+
+
+class ConfigError(CfnSafesetError, ValueError):
+    """ The stateful resource config is invalid """
+
+
+class ArchiveError(CfnSafesetError):
+    """ A change set archive cannot be read or written """
+
+
+class ChangeSetFileError(CfnSafesetError):
+    """ A change set file cannot be read or parsed """
+
+
+class ChangeSetNotFoundError(CfnSafesetError):
+    """ CloudFormation has no such change set """
+
+
+class ChangeSetRetrievalError(CfnSafesetError):
+    """ Retrieving a change set from CloudFormation failed """
+
+
+class CredentialsError(CfnSafesetError):
+    """ Temporary credentials for a role cannot be obtained """
+
+
+class TemplateError(CfnSafesetError):
+    """ A template cannot be read or parsed """
+
+
+class DaemonError(CfnSafesetError):
+    """ The check daemon accepted a request but did not answer it """
@@ -0,0 +1,135 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import functools
+import glob
+import itertools
+import logging
+import multiprocessing
+import cfnsafeset.core
+from cfnsafeset.classifier import compile_config
+from cfnsafeset.exceptions import CfnSafesetError, ChangeSetFileError
+
+LOGGER = logging.getLogger('cfnsafeset')
+LABELS = {0: 'OK', 1: 'ERROR', 2: 'STATEFUL'}
+# Set in each worker process by _init_worker
+_CLASSIFIER = None
+
+
+def expand_paths(patterns):
+    """ Expand globs into a sorted, de-duplicated list of change set files
+
+    Plain paths are kept as given so a missing file is reported when it is
+    scanned; a glob that matches nothing raises ChangeSetFileError.
+    """
+    filenames = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+            if not matches:
+                raise ChangeSetFileError(
+                    'No change set files match %s' % pattern)
+        else:
+            matches = [pattern]
+        for filename in matches:
+            if filename not in seen:
+                seen.add(filename)
+                filenames.append(filename)
+    return filenames
+
+
+def _init_worker(config):
+    """ Compile the config once per worker process """
+    global _CLASSIFIER  # pylint: disable=W0603
+    _CLASSIFIER = compile_config(config)
+
+
+def scan_file(filename, classifier=None, fail_fast=False):
+    """ Scan one change set file, returning (filename, findings, error)
+
+    With fail_fast, only the first finding is returned.
+    """
+    classifier = classifier or _CLASSIFIER
+    try:
+        findings = cfnsafeset.core.iter_findings(
+            cfnsafeset.core.load_cs_file(filename), classifier.extractors, classifier)
+        findings = list(itertools.islice(findings, 1) if fail_fast else findings)
+    except CfnSafesetError as err:
+        return filename, [], str(err)
+    except Exception as err:  # pylint: disable=W0703
+        return filename, [], 'Unexpected error scanning %s: %s' % (filename, err)
+    return filename, findings, None
+
+
+def scan_files(filenames, config, jobs=None, fail_fast=False):
+    """ Yield (filename, findings, error) for each file, in the order given
+
+    Files are parsed and scanned across a pool of processes (jobs, default
+    the number of CPUs); results are streamed back in chunks so memory stays
+    flat over large archives. Closing the generator stops the pool.
+    """
+    jobs = max(1, min(jobs or multiprocessing.cpu_count(), len(filenames)))
+    if jobs == 1:
+        classifier = compile_config(config)
+        for filename in filenames:
+            yield scan_file(filename, classifier, fail_fast)
+        return
+    chunksize = max(1, min(64, len(filenames) // (jobs * 4)))
+    pool = multiprocessing.Pool(jobs, _init_worker, (config,))
+    try:
+        scan = functools.partial(scan_file, fail_fast=fail_fast)
+        for result in pool.imap(scan, filenames, chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def report_files(results, fail_fast=False):
+    """ Log findings per file, print a summary and return the combined exit code
+
+    2 if any file touches a stateful resource, otherwise 1 if any file could
+    not be scanned, otherwise 0. With fail_fast, stop at the first stateful
+    file.
+    """
+    summary = []
+    for filename, findings, error in results:
+        if error:
+            LOGGER.error(error)
+            code = 1
+        else:
+            LOGGER.info('Scanned change set file %s: %d stateful changes',
+                        filename, len(findings))
+            for finding in findings:
+                cfnsafeset.core.log_finding(cfnsafeset.core.Finding(
+                    '%s:%s' % (filename, finding.logical_id), finding.resource_type,
+                    finding.action, finding.properties))
+            code = 2 if findings else 0
+        summary.append((code, filename, len(findings)))
+        if fail_fast and code == 2:
+            cfnsafeset.core.stop_iteration(results)
+            break
+
+    print('File results:')
+    for code, filename, count in summary:
+        if code == 2:
+            print(' %-8s %s (%d stateful)' % (LABELS[code], filename, count))
+        else:
+            print(' %-8s %s' % (LABELS[code], filename))
+    return max(code for code, _, _ in summary) if summary else 0
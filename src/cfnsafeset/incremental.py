@@ -0,0 +1,226 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import collections
+import hashlib
+import itertools
+import json
+import logging
+import os
+import time
+import zlib
+import cfnsafeset.cache
+import cfnsafeset.core
+import cfnsafeset.results
+from cfnsafeset.metrics import METRICS
+
+LOGGER = logging.getLogger('cfnsafeset')
+STACKS_DIR = 'stacks'
+STATE_VERSION = 1
+# Fields of an entry that decide its verdict, in report order
+FIELDS = ('ResourceType', 'Action', 'Replacement', 'Details')
+
+
+def fingerprint(resource_change):
+    """ Entry for a ResourceChange: type, action, replacement flag and a Details hash """
+    details = json.dumps(resource_change.get('Details', []), sort_keys=True)
+    return {
+        'ResourceType': resource_change['ResourceType'],
+        'Action': resource_change['Action'],
+        'Replacement': resource_change.get('Replacement'),
+        'Details': hashlib.sha1(details.encode('utf-8')).hexdigest(),
+    }
+
+
+def changed_fields(old, new):
+    """ Names of the fingerprint fields that differ between two entries """
+    return [name for name in FIELDS if old.get(name) != new.get(name)]
+
+
+def to_finding(logical_id, entry):
+    """ Finding stored in an entry, or None """
+    if entry.get('Finding') is None:
+        return None
+    action, properties = entry['Finding']
+    return cfnsafeset.core.Finding(logical_id, entry['ResourceType'], action, properties)
+
+
+def _state_path(stack_id):
+    """ State file for a stack ARN """
+    key = hashlib.sha1(stack_id.encode('utf-8')).hexdigest()
+    return os.path.join(cfnsafeset.cache.get_cache_dir(), STACKS_DIR, key + '.json.z')
+
+
+def load_state(stack_id, max_age):
+    """ Return the fingerprints stored for a stack by the last verdict, or None """
+    path = _state_path(stack_id)
+    try:
+        if time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path, 'rb') as state_file:
+            state = json.loads(zlib.decompress(state_file.read()).decode('utf-8'),
+                               object_pairs_hook=collections.OrderedDict)
+    except (IOError, OSError, ValueError, zlib.error):
+        return None
+    if state.get('Version') != STATE_VERSION or state.get('StackId') != stack_id:
+        return None
+    return state
+
+
+def store_state(state, max_age, max_entries):
+    """ Write the fingerprints of a stack and evict old ones; failures are only logged """
+    path = _state_path(state['StackId'])
+    try:
+        cfnsafeset.cache.atomic_write(
+            path, zlib.compress(json.dumps(state).encode('utf-8')))
+        cfnsafeset.results.prune_results(max_age, max_entries, STACKS_DIR)
+    except (IOError, OSError) as err:
+        LOGGER.debug('Could not write stack state %s: %s', path, err)
+
+
+def evaluate(changes, classifier, previous=None, fail_fast=False):
+    """ Fingerprint changes and classify the ones not found unchanged in previous
+
+    previous maps logical IDs to entries from an earlier verdict under the same
+    config; their findings are reused as is. Returns an OrderedDict of entries
+    in change set order and the number of entries reused. With fail_fast,
+    stop after the first entry with a finding.
+    """
+    previous = previous or {}
+    policies = getattr(classifier, 'policies', None)
+    entries = collections.OrderedDict()
+    reused = 0
+    for change in changes:
+        extract = classifier.extractors.get(change['Type'])
+        if extract is None:
+            continue
+        resource_change = extract(change)
+        METRICS.incr('changes_scanned')
+        logical_id = resource_change['LogicalResourceId']
+        entry = fingerprint(resource_change)
+        old = previous.get(logical_id)
+        if old is not None and not changed_fields(old, entry):
+            entry['Finding'] = old.get('Finding')
+            reused += 1
+        elif cfnsafeset.core.is_stateful(resource_change, classifier):
+            finding = cfnsafeset.core.replace_finding(resource_change, policies)
+            entry['Finding'] = None if finding is None else [
+                finding.action, list(finding.properties)]
+        else:
+            entry['Finding'] = None
+        entries[logical_id] = entry
+        if fail_fast and entry['Finding'] is not None:
+            break
+    return entries, reused
+
+
+def _describe(logical_id, entry):
+    """ One-line summary of an entry """
+    text = '%s (%s) %s' % (logical_id, entry['ResourceType'], entry['Action'])
+    if entry.get('Replacement'):
+        text += ', Replacement %s' % entry['Replacement']
+    return text
+
+
+def _verdict(detected):
+    """ Human readable verdict """
+    return 'stateful changes' if detected else 'no stateful changes'
+
+
+def report_changes(state, entries, reused):
+    """ Print what changed in a stack's change set since the last verdict """
+    previous = state['Entries']
+    print('Since change set %s:' % state['ChangeSetId'])
+    unchanged = 0
+    for logical_id, entry in entries.items():
+        old = previous.get(logical_id)
+        if old is None:
+            print('  + %s' % _describe(logical_id, entry))
+            continue
+        fields = changed_fields(old, entry)
+        if fields:
+            print('  ~ %s: %s changed' % (_describe(logical_id, entry), ', '.join(fields)))
+        else:
+            unchanged += 1
+    for logical_id, old in previous.items():
+        if logical_id not in entries:
+            print('  - %s' % _describe(logical_id, old))
+    for logical_id, entry in entries.items():
+        finding = to_finding(logical_id, entry)
+        if finding is not None and to_finding(
+                logical_id, previous.get(logical_id, {})) != finding:
+            print('  new finding: %s %s (%s)' % (
+                finding.action, finding.logical_id, finding.resource_type))
+    for logical_id, old in previous.items():
+        finding = to_finding(logical_id, old)
+        if finding is not None and to_finding(
+                logical_id, entries.get(logical_id, {})) is None:
+            print('  resolved: %s %s (%s)' % (
+                finding.action, finding.logical_id, finding.resource_type))
+    detected = any(entry['Finding'] is not None for entry in entries.values())
+    print('  %d unchanged (%d verdicts reused)' % (unchanged, reused))
+    print('Verdict: %s (was: %s)' % (_verdict(detected), _verdict(state['Verdict'])))
+
+
+def check_change_set(args, digest, classifier, cf_client=None, fail_fast=False):
+    """ Check a live change set against the stored fingerprints of its stack
+
+    Entries unchanged since the stack's last verdict under the same config
+    keep their finding; only new and changed entries are classified again.
+    The new fingerprints are stored under the StackId once CloudFormation
+    reports the change set as CREATE_COMPLETE. With fail_fast, stop at the
+    first finding without fetching the remaining pages; the partial entries
+    are neither reported against nor stored as the stack's verdict.
+    """
+    metadata = {}
+    pages = cfnsafeset.core.get_change_set(
+        args.changeset, args.stack, args.region, args.profile,
+        cf_client=cf_client, metadata=metadata, wait_timeout=args.wait_timeout)
+    # The first page carries the StackId the earlier verdict is stored under
+    first = list(itertools.islice(pages, 1))
+    stack_id = metadata.get('StackId')
+    state = load_state(stack_id, args.cache_max_age) if stack_id else None
+    reusable = None
+    if state is not None and state['Config'] == digest:
+        reusable = state['Entries']
+    entries, reused = evaluate(
+        itertools.chain(first, pages), classifier, reusable, fail_fast)
+    detected = False
+    for logical_id, entry in entries.items():
+        finding = to_finding(logical_id, entry)
+        if finding is not None:
+            cfnsafeset.core.log_finding(finding)
+            METRICS.incr('stateful_hits')
+            detected = True
+    if fail_fast and detected:
+        pages.close()
+        LOGGER.info('Stopped at the first stateful change; the verdict for stack %s '
+                    'is not updated', stack_id or args.stack)
+        return detected
+    if state is None:
+        LOGGER.info('No earlier verdict for stack %s', stack_id or args.stack)
+    else:
+        report_changes(state, entries, reused)
+    if stack_id and metadata.get('Status') == cfnsafeset.results.CACHEABLE_STATUS:
+        store_state({
+            'Version': STATE_VERSION,
+            'StackId': stack_id,
+            'ChangeSetId': metadata.get('ChangeSetId'),
+            'Config': digest,
+            'Verdict': detected,
+            'Entries': entries,
+        }, args.cache_max_age, args.cache_max_entries)
+    return detected
@@ -0,0 +1,203 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import contextlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from cfnsafeset.cache import atomic_write
+
+STARTED = time.time()
+LOGGER = logging.getLogger('cfnsafeset')
+PHASES = ('import', 'config', 'retrieve', 'describe_change_set', 'parse', 'detect')
+COUNTERS = ('changes_scanned', 'stateful_hits')
+TARGET_KINDS = ('prometheus', 'statsd', 'json')
+
+
+class Metrics(object):
+    """ Thread-safe phase timers and counters for one process
+
+    Phase times are exclusive: time spent in a phase entered while another
+    is running on the same thread is only charged to the inner phase. Times
+    from concurrent threads are summed.
+    """
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._phases = {}
+        self._counters = dict((name, 0) for name in COUNTERS)
+
+    def record(self, name, seconds):
+        """ Charge seconds to a phase """
+        with self._lock:
+            self._phases[name] = self._phases.get(name, 0.0) + seconds
+
+    def incr(self, name, count=1):
+        """ Add to a counter """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """ Time the enclosed block as a phase """
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        # Each frame is [name, time charged to nested phases]
+        frame = [name, 0.0]
+        stack.append(frame)
+        start = self._clock()
+        try:
+            yield
+        finally:
+            elapsed = self._clock() - start
+            stack.pop()
+            self.record(name, elapsed - frame[1])
+            if stack:
+                stack[-1][1] += elapsed
+
+    def timed_iter(self, iterable, name):
+        """ Yield from iterable, charging the time spent producing items to a phase """
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.phase(name):
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                yield item
+        finally:
+            # Pass an early close on, e.g. to stop page prefetching
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+
+    def snapshot(self):
+        """ Copy of the phase times and counters """
+        with self._lock:
+            return {'phases': dict(self._phases), 'counters': dict(self._counters)}
+
+    def reset(self):
+        """ Clear all phases and counters """
+        with self._lock:
+            self._phases = {}
+            self._counters = dict((name, 0) for name in COUNTERS)
+
+
+METRICS = Metrics()
+
+
+def since_import():
+    """ Seconds since cfnsafeset was first imported """
+    return time.time() - STARTED
+
+
+def parse_target(value):
+    """ Split a --metrics target into (kind, destination)
+
+    prometheus:PATH writes a node_exporter textfile; statsd:HOST:PORT and
+    json:HOST:PORT send a UDP datagram. Raises ValueError otherwise.
+    """
+    kind, _, destination = value.partition(':')
+    if kind not in TARGET_KINDS or not destination:
+        raise ValueError('metrics target must be prometheus:PATH, statsd:HOST:PORT '
+                         'or json:HOST:PORT, not %r' % value)
+    if kind == 'prometheus':
+        return kind, destination
+    host, _, port = destination.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError('metrics target %r needs HOST:PORT' % value)
+    return kind, (host, int(port))
+
+
+def collect(metrics, api_stats, exit_code):
+    """ Flatten phases and counters into one sample dict """
+    snapshot = metrics.snapshot()
+    counters = dict(snapshot['counters'])
+    counters.update(api_stats)
+    return {
+        'timestamp': round(time.time(), 3),
+        'exit_code': exit_code,
+        'phases': dict((name, round(seconds, 6))
+                       for name, seconds in snapshot['phases'].items()),
+        'counters': counters,
+    }
+
+
+def format_prometheus(sample):
+    """ Prometheus text exposition format """
+    lines = [
+        '# HELP cfnsafeset_phase_seconds Time spent in each phase of the last run',
+        '# TYPE cfnsafeset_phase_seconds gauge',
+    ]
+    for name in sorted(sample['phases']):
+        lines.append('cfnsafeset_phase_seconds{phase="%s"} %s' % (
+            name, repr(sample['phases'][name])))
+    for name in sorted(sample['counters']):
+        lines.append('# TYPE cfnsafeset_%s gauge' % name)
+        lines.append('cfnsafeset_%s %d' % (name, sample['counters'][name]))
+    lines.append('# TYPE cfnsafeset_exit_code gauge')
+    lines.append('cfnsafeset_exit_code %d' % sample['exit_code'])
+    lines.append('# TYPE cfnsafeset_last_run_timestamp_seconds gauge')
+    lines.append('cfnsafeset_last_run_timestamp_seconds %s' % repr(sample['timestamp']))
+    return '\n'.join(lines) + '\n'
+
+
+def format_statsd(sample, prefix='cfnsafeset'):
+    """ StatsD lines: phases as timers in ms, counters as counts """
+    lines = ['%s.phase.%s:%.3f|ms' % (prefix, name, seconds * 1000)
+             for name, seconds in sorted(sample['phases'].items())]
+    lines.extend('%s.%s:%d|c' % (prefix, name, count)
+                 for name, count in sorted(sample['counters'].items()))
+    lines.append('%s.exit_code:%d|g' % (prefix, sample['exit_code']))
+    return '\n'.join(lines)
+
+
+def format_json(sample):
+    """ One JSON line """
+    return json.dumps(sample, sort_keys=True) + '\n'
+
+
+def _send_udp(payload, address):
+    """ Fire and forget one datagram """
+    family = socket.AF_INET6 if ':' in address[0] else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(payload.encode('utf-8'), address)
+    finally:
+        sock.close()
+
+
+def export(target, sample):
+    """ Write or send a sample; failures are logged, never raised """
+    kind, destination = target
+    try:
+        if kind == 'prometheus':
+            # Readable by a node_exporter textfile collector running as another user
+            atomic_write(os.path.abspath(destination), format_prometheus(sample).encode('utf-8'),
+                         0o644)
+        elif kind == 'statsd':
+            _send_udp(format_statsd(sample), destination)
+        else:
+            _send_udp(format_json(sample), destination)
+    except (IOError, OSError, socket.error) as err:
+        LOGGER.warning('Cannot export metrics to %s %s: %s', kind, destination, err)
@@ -0,0 +1,181 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import logging
+import threading
+import cfnsafeset.core
+from cfnsafeset.core import Finding
+from cfnsafeset.exceptions import ChangeSetRetrievalError
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+LOGGER = logging.getLogger('cfnsafeset')
+NESTED_STACK_TYPE = 'AWS::CloudFormation::Stack'
+
+
+class ChangeSetNode(object):
+    """ Result of scanning one change set in a nested stack tree """
+    __slots__ = ('change_set', 'path', 'findings', 'children', 'error')
+
+    def __init__(self, change_set, path):
+        self.change_set = change_set
+        self.path = path
+        self.findings = []
+        self.children = []
+        self.error = None
+
+
+def nested_change_set(resource_change):
+    """ ChangeSetId of a nested stack's own change set, if it has one """
+    if resource_change.get('ResourceType') == NESTED_STACK_TYPE:
+        return resource_change.get('ChangeSetId')
+    return None
+
+
+def scan_node(node, stack, region, profile, cf_client, classifier, wait_timeout=None,
+              stop=None, found=None):
+    """ Fetch one change set, recording its findings and nested change sets
+
+    With found, each nested change set is passed to it as soon as its entry
+    is seen, before the remaining pages are fetched. With stop (a
+    threading.Event), set it on the first finding and give up once it is
+    set, abandoning any remaining pages.
+    """
+    try:
+        changes = cfnsafeset.core.get_change_set(
+            node.change_set, stack, region, profile, cf_client=cf_client,
+            wait_timeout=wait_timeout)
+        for change in changes:
+            if stop is not None and stop.is_set():
+                changes.close()
+                break
+            extract = classifier.extractors.get(change['Type'])
+            if extract is None:
+                continue
+            resource_change = extract(change)
+            child = nested_change_set(resource_change)
+            if child:
+                child = ChangeSetNode(child, node.path + [resource_change['LogicalResourceId']])
+                node.children.append(child)
+                if found is not None:
+                    found(child)
+            if cfnsafeset.core.is_stateful(resource_change, classifier):
+                finding = cfnsafeset.core.replace_finding(resource_change, classifier.policies)
+                if finding is not None:
+                    node.findings.append(finding)
+                    if stop is not None:
+                        stop.set()
+    except Exception as err:  # pylint: disable=W0703
+        # Always hand the node back so scan_tree never waits on a lost fetch
+        node.error = err
+    return node
+
+
+def scan_tree(change_set, stack, region, profile, cf_client, classifier, jobs=8,
+              wait_timeout=None, fail_fast=False):
+    """ Scan a change set and every nested change set below it
+
+    Nested change sets are fetched concurrently on a pool of `jobs` threads
+    as soon as their parent entry is seen. Returns the nodes in the order
+    they completed, root first. Only the root waits (wait_timeout) for
+    creation to finish; nested change sets are created along with it.
+
+    With fail_fast, the first finding anywhere in the tree stops all fetches
+    and no further nested change sets are scheduled. Without cf_client, one
+    is created for region and profile and shared by the whole tree; if that
+    fails the error is recorded on the root node.
+    """
+    from multiprocessing.pool import ThreadPool  # pylint: disable=C0415
+    if cf_client is None:
+        try:
+            cf_client = cfnsafeset.core.get_client(region, profile)
+        except ChangeSetRetrievalError as err:
+            root = ChangeSetNode(change_set, [])
+            root.error = err
+            return [root]
+    stop = threading.Event() if fail_fast else None
+    # (finished, node): a completed node, or a nested change set to schedule
+    events = queue.Queue()
+
+    def found(child):
+        events.put((False, child))
+
+    def finished(node):
+        events.put((True, node))
+
+    pool = ThreadPool(max(1, jobs))
+    nodes = []
+    try:
+        pool.apply_async(
+            scan_node, (ChangeSetNode(change_set, []), stack, region, profile,
+                        cf_client, classifier, wait_timeout, stop, found),
+            callback=finished)
+        outstanding = 1
+        while outstanding:
+            is_done, node = events.get()
+            if is_done:
+                outstanding -= 1
+                nodes.append(node)
+                if stop is not None and stop.is_set():
+                    break
+                continue
+            if stop is not None and stop.is_set():
+                continue
+            pool.apply_async(
+                scan_node, (node, None, region, profile, cf_client, classifier,
+                            None, stop, found),
+                callback=finished)
+            outstanding += 1
+    finally:
+        pool.terminate()
+    return nodes
+
+
+def qualified(finding, path):
+    """ Finding whose logical ID is prefixed with the nested stack path """
+    if not path:
+        return finding
+    return Finding('/'.join(path + [finding.logical_id]), finding.resource_type,
+                   finding.action, finding.properties)
+
+
+def report_tree(nodes):
+    """ Log the findings for a scanned tree and return the exit code
+
+    2 if any change set in the tree removes or replaces a stateful resource,
+    otherwise 1 if any nested change set could not be scanned, otherwise 0.
+    """
+    detected = False
+    failed = False
+    for node in sorted(nodes, key=lambda node: node.path):
+        label = '/'.join(node.path) or 'root'
+        if node.error is not None and not node.path:
+            raise node.error
+        if node.error is not None:
+            LOGGER.error('Nested change set %s (%s): %s', label, node.change_set, node.error)
+            failed = True
+            continue
+        LOGGER.info('Scanned change set %s (%s): %d stateful changes, %d nested',
+                    label, node.change_set, len(node.findings), len(node.children))
+        for finding in node.findings:
+            cfnsafeset.core.log_finding(qualified(finding, node.path))
+            detected = True
+    if detected:
+        return 2
+    return 1 if failed else 0
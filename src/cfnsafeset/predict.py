@@ -0,0 +1,274 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import logging
+import os
+import yaml
+from cfnsafeset.exceptions import CfnSafesetError, TemplateError
+
+LOGGER = logging.getLogger('cfnsafeset')
+INDEX_FILE = '/data/replacement-index.json'
+REFERENCE_KEYS = ('Ref', 'Fn::GetAtt')
+
+
+class TemplateLoader(getattr(yaml, 'CSafeLoader', yaml.SafeLoader)):  # pylint: disable=R0901
+    """ YAML loader that understands CloudFormation short-form intrinsics """
+
+
+def _construct_intrinsic(loader, tag_suffix, node):
+    """ Turn !Ref x into {'Ref': x} and !Sub y into {'Fn::Sub': y} """
+    if isinstance(node, yaml.ScalarNode):
+        value = loader.construct_scalar(node)
+    elif isinstance(node, yaml.SequenceNode):
+        value = loader.construct_sequence(node, deep=True)
+    else:
+        value = loader.construct_mapping(node, deep=True)
+    if tag_suffix == 'Ref':
+        return {'Ref': value}
+    if tag_suffix == 'GetAtt' and hasattr(value, 'split'):
+        value = value.split('.', 1)
+    return {'Fn::' + tag_suffix: value}
+
+
+TemplateLoader.add_multi_constructor('!', _construct_intrinsic)
+
+
+def load_template(filename):
+    """ Load a JSON or YAML CloudFormation template """
+    try:
+        with open(filename) as template_file:
+            template = yaml.load(template_file, Loader=TemplateLoader)
+    except IOError as err:
+        raise TemplateError('Cannot read template %s: %s' % (filename, err))
+    except yaml.YAMLError as err:
+        raise TemplateError('Cannot parse template %s: %s' % (filename, err))
+    if not isinstance(template, dict):
+        raise TemplateError('Template %s is not a mapping' % filename)
+    return template
+
+
+def load_index(index_file=None):
+    """ Load a replacement index; defaults to the one packaged with cfn-safeset
+
+    Returns a dict of resource type to (immutable, conditional) frozensets.
+    """
+    if index_file is None:
+        index_file = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), INDEX_FILE.lstrip('/'))
+    try:
+        with open(index_file) as index_stream:
+            index = json.load(index_stream)
+    except (IOError, ValueError) as err:
+        raise CfnSafesetError('Cannot load replacement index %s: %s' % (index_file, err))
+    return dict(
+        (resource_type, (frozenset(entry.get('Immutable', [])),
+                         frozenset(entry.get('Conditional', []))))
+        for resource_type, entry in index['ResourceTypes'].items())
+
+
+def build_index(spec):
+    """ Replacement index from a CloudFormation resource specification document
+
+    Only top-level resource properties are indexed; their UpdateType says
+    whether changing them always (Immutable) or sometimes (Conditional)
+    replaces the resource. Every type is listed, even with no such
+    properties, so it is known never to be replaced.
+    """
+    resource_types = {}
+    for resource_type, definition in sorted(spec.get('ResourceTypes', {}).items()):
+        immutable = []
+        conditional = []
+        for name, prop in sorted(definition.get('Properties', {}).items()):
+            update_type = prop.get('UpdateType')
+            if update_type == 'Immutable':
+                immutable.append(name)
+            elif update_type == 'Conditional':
+                conditional.append(name)
+        resource_types[resource_type] = {'Immutable': immutable, 'Conditional': conditional}
+    return {
+        'Source': spec.get('ResourceSpecificationVersion', 'unknown'),
+        'ResourceTypes': resource_types,
+    }
+
+
+def references(value, logical_ids):
+    """ Logical IDs in logical_ids that a property value refers to """
+    found = set()
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, dict):
+            for key, child in item.items():
+                if key in REFERENCE_KEYS:
+                    target = child[0] if isinstance(child, list) and child else child
+                    if not isinstance(target, (dict, list)) and target in logical_ids:
+                        found.add(target)
+                stack.append(child)
+        elif isinstance(item, list):
+            stack.extend(item)
+    return found
+
+
+def _detail(name, recreation, source='DirectModification', causing_entity=None):
+    """ One Details entry in describe_change_set form """
+    detail = {
+        'Target': {
+            'Attribute': 'Properties',
+            'Name': name,
+            'RequiresRecreation': recreation,
+        },
+        'Evaluation': 'Static',
+        'ChangeSource': source,
+    }
+    if causing_entity:
+        detail['CausingEntity'] = causing_entity
+    return detail
+
+
+def _recreation(name, immutable, conditional):
+    """ RequiresRecreation value for a changed property """
+    if name in immutable:
+        return 'Always'
+    if name in conditional:
+        return 'Conditionally'
+    return 'Never'
+
+
+def _replacement(details):
+    """ Replacement value implied by a list of Details """
+    recreations = set(detail['Target']['RequiresRecreation'] for detail in details)
+    if 'Always' in recreations:
+        return 'True'
+    if 'Conditionally' in recreations:
+        return 'Conditional'
+    return 'False'
+
+
+def predict_changes(deployed, proposed, index):
+    """ Predict the Changes of a change set from two templates
+
+    Removed resources become Remove actions; changed properties are looked
+    up in the replacement index. Replacements then propagate to resources
+    whose immutable properties Ref or GetAtt a replaced resource, and
+    conditional replacements propagate as conditional ones. Parameter
+    values and other intrinsics are not resolved.
+
+    Types the index does not know are assumed, with a warning, to be
+    conditionally replaced by any property change or reference to a
+    resource that may be replaced, so a replacement never stops at them.
+    """
+    old_resources = deployed.get('Resources') or {}
+    new_resources = proposed.get('Resources') or {}
+    changes = {}
+    warned = set()
+
+    def unknown(logical_id, resource_type):
+        """ Boolean check if a resource's type must be guessed; warns once per resource """
+        if resource_type in index:
+            return False
+        if logical_id not in warned:
+            warned.add(logical_id)
+            LOGGER.warning('%s (%s) is not in the replacement index; assuming it may be '
+                           'replaced', logical_id, resource_type)
+        return True
+
+    for logical_id in sorted(old_resources):
+        old = old_resources[logical_id]
+        if logical_id not in new_resources:
+            changes[logical_id] = {
+                'Action': 'Remove',
+                'LogicalResourceId': logical_id,
+                'ResourceType': old.get('Type'),
+                'Details': [],
+            }
+            continue
+        new = new_resources[logical_id]
+        old_props = old.get('Properties') or {}
+        new_props = new.get('Properties') or {}
+        if old.get('Type') != new.get('Type'):
+            details = [_detail(name, 'Always') for name in sorted(set(old_props) | set(new_props))]
+        else:
+            changed = [name for name in sorted(set(old_props) | set(new_props))
+                       if old_props.get(name) != new_props.get(name)]
+            if changed and unknown(logical_id, new.get('Type')):
+                details = [_detail(name, 'Conditionally') for name in changed]
+            else:
+                immutable, conditional = index.get(
+                    new.get('Type'), (frozenset(), frozenset()))
+                details = [_detail(name, _recreation(name, immutable, conditional))
+                           for name in changed]
+        if details:
+            changes[logical_id] = {
+                'Action': 'Modify',
+                'LogicalResourceId': logical_id,
+                'ResourceType': new.get('Type'),
+                'Replacement': _replacement(details),
+                'Scope': ['Properties'],
+                'Details': details,
+            }
+
+    # Replacement ('True' or 'Conditional') of every resource that may be replaced
+    replaced = dict((logical_id, change['Replacement']) for logical_id, change in changes.items()
+                    if change.get('Replacement') in ('True', 'Conditional'))
+    pending = set(replaced)
+    while pending:
+        # Re-check only resources that refer to something newly (or now surely) replaced
+        newly_replaced = pending
+        pending = set()
+        for logical_id in sorted(set(old_resources) & set(new_resources)):
+            if replaced.get(logical_id) == 'True':
+                continue
+            resource = new_resources[logical_id]
+            properties = resource.get('Properties') or {}
+            indexed = resource.get('Type') in index
+            if indexed:
+                names = sorted(index[resource.get('Type')][0])
+            else:
+                names = sorted(properties)
+            details = []
+            for name in names:
+                for target in sorted(references(properties.get(name), newly_replaced)):
+                    if indexed and replaced[target] == 'True':
+                        recreation = 'Always'
+                    else:
+                        recreation = 'Conditionally'
+                    details.append(_detail(name, recreation, 'ResourceReference', target))
+            if not details:
+                continue
+            unknown(logical_id, resource.get('Type'))
+            change = changes.setdefault(logical_id, {
+                'Action': 'Modify',
+                'LogicalResourceId': logical_id,
+                'ResourceType': resource.get('Type'),
+                'Scope': ['Properties'],
+                'Details': [],
+            })
+            change['Details'].extend(detail for detail in details
+                                     if detail not in change['Details'])
+            change['Replacement'] = _replacement(change['Details'])
+            if change['Replacement'] != replaced.get(logical_id, 'False'):
+                replaced[logical_id] = change['Replacement']
+                pending.add(logical_id)
+
+    return [{'Type': 'Resource', 'ResourceChange': changes[logical_id]}
+            for logical_id in sorted(changes)]
+
+
+def predict(deployed_file, proposed_file, index_file=None):
+    """ Predicted Changes for moving a stack from one template to another """
+    return predict_changes(
+        load_template(deployed_file), load_template(proposed_file), load_index(index_file))
@@ -0,0 +1,133 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+import zlib
+import cfnsafeset.cache
+import cfnsafeset.core
+
+LOGGER = logging.getLogger('cfnsafeset')
+RESULTS_DIR = 'results'
+# Change sets are immutable once created, so only these are cached
+CACHEABLE_STATUS = 'CREATE_COMPLETE'
+
+
+def config_digest(config):
+    """ Stable hash of a loaded config, used to key cached verdicts """
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _result_path(change_set_id):
+    """ Cache file for a change set ARN """
+    key = hashlib.sha1(change_set_id.encode('utf-8')).hexdigest()
+    return os.path.join(cfnsafeset.cache.get_cache_dir(), RESULTS_DIR, key + '.json.z')
+
+
+def load_result(change_set_id, max_age):
+    """ Return the cached entry for a change set ARN, or None """
+    path = _result_path(change_set_id)
+    try:
+        if time.time() - os.path.getmtime(path) > max_age:
+            return None
+        with open(path, 'rb') as cache_file:
+            entry = json.loads(zlib.decompress(cache_file.read()).decode('utf-8'))
+    except (IOError, OSError, ValueError, zlib.error):
+        return None
+    if entry.get('ChangeSetId') != change_set_id:
+        return None
+    return entry
+
+
+def store_result(entry, max_age, max_entries):
+    """ Write a cache entry and evict old ones; failures are only logged """
+    path = _result_path(entry['ChangeSetId'])
+    try:
+        cfnsafeset.cache.atomic_write(
+            path, zlib.compress(json.dumps(entry).encode('utf-8')))
+        prune_results(max_age, max_entries)
+    except (IOError, OSError) as err:
+        LOGGER.debug('Could not write result cache %s: %s', path, err)
+
+
+def prune_results(max_age, max_entries, subdir=RESULTS_DIR):
+    """ Remove entries older than max_age, then the oldest beyond max_entries """
+    directory = os.path.join(cfnsafeset.cache.get_cache_dir(), subdir)
+    now = time.time()
+    entries = []
+    for name in os.listdir(directory):
+        if name.startswith('.tmp-'):
+            # In-flight write from another job
+            continue
+        path = os.path.join(directory, name)
+        try:
+            mtime = os.path.getmtime(path)
+            if now - mtime <= max_age:
+                entries.append((mtime, path))
+                continue
+            os.remove(path)
+        except OSError:
+            # Another job removed or replaced it first
+            continue
+    entries.sort(reverse=True)
+    for _, path in entries[max_entries:]:
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+
+
+def check_change_set(args, digest, monitored_change_types, stateful_resources,
+                     cf_client=None, fail_fast=False):
+    """ Check a live change set, using and filling the result cache
+
+    A hit needs the change set ARN: names can be reused, so only -c given as
+    an ARN skips the API call. Fetched change sets are cached under their
+    ChangeSetId once CloudFormation reports them as CREATE_COMPLETE.
+    """
+    entry = None
+    if args.changeset.startswith('arn:'):
+        entry = load_result(args.changeset, args.cache_max_age)
+    if entry is not None:
+        LOGGER.debug('Using cached change set %s', entry['ChangeSetId'])
+        verdict = entry['Verdicts'].get(digest)
+        if verdict is False:
+            LOGGER.info('Cached verdict for %s: no stateful changes', entry['ChangeSetId'])
+            return False
+        changes = entry['Changes']
+    else:
+        metadata = {}
+        changes = list(cfnsafeset.core.get_change_set(
+            args.changeset, args.stack, args.region, args.profile,
+            cf_client=cf_client, metadata=metadata, wait_timeout=args.wait_timeout))
+        if metadata.get('Status') != CACHEABLE_STATUS or not metadata.get('ChangeSetId'):
+            return cfnsafeset.core.detect_stateful_replace(
+                changes, monitored_change_types, stateful_resources, fail_fast)
+        entry = {
+            'ChangeSetId': metadata['ChangeSetId'],
+            'Changes': changes,
+            'Verdicts': {},
+        }
+    # A fail-fast verdict is still a complete verdict, so it is cached as usual
+    verdict = cfnsafeset.core.detect_stateful_replace(
+        changes, monitored_change_types, stateful_resources, fail_fast)
+    if entry['Verdicts'].get(digest) != verdict:
+        entry['Verdicts'][digest] = verdict
+        store_result(entry, args.cache_max_age, args.cache_max_entries)
+    return verdict
@@ -0,0 +1,196 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import collections
+import cfnsafeset.core
+
+# Kinds of cause; all but RESOURCE are roots
+RESOURCE = 'Resource'
+PARAMETER = 'Parameter'
+TEMPLATE = 'Template'
+AUTOMATIC = 'Automatic'
+REMOVED = 'Removed'
+ROOT_LABELS = {
+    RESOURCE: 'resource %s',
+    PARAMETER: 'parameter %s',
+    TEMPLATE: 'template change to %s',
+    AUTOMATIC: 'automatic update of %s',
+    REMOVED: '%s removed from the template',
+}
+
+
+def detail_causes(logical_id, details):
+    """ (kind, name) causes of a list of change details, in order and without duplicates
+
+    A Dynamic DirectModification of a target that also has a Static detail
+    with a CausingEntity only says the value may change because of that
+    entity, so it is not a cause of its own.
+    """
+    explained = set(
+        (detail['Target'].get('Attribute'), detail['Target'].get('Name'))
+        for detail in details
+        if detail.get('Evaluation') == 'Static' and detail.get('CausingEntity'))
+    causes = collections.OrderedDict()
+    for detail in details:
+        source = detail.get('ChangeSource')
+        entity = detail.get('CausingEntity')
+        if source in ('ResourceReference', 'ResourceAttribute') and entity:
+            cause = (RESOURCE, entity.split('.', 1)[0])
+        elif source == 'ParameterReference' and entity:
+            cause = (PARAMETER, entity)
+        elif source == 'Automatic':
+            cause = (AUTOMATIC, logical_id)
+        elif source == 'DirectModification':
+            target = (detail['Target'].get('Attribute'), detail['Target'].get('Name'))
+            if detail.get('Evaluation') == 'Dynamic' and target in explained:
+                continue
+            cause = (TEMPLATE, logical_id)
+        else:
+            continue
+        causes[cause] = None
+    return list(causes)
+
+
+class ChangeGraph(object):
+    """ Resource changes indexed by logical ID, linked by their CausingEntity
+
+    Roots are resolved once per resource with an iterative depth-first
+    search and memoised, so tracing every finding of a change set takes
+    time linear in the number of changes and details, plus the length of the
+    paths returned. Cycles are cut where they are found.
+    """
+
+    def __init__(self, resource_changes=()):
+        self.changes = {}
+        self.causes = {}
+        # Logical ID -> OrderedDict of root -> next resource towards it (None if direct)
+        self._roots = {}
+        for resource_change in resource_changes:
+            self.add(resource_change)
+
+    def add(self, resource_change):
+        """ Index a resource change and its causes """
+        logical_id = resource_change['LogicalResourceId']
+        self.changes[logical_id] = resource_change
+        self.causes[logical_id] = detail_causes(
+            logical_id, resource_change.get('Details', []))
+
+    def _linked(self, causes):
+        """ Changed resources among causes """
+        return [name for kind, name in causes if kind == RESOURCE and name in self.changes]
+
+    def _combine(self, causes):
+        """ Roots reached through causes, with the first hop to each """
+        roots = collections.OrderedDict()
+        for cause in causes:
+            kind, name = cause
+            if kind == RESOURCE and name in self.changes:
+                # Missing only where a cycle was cut
+                for root in self._roots.get(name, ()):
+                    roots.setdefault(root, name)
+            else:
+                roots.setdefault(cause, None)
+        return roots
+
+    def _resolve(self, start):
+        """ Memoise the roots of start and every resource it depends on """
+        if start in self._roots:
+            return
+        on_path = set([start])
+        stack = [(start, iter(self._linked(self.causes[start])))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if child not in self._roots and child not in on_path:
+                    on_path.add(child)
+                    stack.append((child, iter(self._linked(self.causes[child]))))
+                    break
+            else:
+                self._roots[node] = self._combine(self.causes[node])
+                on_path.discard(node)
+                stack.pop()
+
+    def roots(self, logical_id):
+        """ Roots of every change to a resource, with the first hop to each """
+        self._resolve(logical_id)
+        return self._roots[logical_id]
+
+    def path(self, hop, root):
+        """ Resources from hop to the one that root changes directly """
+        path = []
+        while hop is not None:
+            path.append(hop)
+            hop = self._roots[hop][root]
+        return path
+
+    def trace(self, finding):
+        """ (root, path) for each root change behind a Finding
+
+        A Replace is traced through the details of the properties that force
+        it, so properties approved by a policy are left out.
+        """
+        if finding.action == 'Remove':
+            return [((REMOVED, finding.logical_id), [])]
+        properties = set(finding.properties)
+        details = [
+            detail for detail in self.changes[finding.logical_id].get('Details', [])
+            if detail['Target'].get('Attribute') == 'Properties'
+            and detail['Target'].get('Name') in properties]
+        causes = detail_causes(finding.logical_id, details)
+        for name in self._linked(causes):
+            self._resolve(name)
+        return [(root, self.path(hop, root))
+                for root, hop in self._combine(causes).items()]
+
+
+def build_graph(changes, extractors):
+    """ Index and link the monitored changes of a change set in one pass """
+    graph = ChangeGraph()
+    for change in changes:
+        extract = extractors.get(change['Type'])
+        if extract is not None:
+            graph.add(extract(change))
+    return graph
+
+
+def describe_root(root):
+    """ Human readable root change """
+    kind, name = root
+    return ROOT_LABELS[kind] % name
+
+
+def describe_hop(resource_change):
+    """ Logical ID and what happens to a resource on the way to a root """
+    action = resource_change['Action']
+    if cfnsafeset.core.is_replace(resource_change):
+        action = 'Replace'
+    return '%s (%s)' % (resource_change['LogicalResourceId'], action)
+
+
+def report(changes, classifier):
+    """ Print the root changes behind each stateful Remove or Replace """
+    changes = list(changes)
+    graph = build_graph(changes, classifier.extractors)
+    findings = list(cfnsafeset.core.iter_findings(changes, classifier.extractors, classifier))
+    if not findings:
+        return
+    print('Root causes:')
+    for finding in findings:
+        print('  %s %s (%s):' % (finding.action, finding.logical_id, finding.resource_type))
+        for root, path in graph.trace(finding):
+            hops = [describe_hop(graph.changes[hop]) for hop in path]
+            print('    <- %s' % ' <- '.join(hops + [describe_root(root)]))
@@ -0,0 +1,342 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import argparse
+import logging
+import random
+import threading
+import time
+import uuid
+import zlib
+from xml.sax.saxutils import escape
+import cfnsafeset.synthetic
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs
+except ImportError:  # Python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs
+
+LOGGER = logging.getLogger('cfnsafeset')
+NAMESPACE = 'http://cloudformation.amazonaws.com/doc/2010-05-15/'
+CREATION_TIME = '2019-01-01T00:00:00.000Z'
+
+
+def to_xml(value):
+    """ Serialise a response value the way the query protocol does
+
+    Dicts become elements, lists become <member> entries and booleans are
+    lower case.
+    """
+    if isinstance(value, dict):
+        return ''.join('<%s>%s</%s>' % (key, to_xml(item), key)
+                       for key, item in value.items() if item is not None)
+    if isinstance(value, (list, tuple)):
+        return ''.join('<member>%s</member>' % to_xml(item) for item in value)
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return escape(str(value))
+
+
+class Account(object):
+    """ Synthetic stacks and change sets served by the stand-in
+
+    Change sets are generated on first use from cfnsafeset.synthetic with a
+    seed derived from their name, so every run serves the same data. Nested
+    stack entries point at change sets that are generated when asked for.
+    """
+
+    def __init__(self, stacks=10, change_sets=1, changes=200, nested_ratio=0.0, seed=0):
+        self.stack_names = ['stack-%04d' % index for index in range(stacks)]
+        self.change_sets = change_sets
+        self.changes = changes
+        self.nested_ratio = nested_ratio
+        self.seed = seed
+        self._stacks = frozenset(self.stack_names)
+        self._documents = {}
+        self._nested = {}
+        self._lock = threading.Lock()
+
+    def has_stack(self, stack):
+        """ Boolean check if a stack is served """
+        return stack in self._stacks
+
+    def change_set_names(self, stack):
+        """ Names of a stack's change sets """
+        return ['%s-cs-%d' % (stack, index) for index in range(self.change_sets)]
+
+    def _seed(self, *parts):
+        """ Stable per-change-set seed (hash() of strings varies between runs) """
+        return zlib.crc32(repr((self.seed,) + parts).encode('utf-8')) & 0xffffffff
+
+    def _resolve(self, change_set, stack):
+        """ (stack, name) of a served change set given its name or ARN, or None """
+        if change_set.startswith('arn:'):
+            parts = change_set.split(':')[-1].split('/')
+            if len(parts) != 3:
+                return None
+            change_set = parts[1]
+            stack = stack or change_set.rsplit('-cs-', 1)[0]
+        if stack in self._stacks and change_set in self.change_set_names(stack):
+            return stack, change_set
+        return None
+
+    def _generate(self, name, stack, nested_ratio, seed):
+        """ Build one change set document, noting its nested change sets """
+        document = cfnsafeset.synthetic.generate_change_set(
+            name, stack, count=self.changes, nested_ratio=nested_ratio, seed=seed)
+        for change in document['Changes']:
+            child = change['ResourceChange'].get('ChangeSetId')
+            if child:
+                self._nested.setdefault(child, None)
+        return document
+
+    def describe(self, change_set, stack=None):
+        """ Full change set document by name and stack, or by ARN; None if unknown """
+        change_set = change_set or ''
+        with self._lock:
+            if change_set in self._nested:
+                if self._nested[change_set] is None:
+                    # Nested change sets are one level deep
+                    document = self._generate(
+                        change_set.split('/')[-2], 'nested', 0.0, self._seed(change_set))
+                    document['ChangeSetId'] = change_set
+                    self._nested[change_set] = document
+                return self._nested[change_set]
+            key = self._resolve(change_set, stack)
+            if key is None:
+                return None
+            if key not in self._documents:
+                self._documents[key] = self._generate(
+                    key[1], key[0], self.nested_ratio, self._seed(*key))
+            return self._documents[key]
+
+
+class Faults(object):
+    """ Latency, errors and throttling injected into every request
+
+    rate_limit throttles requests beyond that many per second, like
+    CloudFormation's own limits; throttle_rate and error_rate throttle or
+    fail that fraction of requests at random.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0,
+                 rate_limit=None, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tokens = float(rate_limit or 0)
+        self._updated = time.time()
+
+    def _over_limit(self):
+        """ Boolean check if this request exceeds rate_limit """
+        if not self.rate_limit:
+            return False
+        now = time.time()
+        self._tokens = min(self.rate_limit, self._tokens + (now - self._updated) * self.rate_limit)
+        self._updated = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    def pick(self):
+        """ (delay in seconds, error code or None) for one request """
+        with self._lock:
+            delay = self.latency * (1 + self.jitter * (2 * self._rng.random() - 1))
+            roll = self._rng.random()
+            if self._over_limit() or roll < self.throttle_rate:
+                return delay, 'Throttling'
+            if roll < self.throttle_rate + self.error_rate:
+                return delay, 'InternalFailure'
+            return delay, None
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    """ Local CloudFormation endpoint for DescribeChangeSet, ListChangeSets and ListStacks
+
+    Speaks the query protocol closely enough for botocore, so a client
+    created with endpoint_url pointing here works unchanged.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    ERRORS = {
+        'Throttling': (400, 'Sender', 'Rate exceeded'),
+        'InternalFailure': (500, 'Receiver', 'Injected failure'),
+        'ChangeSetNotFound': (404, 'Sender', 'ChangeSet does not exist'),
+        'InvalidAction': (400, 'Sender', 'Unsupported action'),
+    }
+
+    def __init__(self, address=('127.0.0.1', 0), account=None, faults=None, page_size=100):
+        HTTPServer.__init__(self, address, StandInHandler)
+        self.account = account or Account()
+        self.faults = faults or Faults()
+        self.page_size = page_size
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+        self.latencies = []
+
+    @property
+    def url(self):
+        """ endpoint_url for clients """
+        return 'http://%s:%d' % self.server_address[:2]
+
+    def count(self, key, latency=None):
+        """ Record a request outcome and, for served requests, its latency """
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+            if latency is not None:
+                self.latencies.append(latency)
+
+    def start(self):
+        """ Serve on a background thread """
+        thread = threading.Thread(target=self.serve_forever, name='cfnsafeset-standin')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def stop(self):
+        """ Stop serving and close the socket """
+        self.shutdown()
+        self.server_close()
+
+    def handle_action(self, action, params):
+        """ Result dict for an action, or an error code """
+        if action == 'DescribeChangeSet':
+            document = self.account.describe(params.get('ChangeSetName'), params.get('StackName'))
+            if document is None:
+                return 'ChangeSetNotFound'
+            start = int(params.get('NextToken') or 0)
+            end = start + self.page_size
+            result = dict((key, value) for key, value in document.items() if key != 'Changes')
+            result['CreationTime'] = CREATION_TIME
+            result['Changes'] = document['Changes'][start:end]
+            if end < len(document['Changes']):
+                result['NextToken'] = str(end)
+            return result
+        if action == 'ListChangeSets':
+            stack = params.get('StackName')
+            if not self.account.has_stack(stack):
+                return {'Summaries': []}
+            summaries = []
+            for name in self.account.change_set_names(stack):
+                document = self.account.describe(name, stack)
+                summaries.append({
+                    'StackName': stack, 'ChangeSetName': name,
+                    'ChangeSetId': document['ChangeSetId'], 'StackId': document['StackId'],
+                    'ExecutionStatus': 'AVAILABLE', 'Status': 'CREATE_COMPLETE',
+                    'CreationTime': CREATION_TIME,
+                })
+            return {'Summaries': summaries}
+        if action == 'ListStacks':
+            start = int(params.get('NextToken') or 0)
+            end = start + self.page_size
+            result = {'StackSummaries': [{
+                'StackName': name, 'StackId': 'arn:aws:cloudformation:%s:%s:stack/%s/%s' % (
+                    cfnsafeset.synthetic.REGION, cfnsafeset.synthetic.ACCOUNT, name,
+                    uuid.uuid5(uuid.NAMESPACE_URL, name)),
+                'StackStatus': 'UPDATE_COMPLETE', 'CreationTime': CREATION_TIME,
+            } for name in self.account.stack_names[start:end]]}
+            if end < len(self.account.stack_names):
+                result['NextToken'] = str(end)
+            return result
+        return 'InvalidAction'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """ One query protocol request """
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):  # pylint: disable=C0103
+        """ Dispatch on Action, after any injected delay or fault """
+        start = time.time()
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length).decode('utf-8')
+        params = dict((key, values[0]) for key, values in parse_qs(body).items())
+        action = params.get('Action', '')
+        delay, error = self.server.faults.pick()
+        if delay > 0:
+            time.sleep(delay)
+        result = error or self.server.handle_action(action, params)
+        if isinstance(result, dict):
+            self.server.count(action, time.time() - start)
+            self.respond(200, '<%sResponse xmlns="%s"><%sResult>%s</%sResult>'
+                         '<ResponseMetadata><RequestId>%s</RequestId></ResponseMetadata>'
+                         '</%sResponse>' % (action, NAMESPACE, action, to_xml(result),
+                                            action, uuid.uuid4(), action))
+            return
+        self.server.count(result)
+        status, error_type, message = self.server.ERRORS[result]
+        self.respond(status, '<ErrorResponse xmlns="%s"><Error><Type>%s</Type><Code>%s</Code>'
+                     '<Message>%s</Message></Error><RequestId>%s</RequestId></ErrorResponse>' % (
+                         NAMESPACE, error_type, result, message, uuid.uuid4()))
+
+    def respond(self, status, text):
+        """ Send an XML body """
+        payload = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/xml')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        """ Route access logs to debug logging """
+        LOGGER.debug('standin: ' + format, *args)
+
+
+def main():
+    """ Run a stand-in from the command line until interrupted """
+    parser = argparse.ArgumentParser(description='Local CloudFormation stand-in for cfn-safeset')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8642)
+    parser.add_argument('--stacks', type=int, default=10)
+    parser.add_argument('--change-sets', type=int, default=1, help='Change sets per stack')
+    parser.add_argument('--changes', type=int, default=200, help='Changes per change set')
+    parser.add_argument('--nested-ratio', type=float, default=0.0)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Latency spread, 0 to 1')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, help='Throttle above this many requests/s')
+    args = parser.parse_args()
+    server = StandIn(
+        (args.host, args.port),
+        Account(args.stacks, args.change_sets, args.changes, args.nested_ratio),
+        Faults(args.latency, args.jitter, args.error_rate, args.throttle_rate,
+               args.rate_limit),
+        args.page_size)
+    print('CloudFormation stand-in listening on %s' % server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import logging
+import threading
+import cfnsafeset.core
+import cfnsafeset.credentials
+from cfnsafeset.clients import ClientPool
+
+try:
+    import queue
+except ImportError:  # Python 2
+    import Queue as queue
+
+LOGGER = logging.getLogger('cfnsafeset')
+# Every stack status except DELETE_COMPLETE; only live stacks have change sets
+STACK_STATUSES = [
+    'CREATE_IN_PROGRESS', 'CREATE_FAILED', 'CREATE_COMPLETE',
+    'ROLLBACK_IN_PROGRESS', 'ROLLBACK_FAILED', 'ROLLBACK_COMPLETE',
+    'DELETE_IN_PROGRESS', 'DELETE_FAILED',
+    'UPDATE_IN_PROGRESS', 'UPDATE_COMPLETE_CLEANUP_IN_PROGRESS', 'UPDATE_COMPLETE',
+    'UPDATE_FAILED', 'UPDATE_ROLLBACK_IN_PROGRESS', 'UPDATE_ROLLBACK_FAILED',
+    'UPDATE_ROLLBACK_COMPLETE_CLEANUP_IN_PROGRESS', 'UPDATE_ROLLBACK_COMPLETE',
+    'REVIEW_IN_PROGRESS', 'IMPORT_IN_PROGRESS', 'IMPORT_COMPLETE',
+    'IMPORT_ROLLBACK_IN_PROGRESS', 'IMPORT_ROLLBACK_FAILED', 'IMPORT_ROLLBACK_COMPLETE',
+]
+
+
+class SweepResult(object):
+    """ Outcome of scanning one pending change set """
+    __slots__ = ('region', 'stack', 'change_set', 'findings', 'error', 'role')
+
+    def __init__(self, region, stack, change_set, findings=(), error=None, role=None):
+        self.region = region
+        self.stack = stack
+        self.change_set = change_set
+        self.findings = list(findings)
+        self.error = error
+        self.role = role
+
+    @property
+    def location(self):
+        """ Region, prefixed by the account ID when scanned through a role """
+        if self.role is None:
+            return self.region
+        return '%s/%s' % (cfnsafeset.credentials.account_id(self.role), self.region)
+
+
+def iter_stacks(cf_client):
+    """ Yield the name of every live stack, one ListStacks page at a time """
+    kwargs = {'StackStatusFilter': STACK_STATUSES}
+    while True:
+        response = cf_client.list_stacks(**kwargs)
+        for summary in response.get('StackSummaries', []):
+            yield summary['StackName']
+        if not response.get('NextToken'):
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+
+def iter_available_change_sets(cf_client, stack):
+    """ Yield the ARN of each change set of a stack that can be executed """
+    kwargs = {'StackName': stack}
+    while True:
+        response = cf_client.list_change_sets(**kwargs)
+        for summary in response.get('Summaries', []):
+            if summary.get('ExecutionStatus') == 'AVAILABLE':
+                yield summary['ChangeSetId']
+        if not response.get('NextToken'):
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+
+def merge(iterables, depth, jobs=8):
+    """ Iterate several iterables concurrently, yielding items as they arrive
+
+    Iterables are drained on a pool of at most `jobs` threads; the rest wait
+    for a free thread. The shared buffer holds at most depth items.
+    Exceptions are re-raised in the consumer.
+    """
+    from multiprocessing.pool import ThreadPool  # pylint: disable=C0415
+    iterables = list(iterables)
+    if not iterables:
+        return
+    items = queue.Queue(maxsize=depth)
+    done = object()
+    stopped = threading.Event()
+
+    def put(entry):
+        """ Add to the shared buffer; False once the consumer has gone """
+        while not stopped.is_set():
+            try:
+                items.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce(iterable):
+        """ Feed one iterable into the shared buffer """
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+        except Exception as err:  # pylint: disable=W0703
+            put((done, err))
+            return
+        put((done, None))
+
+    pool = ThreadPool(max(1, min(jobs, len(iterables))))
+    try:
+        for iterable in iterables:
+            pool.apply_async(produce, (iterable,))
+        remaining = len(iterables)
+        while remaining:
+            item, error = items.get()
+            if item is done:
+                remaining -= 1
+                if error is not None:
+                    raise error
+                continue
+            yield item
+    finally:
+        # Release producers blocked on a full buffer so the pool can be joined
+        stopped.set()
+        pool.terminate()
+
+
+def sweep(regions, profile, classifier, jobs=8, clients=None, roles=None):
+    """ Scan every AVAILABLE change set in the given regions
+
+    With roles, every region of every role's account is swept, assuming the
+    roles concurrently through the client pool's credential cache. Stacks
+    are listed in all regions in parallel and their change sets are scanned
+    on a pool of `jobs` threads. Results are yielded as each stack finishes;
+    only a bounded number of stacks is queued or in flight.
+    """
+    from multiprocessing.pool import ThreadPool  # pylint: disable=C0415
+    if clients is None:
+        clients = ClientPool()
+
+    def region_stacks(role, region):
+        """ (role, region, stack, error) for each stack in one account and region """
+        try:
+            for stack in iter_stacks(clients.get(region, profile, role)):
+                yield role, region, stack, None
+        except Exception as err:  # pylint: disable=W0703
+            # Report the region and carry on with the others
+            yield role, region, None, err
+
+    def scan_stack(work):
+        """ Scan the pending change sets of one stack """
+        role, region, stack, error = work
+        if error is not None:
+            return [SweepResult(region, stack, None, error=error, role=role)]
+        results = []
+        try:
+            cf_client = clients.get(region, profile, role)
+            change_sets = list(iter_available_change_sets(cf_client, stack))
+        except Exception as err:  # pylint: disable=W0703
+            return [SweepResult(region, stack, None, error=err, role=role)]
+        for change_set in change_sets:
+            try:
+                findings = cfnsafeset.core.iter_findings(
+                    cfnsafeset.core.get_change_set(
+                        change_set, stack, region, profile, cf_client=cf_client),
+                    classifier.extractors, classifier)
+                results.append(SweepResult(region, stack, change_set, findings, role=role))
+            except Exception as err:  # pylint: disable=W0703
+                results.append(SweepResult(
+                    region, stack, change_set, error=err, role=role))
+        return results
+
+    pool = ThreadPool(max(1, jobs))
+    try:
+        stacks = merge([region_stacks(role, region)
+                        for role in roles or [None] for region in regions], jobs, jobs)
+        for results in cfnsafeset.core.imap_unordered_bounded(pool, scan_stack, stacks, jobs * 2):
+            for result in results:
+                yield result
+    finally:
+        pool.terminate()
+
+
+def report_sweep(results, fail_fast=False):
+    """ Log sweep results as they arrive and return the exit code
+
+    2 if any change set removes or replaces a stateful resource, otherwise 1
+    if any stack or change set could not be scanned, otherwise 0. With
+    fail_fast, stop at the first stateful change set, which closes results
+    and so stops the sweep.
+    """
+    detected = False
+    failed = False
+    scanned = 0
+    for result in results:
+        if result.error is not None:
+            LOGGER.error('Cannot scan %s in stack %s (%s): %s',
+                         result.change_set or 'change sets', result.stack or 'list',
+                         result.location, result.error)
+            failed = True
+            continue
+        scanned += 1
+        if not result.findings:
+            LOGGER.info('No stateful changes in %s', result.change_set)
+            continue
+        detected = True
+        LOGGER.warning('Change set %s for stack %s (%s):',
+                       result.change_set, result.stack, result.location)
+        for finding in result.findings:
+            cfnsafeset.core.log_finding(finding)
+        if fail_fast:
+            cfnsafeset.core.stop_iteration(results)
+            break
+    LOGGER.info('Swept %d change sets', scanned)
+    if detected:
+        return 2
+    return 1 if failed else 0
@@ -0,0 +1,138 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import random
+import uuid
+
+ACCOUNT = '123456789012'
+REGION = 'us-east-1'
+NESTED_STACK_TYPE = 'AWS::CloudFormation::Stack'
+RESOURCE_TYPES = [
+    # (resource type, sample properties)
+    ('AWS::RDS::DBCluster', ['DatabaseName', 'Engine', 'VpcSecurityGroupIds', 'Port']),
+    ('AWS::RDS::DBInstance', ['DBInstanceClass', 'AllocatedStorage', 'DBName']),
+    ('AWS::DynamoDB::Table', ['KeySchema', 'TableName', 'BillingMode']),
+    ('AWS::EC2::Instance', ['ImageId', 'InstanceType', 'UserData', 'SubnetId']),
+    ('AWS::EC2::SecurityGroup', ['GroupDescription', 'SecurityGroupIngress']),
+    ('AWS::IAM::Role', ['AssumeRolePolicyDocument', 'Policies', 'RoleName']),
+    ('AWS::Lambda::Function', ['Code', 'Handler', 'Runtime', 'MemorySize']),
+    ('AWS::S3::Bucket', ['BucketName', 'VersioningConfiguration']),
+    ('AWS::SNS::Topic', ['TopicName', 'Subscription']),
+    ('AWS::SQS::Queue', ['QueueName', 'VisibilityTimeout']),
+]
+CHANGE_SOURCES = ['DirectModification', 'ResourceReference', 'ParameterReference',
+                  'ResourceAttribute', 'Automatic']
+
+
+def change_set_arn(name, rng):
+    """ Random but well-formed change set ARN """
+    return 'arn:aws:cloudformation:%s:%s:changeSet/%s/%s' % (
+        REGION, ACCOUNT, name, uuid.UUID(int=rng.getrandbits(128)))
+
+
+def make_detail(rng, properties, logical_ids):
+    """ One entry of a ResourceChange's Details list """
+    source = rng.choice(CHANGE_SOURCES)
+    detail = {
+        'Target': {
+            'Attribute': 'Properties',
+            'Name': rng.choice(properties),
+            'RequiresRecreation': rng.choice(['Never', 'Never', 'Conditionally', 'Always']),
+        },
+        'Evaluation': rng.choice(['Static', 'Dynamic']),
+        'ChangeSource': source,
+    }
+    if source in ('ResourceReference', 'ResourceAttribute') and logical_ids:
+        detail['CausingEntity'] = '%s.Arn' % rng.choice(logical_ids)
+    elif source == 'ParameterReference':
+        detail['CausingEntity'] = 'Param%d' % rng.randint(0, 9)
+    return detail
+
+
+def iter_changes(count=1000, details=4, nested_ratio=0.02, remove_ratio=0.05,
+                 replace_ratio=0.3, seed=0):
+    """ Yield synthetic Changes entries
+
+    Resource types are drawn from a mix of stateful and stateless types,
+    each Modify change carries about `details` Details entries and about
+    nested_ratio of the changes are nested stacks with their own ChangeSetId.
+    """
+    rng = random.Random(seed)
+    logical_ids = []
+    for index in range(count):
+        logical_id = 'Resource%d' % index
+        if rng.random() < nested_ratio:
+            resource_type, properties = NESTED_STACK_TYPE, ['TemplateURL', 'Parameters']
+        else:
+            resource_type, properties = rng.choice(RESOURCE_TYPES)
+        roll = rng.random()
+        if roll < remove_ratio:
+            action = 'Remove'
+        elif roll < remove_ratio + 0.1:
+            action = 'Add'
+        else:
+            action = 'Modify'
+        resource_change = {
+            'Action': action,
+            'LogicalResourceId': logical_id,
+            'ResourceType': resource_type,
+            'Scope': [],
+            'Details': [],
+        }
+        if action != 'Add':
+            resource_change['PhysicalResourceId'] = '%s-%08x' % (
+                logical_id.lower(), rng.getrandbits(32))
+        if action == 'Modify':
+            resource_change['Scope'] = ['Properties']
+            resource_change['Details'] = [
+                make_detail(rng, properties, logical_ids[-50:])
+                for _ in range(max(1, int(rng.gauss(details, 1))))]
+            replace = rng.random() < replace_ratio
+            resource_change['Replacement'] = 'True' if replace else 'False'
+            if replace:
+                resource_change['Details'][0]['Target']['RequiresRecreation'] = 'Always'
+        if resource_type == NESTED_STACK_TYPE and action != 'Remove':
+            resource_change['ChangeSetId'] = change_set_arn(logical_id, rng)
+        logical_ids.append(logical_id)
+        yield {'Type': 'Resource', 'ResourceChange': resource_change}
+
+
+def generate_change_set(name='synthetic', stack='synthetic-stack', **kwargs):
+    """ Build a describe_change_set style document; see iter_changes for options """
+    rng = random.Random(kwargs.get('seed', 0))
+    return {
+        'ChangeSetName': name,
+        'ChangeSetId': change_set_arn(name, rng),
+        'StackId': 'arn:aws:cloudformation:%s:%s:stack/%s/%s' % (
+            REGION, ACCOUNT, stack, uuid.UUID(int=rng.getrandbits(128))),
+        'StackName': stack,
+        'ExecutionStatus': 'AVAILABLE',
+        'Status': 'CREATE_COMPLETE',
+        'Changes': list(iter_changes(**kwargs)),
+    }
+
+
+def write_change_set(stream, name='synthetic', stack='synthetic-stack', **kwargs):
+    """ Write a change set document to a text stream one change at a time """
+    document = generate_change_set(name, stack, count=0)
+    del document['Changes']
+    stream.write(json.dumps(document)[:-1] + ', "Changes": [')
+    for index, change in enumerate(iter_changes(**kwargs)):
+        if index:
+            stream.write(',\n')
+        stream.write(json.dumps(change))
+    stream.write(']}\n')
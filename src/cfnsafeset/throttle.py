@@ -0,0 +1,182 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import logging
+import threading
+import time
+
+LOGGER = logging.getLogger('cfnsafeset')
+THROTTLE_CODES = frozenset([
+    'Throttling', 'ThrottlingException', 'ThrottledException',
+    'RequestLimitExceeded', 'TooManyRequestsException', 'RequestThrottled',
+])
+MAX_ATTEMPTS = 10
+
+
+class TokenBucket(object):
+    """ Token bucket whose rate backs off on throttling
+
+    The rate halves when CloudFormation throttles a call and, as calls
+    succeed again, doubles every `recovery` seconds since then, so every
+    thread sharing the bucket settles near the highest rate the account and
+    region sustain. Throttles within `recovery` seconds of the last halving
+    count as one burst, so a burst costs seconds, not minutes. This is the only client-side limiter; botocore retries in
+    standard mode.
+    """
+
+    def __init__(self, rate=8.0, burst=8, min_rate=0.5, max_rate=25.0, recovery=1.0,
+                 clock=time.time, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.recovery = recovery
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        # Rate and time of the last halving, which recovery grows from
+        self._base_rate = rate
+        self._base_time = self._updated
+        self._halved = None
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        """ Add the tokens earned since the last update """
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self):
+        """ Block until a request may be sent
+
+        The token is reserved straight away, possibly leaving the bucket in
+        debt, and the caller sleeps until that debt would have been repaid.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            self._sleep(wait)
+
+    def on_throttle(self):
+        """ Drop saved-up tokens and halve the rate, once per burst """
+        with self._lock:
+            self._tokens = min(self._tokens, 0.0)
+            now = self._clock()
+            if self._halved is not None and now - self._halved < self.recovery:
+                return
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._base_rate = self.rate
+            self._base_time = self._halved = now
+
+    def on_success(self):
+        """ Raise the rate again, doubling it every recovery seconds """
+        with self._lock:
+            elapsed = max(0.0, self._clock() - self._base_time)
+            self.rate = min(self.max_rate,
+                            self._base_rate * 2 ** (elapsed / self.recovery))
+
+
+class Stats(object):
+    """ Thread-safe counters for CloudFormation API traffic """
+    FIELDS = ('api_calls', 'attempts', 'throttles', 'retries')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = dict((field, 0) for field in self.FIELDS)
+
+    def incr(self, field, count=1):
+        """ Add to a counter """
+        with self._lock:
+            self._counts[field] += count
+
+    def snapshot(self):
+        """ Copy of the current counters """
+        with self._lock:
+            return dict(self._counts)
+
+
+STATS = Stats()
+_BUCKETS = {}
+_BUCKETS_LOCK = threading.Lock()
+
+
+def get_bucket(key):
+    """ Shared bucket for a (profile, region) key """
+    with _BUCKETS_LOCK:
+        if key not in _BUCKETS:
+            _BUCKETS[key] = TokenBucket()
+        return _BUCKETS[key]
+
+
+def is_throttle(parsed):
+    """ Boolean check if a parsed response is a throttling error """
+    return (parsed or {}).get('Error', {}).get('Code') in THROTTLE_CODES
+
+
+def instrument(cf_client, bucket, stats=STATS):
+    """ Route every attempt made by a client through a bucket and count it """
+
+    def on_request(**kwargs):  # pylint: disable=W0613
+        """ Emitted once per attempt, including retries """
+        bucket.acquire()
+        stats.incr('attempts')
+
+    def on_needs_retry(response=None, **kwargs):  # pylint: disable=W0613
+        """ Slow down as soon as a throttle is seen; never decides the retry """
+        if response is not None and is_throttle(response[1]):
+            stats.incr('throttles')
+            bucket.on_throttle()
+
+    def on_after_call(http_response=None, parsed=None, **kwargs):  # pylint: disable=W0613
+        """ Emitted once per API call after all retries """
+        stats.incr('api_calls')
+        stats.incr('retries', (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0))
+        if http_response is not None and http_response.status_code < 300:
+            bucket.on_success()
+
+    events = cf_client.meta.events
+    events.register('request-created.cloudformation', on_request)
+    events.register_first('needs-retry.cloudformation', on_needs_retry)
+    events.register('after-call.cloudformation', on_after_call)
+    return cf_client
+
+
+def client_config():
+    """ botocore config with standard retries, or legacy ones on old botocore
+
+    Not adaptive mode: its own client-side rate limiter would stack on top
+    of the shared TokenBucket and slow recovery from throttling further.
+    """
+    from botocore.config import Config  # pylint: disable=C0415
+    try:
+        return Config(retries={'mode': 'standard', 'max_attempts': MAX_ATTEMPTS})
+    except Exception:  # pylint: disable=W0703
+        return Config(retries={'max_attempts': MAX_ATTEMPTS})
+
+
+def create_client(session, region, profile, endpoint_url=None):
+    """ CloudFormation client with retries, rate limiting and counters
+
+    endpoint_url points the client somewhere other than AWS, such as
+    cfnsafeset.standin.
+    """
+    cf_client = session.client(
+        'cloudformation', region_name=region, config=client_config(),
+        endpoint_url=endpoint_url)
+    return instrument(cf_client, get_bucket((profile, region)))
@@ -0,0 +1,349 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import json
+import logging
+import os
+import select
+import signal
+import struct
+import sys
+import time
+import cfnsafeset.cache
+import cfnsafeset.core
+import cfnsafeset.files
+
+LOGGER = logging.getLogger('cfnsafeset')
+INDEX_DIR = 'watch'
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class Inotify(object):
+    """ Minimal ctypes binding for inotify on one directory
+
+    Only reports files that were closed after writing or moved in, so a
+    change set is never read while it is still being written. Raises
+    OSError where inotify is unavailable.
+    """
+
+    def __init__(self, directory):
+        if not sys.platform.startswith('linux'):
+            raise OSError(errno.ENOSYS, 'inotify is only available on Linux')
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, 'libc has no inotify support')
+        self.fd = libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        descriptor = libc.inotify_add_watch(
+            self.fd, os.path.abspath(directory).encode(sys.getfilesystemencoding()),
+            IN_CLOSE_WRITE | IN_MOVED_TO)
+        if descriptor < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), 'inotify_add_watch failed on %s' % directory)
+
+    def read(self, timeout):
+        """ File names that became ready within timeout seconds
+
+        None in the list means events were lost and the directory should be
+        rescanned.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 65536)
+        names = []
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                names.append(None)
+            elif name:
+                names.append(name.decode(sys.getfilesystemencoding()))
+        return names
+
+    def close(self):
+        """ Stop watching """
+        os.close(self.fd)
+
+
+class ScanIndex(object):
+    """ Persistent record of the files in a directory that were scanned
+
+    Each path keeps the size and mtime seen when it was scanned and the
+    sha1 of its content, so unchanged files are skipped without reading them
+    and renamed or copied files are skipped without parsing them again.
+    Entries recorded under a different config (by digest) are ignored, so
+    a config change scans every file again.
+    """
+
+    def __init__(self, path, config=None):
+        self.path = path
+        self.config = config
+        self.entries = {}
+        self.digests = {}
+        self.dirty = False
+
+    @classmethod
+    def for_directory(cls, directory, config=None):
+        """ Index stored in the cache directory for a watched directory """
+        key = hashlib.sha1(os.path.abspath(directory).encode('utf-8')).hexdigest()[:16]
+        index = cls(os.path.join(cfnsafeset.cache.get_cache_dir(), INDEX_DIR, key + '.json'),
+                    config)
+        index.load()
+        return index
+
+    def load(self):
+        """ Read the index; a missing or corrupt index starts empty """
+        try:
+            with open(self.path) as index_file:
+                self.entries = json.load(index_file)
+        except (IOError, ValueError):
+            self.entries = {}
+        stale = [name for name, entry in self.entries.items()
+                 if entry.get('Config') != self.config]
+        for name in stale:
+            del self.entries[name]
+        self.dirty = bool(stale)
+        self.digests = dict((entry['Digest'], entry) for entry in self.entries.values())
+
+    def save(self):
+        """ Write the index if it changed; failures are only logged """
+        if not self.dirty:
+            return
+        try:
+            cfnsafeset.cache.atomic_write(
+                self.path, json.dumps(self.entries, sort_keys=True).encode('utf-8'))
+            self.dirty = False
+        except (IOError, OSError) as err:
+            LOGGER.warning('Could not write watch index %s: %s', self.path, err)
+
+    def is_current(self, name, current):
+        """ Boolean check if a file is unchanged since it was scanned """
+        entry = self.entries.get(name)
+        return entry is not None and [entry['Size'], entry['MTime']] == list(current)
+
+    def record(self, name, current, digest, exit_code):
+        """ Remember the result of scanning a file """
+        entry = {'Size': current[0], 'MTime': current[1], 'Digest': digest,
+                 'ExitCode': exit_code, 'Config': self.config}
+        self.entries[name] = entry
+        self.digests[digest] = entry
+        self.dirty = True
+
+    def forget_missing(self, names):
+        """ Drop files that are no longer in the directory """
+        for name in set(self.entries) - set(names):
+            del self.entries[name]
+            self.dirty = True
+        self.digests = dict((entry['Digest'], entry) for entry in self.entries.values())
+
+
+class ReportSink(object):
+    """ Writes one JSON line per scanned file to a file or standard output """
+
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.stream = sys.stdout if filename in (None, '-') else open(filename, 'a')
+
+    def write(self, record):
+        """ Append a record and flush it straight away """
+        self.stream.write(json.dumps(record, sort_keys=True) + '\n')
+        self.stream.flush()
+
+    def close(self):
+        """ Close the report file """
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+def signature(path):
+    """ (size, mtime) of a file """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def file_digest(path):
+    """ sha1 of a file's content """
+    digest = hashlib.sha1()
+    with open(path, 'rb') as change_file:
+        for block in iter(lambda: change_file.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_files(directory):
+    """ Names of the regular, non-hidden files in a directory """
+    names = []
+    for name in os.listdir(directory):
+        if name.startswith('.'):
+            continue
+        if os.path.isfile(os.path.join(directory, name)):
+            names.append(name)
+    return sorted(names)
+
+
+def report_record(path, digest, findings, error):
+    """ Report sink record for one scanned file """
+    return {
+        'File': path,
+        'Digest': digest,
+        'Time': round(time.time(), 3),
+        'ExitCode': 1 if error else (2 if findings else 0),
+        'Error': error,
+        'Findings': [{
+            'LogicalResourceId': finding.logical_id,
+            'ResourceType': finding.resource_type,
+            'Action': finding.action,
+            'Properties': list(finding.properties),
+        } for finding in findings],
+    }
+
+
+class Watcher(object):
+    """ Scans new or changed change set files in a directory """
+
+    def __init__(self, directory, classifier, index, sink):
+        self.directory = directory
+        self.classifier = classifier
+        self.index = index
+        self.sink = sink
+
+    def check(self, name):
+        """ Scan a file unless it, or a file with the same content, was scanned """
+        path = os.path.join(self.directory, name)
+        try:
+            current = signature(path)
+            if self.index.is_current(name, current):
+                return None
+            digest = file_digest(path)
+        except (IOError, OSError) as err:
+            # Removed or replaced before we got to it
+            LOGGER.debug('Skipping %s: %s', path, err)
+            return None
+        known = self.index.digests.get(digest)
+        if known is not None:
+            LOGGER.debug('Already scanned the content of %s', path)
+            self.index.record(name, current, digest, known['ExitCode'])
+            return None
+        _, findings, error = cfnsafeset.files.scan_file(path, self.classifier)
+        record = report_record(path, digest, findings, error)
+        if error:
+            LOGGER.error(error)
+        for finding in findings:
+            cfnsafeset.core.log_finding(cfnsafeset.core.Finding(
+                '%s:%s' % (path, finding.logical_id), finding.resource_type,
+                finding.action, finding.properties))
+        self.sink.write(record)
+        self.index.record(name, current, digest, record['ExitCode'])
+        return record
+
+    def rescan(self, pending=None):
+        """ Check every file in the directory
+
+        With pending (a dict), a changed file is only checked once its size
+        and mtime are the same on two consecutive scans, so files still
+        being written are left alone.
+        """
+        names = list_files(self.directory)
+        self.index.forget_missing(names)
+        for name in names:
+            if pending is None:
+                self.check(name)
+                continue
+            try:
+                current = signature(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            if self.index.is_current(name, current):
+                pending.pop(name, None)
+            elif pending.get(name) == current:
+                del pending[name]
+                self.check(name)
+            else:
+                pending[name] = current
+        self.index.save()
+
+    def run_inotify(self, inotify, timeout=1.0):
+        """ Check files as inotify reports them """
+        self.rescan()
+        while True:
+            names = inotify.read(timeout)
+            if None in names:
+                LOGGER.warning('inotify queue overflowed, rescanning %s', self.directory)
+                self.rescan()
+                continue
+            for name in names:
+                if not name.startswith('.'):
+                    self.check(name)
+            self.index.save()
+
+    def run_polling(self, interval):
+        """ Check the directory every interval seconds """
+        pending = {}
+        self.rescan()
+        while True:
+            time.sleep(interval)
+            self.rescan(pending)
+
+
+def watch(directory, digest, classifier, report=None, poll_interval=2.0, poll=False):
+    """ Watch a directory until interrupted, scanning each new change set file
+
+    digest is the config digest the scan index is kept under.
+    """
+    if not os.path.isdir(directory):
+        LOGGER.error('Cannot watch %s: not a directory', directory)
+        return 1
+    try:
+        sink = ReportSink(report)
+    except (IOError, OSError) as err:
+        LOGGER.error('Cannot open watch report %s: %s', report, err)
+        return 1
+    watcher = Watcher(directory, classifier, ScanIndex.for_directory(directory, digest), sink)
+    inotify = None
+    if not poll:
+        try:
+            inotify = Inotify(directory)
+        except OSError as err:
+            LOGGER.info('inotify unavailable (%s), polling every %ss', err, poll_interval)
+    # Treat SIGTERM like Ctrl-C so the index is saved
+    signal.signal(signal.SIGTERM, signal.getsignal(signal.SIGINT))
+    LOGGER.warning('Watching %s for change set files', directory)
+    try:
+        if inotify is not None:
+            watcher.run_inotify(inotify)
+        else:
+            watcher.run_polling(poll_interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.index.save()
+        if inotify is not None:
+            inotify.close()
+        sink.close()
+    return 0
@@ -0,0 +1,176 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.nested  # pylint: disable=E0401
+import cfnsafeset.standin  # pylint: disable=E0401
+import cfnsafeset.sweep  # pylint: disable=E0401
+import cfnsafeset.throttle  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from cfnsafeset.clients import ClientPool  # pylint: disable=E0401
+
+REGION = 'us-east-1'
+SCENARIOS = ('single', 'batch', 'nested', 'sweep')
+
+
+def percentile(values, fraction):
+    """ Nearest-rank percentile of a list of numbers """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def timed(func, *args):
+    """ Seconds taken by func(*args) """
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def targets(server):
+    """ (stack, change set) for every top-level change set the stand-in serves """
+    return [(stack, name) for stack in server.account.stack_names
+            for name in server.account.change_set_names(stack)]
+
+
+def run_scenario(scenario, server, classifier, jobs):
+    """ Run one scan path against the stand-in
+
+    Returns (change sets scanned, wall seconds, latencies in seconds). For
+    single, batch and nested a latency is the time to scan one change set
+    (nested: one tree); for sweep it is the time from the start of the
+    sweep until each change set's result arrived.
+    """
+    clients = ClientPool(server.url)
+    work = targets(server)
+
+    def scan(target):
+        """ Fetch and scan one change set """
+        stack, name = target
+        return timed(lambda: list(cfnsafeset.core.iter_findings(
+            cfnsafeset.core.get_change_set(
+                name, stack, REGION, None, cf_client=clients.get(REGION)),
+            classifier.extractors, classifier)))
+
+    def scan_tree(target):
+        """ Fetch and scan one change set and its nested change sets """
+        stack, name = target
+        return timed(cfnsafeset.nested.scan_tree, name, stack, REGION, None,
+                     clients.get(REGION), classifier, jobs)
+
+    start = time.time()
+    if scenario == 'single':
+        latencies = [scan(target) for target in work]
+    elif scenario == 'batch':
+        pool = ThreadPool(jobs)
+        try:
+            latencies = pool.map(scan, work)
+        finally:
+            pool.terminate()
+    elif scenario == 'nested':
+        latencies = [scan_tree(target) for target in work]
+    else:
+        latencies = [time.time() - start for _ in cfnsafeset.sweep.sweep(
+            [REGION], None, classifier, jobs, clients)]
+    return len(latencies), time.time() - start, latencies
+
+
+def run_load(args):
+    """ Start a stand-in, run the selected scenarios and return their results """
+    logging.getLogger('cfnsafeset').setLevel(logging.CRITICAL)
+    # The stand-in does not check signatures, but botocore needs something to sign with
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'standin')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'standin')
+    classifier = compile_config(cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE))
+    server = cfnsafeset.standin.StandIn(
+        account=cfnsafeset.standin.Account(
+            args.stacks, args.change_sets, args.changes, args.nested_ratio),
+        faults=cfnsafeset.standin.Faults(
+            args.latency, args.jitter, args.error_rate, args.throttle_rate, args.rate_limit),
+        page_size=args.page_size)
+    server.start()
+    results = []
+    try:
+        for scenario in args.scenarios:
+            before = cfnsafeset.throttle.STATS.snapshot()
+            server.latencies = []
+            count, elapsed, latencies = run_scenario(scenario, server, classifier, args.jobs)
+            after = cfnsafeset.throttle.STATS.snapshot()
+            result = {
+                'scenario': scenario,
+                'change_sets': count,
+                'seconds': elapsed,
+                'change_sets_per_s': count / elapsed if elapsed else 0.0,
+                'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+                'api_p50_ms': percentile(server.latencies, 0.5) * 1000,
+                'api_p99_ms': percentile(server.latencies, 0.99) * 1000,
+            }
+            result.update((field, after[field] - before[field])
+                          for field in cfnsafeset.throttle.Stats.FIELDS)
+            results.append(result)
+    finally:
+        server.stop()
+    return results
+
+
+def main():
+    """ Load-test the API scan paths against a local CloudFormation stand-in """
+    parser = argparse.ArgumentParser(description='cfn-safeset API load test')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--stacks', type=int, default=20)
+    parser.add_argument('--change-sets', type=int, default=1, help='Change sets per stack')
+    parser.add_argument('--changes', type=int, default=500, help='Changes per change set')
+    parser.add_argument('--nested-ratio', type=float, default=0.01)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05, help='Seconds per API call')
+    parser.add_argument('--jitter', type=float, default=0.5)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--throttle-rate', type=float, default=0.0)
+    parser.add_argument('--rate-limit', type=float, help='Throttle above this many calls/s')
+    parser.add_argument('-j', '--jobs', type=int, default=8)
+    parser.add_argument('--json', action='store_true', help='Print results as JSON')
+    args = parser.parse_args()
+
+    try:
+        results = run_load(args)
+    except ImportError as err:
+        print('The load test needs boto3 and botocore: %s' % err, file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(results, indent=2, sort_keys=True))
+        return 0
+    print('%-8s %6s %8s %9s %9s %9s %9s %9s %6s %8s %7s' % (
+        'scenario', 'sets', 'seconds', 'sets/s', 'p50 ms', 'p99 ms', 'api p50', 'api p99',
+        'calls', 'throttle', 'retries'))
+    for result in results:
+        print('%(scenario)-8s %(change_sets)6d %(seconds)8.2f %(change_sets_per_s)9.1f '
+              '%(p50_ms)9.1f %(p99_ms)9.1f %(api_p50_ms)9.1f %(api_p99_ms)9.1f '
+              '%(api_calls)6d %(throttles)8d %(retries)7d' % result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+from __future__ import print_function
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.synthetic  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       'fixtures', 'changesets', 'db-replace-change.json')
+# Direction of each metric: True if lower is better
+LOWER_IS_BETTER = {
+    'cold_start_file_s': True,
+    'cold_start_list_s': True,
+    'load_changes_per_s': False,
+    'detect_us_per_change': True,
+    'peak_memory_mb': True,
+}
+# How each metric scales with host speed: 'time' metrics are divided by the
+# calibration time, 'rate' metrics multiplied by it, the rest left as is
+SCALES_WITH = {
+    'cold_start_file_s': 'time',
+    'cold_start_list_s': 'time',
+    'load_changes_per_s': 'rate',
+    'detect_us_per_change': 'time',
+}
+CALIBRATION_LOOPS = 200000
+
+
+def best_of(repeat, func):
+    """ Fastest of several timed runs, in seconds """
+    timings = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        timings.append(time.time() - start)
+    return min(timings)
+
+
+def calibration_loop():
+    """ Fixed pure Python workload used as the unit of host speed """
+    seen = {}
+    for i in range(CALIBRATION_LOOPS):
+        key = 'Resource%d' % (i % 1000)
+        seen[key] = seen.get(key, 0) + len(key)
+    return seen
+
+
+def normalise(results, calibration):
+    """ Express results in units of the calibration loop so hosts compare """
+    normalised = {}
+    for name, value in results.items():
+        scale = SCALES_WITH.get(name)
+        if scale == 'time':
+            value = value / calibration
+        elif scale == 'rate':
+            value = value * calibration
+        normalised[name] = value
+    return normalised
+
+
+def cold_start(*args):
+    """ Time one cfn-safeset run in a fresh interpreter """
+    env = dict(os.environ)
+    src = os.path.dirname(os.path.dirname(os.path.abspath(cfnsafeset.core.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [src, env.get('PYTHONPATH')]))
+    with open(os.devnull, 'w') as devnull:
+        subprocess.call([sys.executable, '-m', 'cfnsafeset'] + list(args),
+                        stdout=devnull, stderr=devnull, env=env)
+
+
+def run_benchmarks(changes, repeat):
+    """ Measure every metric and return them as a dict """
+    logging.getLogger('cfnsafeset').setLevel(logging.ERROR)
+    config = cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE)
+    classifier = compile_config(config)
+    results = {
+        'cold_start_file_s': best_of(repeat, lambda: cold_start('-f', FIXTURE)),
+        'cold_start_list_s': best_of(repeat, lambda: cold_start('-l')),
+    }
+
+    handle, filename = tempfile.mkstemp(suffix='.json')
+    try:
+        with os.fdopen(handle, 'w') as change_file:
+            cfnsafeset.synthetic.write_change_set(change_file, count=changes)
+        elapsed = best_of(repeat, lambda: sum(1 for _ in cfnsafeset.core.load_cs_file(filename)))
+        results['load_changes_per_s'] = changes / elapsed
+
+        loaded = list(cfnsafeset.core.load_cs_file(filename))
+        elapsed = best_of(repeat, lambda: cfnsafeset.core.detect_stateful_replace(
+            loaded, classifier.extractors, classifier))
+        results['detect_us_per_change'] = elapsed / changes * 1e6
+        del loaded
+
+        if tracemalloc is not None:
+            tracemalloc.start()
+            cfnsafeset.core.detect_stateful_replace(
+                cfnsafeset.core.load_cs_file(filename), classifier.extractors, classifier)
+            results['peak_memory_mb'] = tracemalloc.get_traced_memory()[1] / 1048576.0
+            tracemalloc.stop()
+    finally:
+        os.remove(filename)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """ Return the metrics that are worse than baseline by more than tolerance """
+    regressions = []
+    for name, value in sorted(results.items()):
+        if name not in baseline:
+            continue
+        expected = baseline[name]
+        if LOWER_IS_BETTER[name]:
+            regressed = value > expected * (1 + tolerance)
+        else:
+            regressed = value < expected * (1 - tolerance)
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    """ Run the benchmarks and compare them to the stored baseline """
+    parser = argparse.ArgumentParser(description='cfn-safeset benchmarks')
+    parser.add_argument('--changes', type=int, default=20000,
+                        help='Number of changes in the synthetic change set')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Runs per metric; the best run is kept')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed regression as a fraction of the baseline')
+    parser.add_argument('--update-baseline', action='store_true',
+                        help='Store these results as the new baseline')
+    args = parser.parse_args()
+
+    calibration = best_of(args.repeat, calibration_loop)
+    results = normalise(run_benchmarks(args.changes, args.repeat), calibration)
+    print('%-22s %12.3f  (time metrics below are in these units)' % (
+        'calibration_s', calibration))
+    baseline = {}
+    if os.path.exists(BASELINE_FILE):
+        with open(BASELINE_FILE) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    regressions = compare(results, baseline, args.tolerance)
+    for name, value in sorted(results.items()):
+        print('%-22s %12.3f  baseline %12s%s' % (
+            name, value, '%.3f' % baseline[name] if name in baseline else '-',
+            '  REGRESSION' if name in regressions else ''))
+
+    if args.update_baseline:
+        with open(BASELINE_FILE, 'w') as baseline_file:
+            json.dump(dict((name, float('%.4g' % value)) for name, value in results.items()),
+                      baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+        return 0
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
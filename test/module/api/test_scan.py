@@ -0,0 +1,52 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import cfnsafeset  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class TestScan(BaseTestCase):
+    """Test the embeddable scanning API """
+
+    def test_scan_replacement(self):
+        """Test a stateful replacement is returned as a finding"""
+        findings = cfnsafeset.scan_file('fixtures/changesets/db-replace-change.json')
+        self.assertEqual(findings, [cfnsafeset.Finding(
+            'DBCluster', 'AWS::RDS::DBCluster', 'Replace', ['DatabaseName'])])
+        self.assertFalse(hasattr(findings[0], '__dict__'))
+
+    def test_scan_custom_config(self):
+        """Test a caller supplied config"""
+        config = {'ChangeTypes': {'Resource': 'ResourceChange'},
+                  'StatefulResources': ['AWS::EC2::*']}
+        findings = cfnsafeset.scan(
+            self.load_change_set('fixtures/changesets/db-replace-change.json'), config)
+        self.assertEqual([finding.logical_id for finding in findings], ['DBClusterSG'])
+
+    def test_scan_remove(self):
+        """Test removals carry no properties"""
+        changes = [{'Type': 'Resource', 'ResourceChange': {
+            'Action': 'Remove', 'LogicalResourceId': 'Table',
+            'ResourceType': 'AWS::DynamoDB::Table', 'Details': []}}]
+        self.assertEqual(cfnsafeset.scan(changes), [
+            cfnsafeset.Finding('Table', 'AWS::DynamoDB::Table', 'Remove')])
+
+    def test_typed_errors(self):
+        """Test errors raise instead of exiting"""
+        with self.assertRaises(cfnsafeset.ChangeSetFileError):
+            cfnsafeset.scan_file('fixtures/changesets/not-found.json')
+        with self.assertRaises(cfnsafeset.ConfigError):
+            cfnsafeset.scan([], {'ChangeTypes': {}, 'StatefulResources': ['AWS::*::Table']})
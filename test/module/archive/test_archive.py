@@ -0,0 +1,123 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import glob
+import json
+import os
+import shutil
+import struct
+import tempfile
+import cfnsafeset.archive  # pylint: disable=E0401
+import cfnsafeset.core  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from cfnsafeset.exceptions import ArchiveError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+FIXTURES = sorted(glob.glob('fixtures/changesets/*.json'))
+
+
+class TestArchive(BaseTestCase):
+    """Test the columnar change set archive"""
+
+    def setUp(self):
+        """Setup"""
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'changes.cfa')
+        self.config = cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False)
+        self.classifier = compile_config(self.config)
+
+    def tearDown(self):
+        """Teardown"""
+        shutil.rmtree(self.directory)
+
+    def scanned(self, classifier):
+        """Findings per type from scanning the fixture files directly"""
+        expected = {}
+        for filename in FIXTURES:
+            for finding in cfnsafeset.core.iter_findings(
+                    cfnsafeset.core.load_cs_file(filename), classifier.extractors, classifier):
+                counts = expected.setdefault(finding.resource_type, [0, 0, set()])
+                counts[0 if finding.action == 'Replace' else 1] += 1
+                counts[2].update(finding.properties)
+        return expected
+
+    def queried(self, classifier, pattern=None):
+        """Query results in the same shape as scanned"""
+        with cfnsafeset.archive.Archive(self.path) as archive:
+            stats = cfnsafeset.archive.query(archive, classifier, pattern)
+            return dict(
+                (resource_type, [entry.replaced, entry.removed, set(entry.properties)])
+                for resource_type, entry in stats.items())
+
+    def test_query_matches_scan(self):
+        """Test querying the archive finds what scanning the files finds"""
+        self.assertEqual(cfnsafeset.archive.import_files(self.path, FIXTURES),
+                         (len(FIXTURES), 0, 0))
+        self.assertEqual(self.queried(self.classifier), self.scanned(self.classifier))
+        self.assertEqual(list(self.queried(self.classifier, 'AWS::RDS::*')),
+                         ['AWS::RDS::DBCluster'])
+
+    def test_query_applies_policies(self):
+        """Test rows of types with a policy go through replace_finding"""
+        cfnsafeset.archive.import_files(self.path, FIXTURES)
+        classifier = compile_config(cfnsafeset.core.load_policy(
+            self.config, 'fixtures/policies/ec2-instance.yaml'))
+        queried = self.queried(classifier)
+        self.assertEqual(queried, self.scanned(classifier))
+        self.assertEqual(queried['AWS::EC2::Instance'][2], set(['KeyName']))
+
+    def test_incremental_import(self):
+        """Test files are imported once and existing rows are kept"""
+        cfnsafeset.archive.import_files(self.path, FIXTURES[:1])
+        self.assertEqual(
+            cfnsafeset.archive.import_files(self.path, FIXTURES + ['missing.json']),
+            (len(FIXTURES) - 1, 1, 1))
+        with cfnsafeset.archive.Archive(self.path) as archive:
+            self.assertEqual([name for name, _ in archive.sources], FIXTURES)
+            self.assertEqual(archive.rows, sum(
+                len(list(cfnsafeset.core.load_cs_file(filename))) for filename in FIXTURES))
+            self.assertEqual(archive.tables['Action'][archive.columns['Action'][0]], 'Modify')
+        self.assertEqual(self.queried(self.classifier), self.scanned(self.classifier))
+
+    def test_invalid_archive(self):
+        """Test unreadable archives raise ArchiveError"""
+        with open(self.path, 'wb') as archive_file:
+            archive_file.write(b'{"Changes": []}')
+        with self.assertRaises(ArchiveError):
+            cfnsafeset.archive.Archive(self.path)
+        with self.assertRaises(ArchiveError):
+            cfnsafeset.archive.Archive(os.path.join(self.directory, 'missing.cfa'))
+        cfnsafeset.archive.import_files(self.path + '.ok', FIXTURES)
+        with open(self.path + '.ok', 'rb') as archive_file:
+            data = archive_file.read()
+        with open(self.path, 'wb') as archive_file:
+            archive_file.write(data[:-64])
+        with self.assertRaises(ArchiveError):
+            cfnsafeset.archive.Archive(self.path)
+
+    def test_damaged_header(self):
+        """Test a header with missing or malformed fields raises ArchiveError"""
+        for header in ({'Version': cfnsafeset.archive.VERSION},
+                       {'Version': cfnsafeset.archive.VERSION, 'ByteOrder': 'little',
+                        'Tables': {}, 'Sources': [], 'Columns': {'Source': 3}},
+                       [cfnsafeset.archive.VERSION]):
+            encoded = json.dumps(header).encode('utf-8')
+            with open(self.path, 'wb') as archive_file:
+                archive_file.write(cfnsafeset.archive.MAGIC + struct.pack('<I', len(encoded))
+                                   + encoded)
+            with self.assertRaises(ArchiveError):
+                cfnsafeset.archive.Archive(self.path)
@@ -0,0 +1,96 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import cfnsafeset.batch  # pylint: disable=E0401
+import cfnsafeset.core  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class FakeClient(object):
+    """Serve change set exports from the fixtures directory"""
+    def describe_change_set(self, ChangeSetName, StackName):  # pylint: disable=C0103,W0613
+        """Return the exported change set with the same name"""
+        with open('fixtures/changesets/%s.json' % ChangeSetName) as change_file:
+            return json.load(change_file)
+
+
+class FakePool(object):
+    """Hand out the same fake client for every region"""
+    def __init__(self):
+        self.requests = []
+
+    def get(self, region, profile=None, role=None):
+        """Record the request and return a fake client"""
+        self.requests.append((region, profile, role))
+        return FakeClient()
+
+
+class TestBatch(BaseTestCase):
+    """Test batch mode """
+
+    def setUp(self):
+        """Setup"""
+        config = cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False)
+        self.change_types = config['ChangeTypes']
+        self.stateful = set(config['StatefulResources'])
+
+    def test_load_manifest(self):
+        """Test manifest defaults"""
+        entries = cfnsafeset.batch.load_manifest(
+            'fixtures/manifests/batch.yaml', 'us-east-1', 'dev')
+        self.assertEqual(entries[0]['Region'], 'us-east-2')
+        self.assertEqual(entries[1]['Region'], 'us-east-1')
+        self.assertEqual(entries[1]['Profile'], 'dev')
+
+    def test_load_manifest_invalid(self):
+        """Test manifest without change sets"""
+        with self.assertRaises(ValueError):
+            cfnsafeset.batch.load_manifest(
+                'fixtures/changesets/db-replace-change.json', 'us-east-1', None)
+
+    def test_run_batch(self):
+        """Test combined exit code"""
+        entries = cfnsafeset.batch.load_manifest(
+            'fixtures/manifests/batch.yaml', 'us-east-1', None)
+        pool = FakePool()
+        result = cfnsafeset.batch.run_batch(
+            entries, self.change_types, self.stateful, 4, clients=pool)
+        self.assertEqual(result, 2)
+        self.assertEqual(sorted(pool.requests),
+                         [('us-east-1', None, None), ('us-east-2', None, None)])
+
+    def test_run_batch_role(self):
+        """Test entries default to the command line role"""
+        role = 'arn:aws:iam::111111111111:role/read'
+        entries = cfnsafeset.batch.load_manifest(
+            'fixtures/manifests/batch.yaml', 'us-east-1', None, role)
+        pool = FakePool()
+        cfnsafeset.batch.run_batch(entries, self.change_types, self.stateful, 4, clients=pool)
+        self.assertEqual(sorted(pool.requests),
+                         [('us-east-1', None, role), ('us-east-2', None, role)])
+
+    def test_run_batch_fail_fast(self):
+        """Test the first stateful change set stops the batch"""
+        entries = cfnsafeset.batch.load_manifest(
+            'fixtures/manifests/batch.yaml', 'us-east-1', None)
+        pool = FakePool()
+        result = cfnsafeset.batch.run_batch(
+            entries * 20, self.change_types, self.stateful, 1, clients=pool,
+            fail_fast=True)
+        self.assertEqual(result, 2)
+        self.assertLess(len(pool.requests), 40)
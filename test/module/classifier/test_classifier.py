@@ -0,0 +1,51 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import cfnsafeset.core  # pylint: disable=E0401
+from cfnsafeset.classifier import Classifier  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class TestClassifier(BaseTestCase):
+    """Test compiled stateful resource classification """
+
+    def test_exact_and_namespace(self):
+        """Test exact types and namespace wildcards"""
+        classifier = Classifier(
+            {'Resource': 'ResourceChange'},
+            ['AWS::DynamoDB::Table', 'AWS::RDS::*', 'Custom::*'])
+        self.assertIn('AWS::DynamoDB::Table', classifier)
+        self.assertIn('AWS::RDS::DBCluster', classifier)
+        self.assertIn('Custom::Database', classifier)
+        self.assertNotIn('AWS::DynamoDB::GlobalTable', classifier)
+        self.assertNotIn('AWS::RDSX::DBCluster', classifier)
+        self.assertNotIn('AWS::RDS', classifier)
+        self.assertEqual(len(classifier), 3)
+
+    def test_invalid_pattern(self):
+        """Test wildcards inside a name are rejected"""
+        with self.assertRaises(ValueError):
+            Classifier({}, ['AWS::RDS::DB*'])
+
+    def test_detect_with_classifier(self):
+        """Test detection through the compiled config"""
+        classifier = Classifier({'Resource': 'ResourceChange'}, ['AWS::RDS::*'])
+        changes = self.load_change_set('fixtures/changesets/db-replace-change.json')
+        self.assertTrue(cfnsafeset.core.detect_stateful_replace(
+            changes, classifier.extractors, classifier))
+        changes = self.load_change_set('fixtures/changesets/db-replace-change.json')
+        self.assertFalse(cfnsafeset.core.detect_stateful_replace(
+            changes, {'Resource': 'ResourceChange'}, Classifier({}, ['AWS::S3::*'])))
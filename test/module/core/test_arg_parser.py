@@ -14,7 +14,9 @@
   OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
   SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 """
+import io
 import logging
+import sys
 import cfnsafeset.core  # pylint: disable=E0401
 from testlib.testcase import BaseTestCase
 
@@ -35,7 +37,7 @@ class TestArgsParser(BaseTestCase):
         args = parser.parse_args([
             '-f', 'test.yaml', '-r', 'us-east-1',
             '--debug'])
-        self.assertEqual(args.file, 'test.yaml')
+        self.assertEqual(args.file, ['test.yaml'])
         self.assertEqual(args.region, 'us-east-1')
         self.assertEqual(args.debug, True)
 
@@ -56,3 +58,32 @@ class TestArgsParser(BaseTestCase):
         args = parser.parse_args(['-t', 'template1.yaml', '-t', 'template2.yaml'])
         self.assertEqual(args.templates, [])
         self.assertEqual(args.template_alt, ['template1.yaml', 'template2.yaml'])
+
+    def test_incremental_with_cache(self):
+        """Test --incremental and --cache are rejected together"""
+        argv, stderr = sys.argv, sys.stderr
+        sys.argv = ['cfn-safeset', '-c', 'cs', '-s', 'stack', '--incremental', '--cache']
+        sys.stderr = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+        try:
+            with self.assertRaises(SystemExit) as context:
+                cfnsafeset.core.get_args()
+            self.assertIn('cannot be combined', sys.stderr.getvalue())
+        finally:
+            sys.argv, sys.stderr = argv, stderr
+        self.assertEqual(context.exception.code, 2)
+
+    def test_root_cause_needs_single_change_set(self):
+        """Test --root-cause is rejected where it would be ignored"""
+        argv, stderr = sys.argv, sys.stderr
+        try:
+            for extra in (['-c', 'cs', '-s', 'stack', '--nested'],
+                          ['-c', 'cs', '-s', 'stack', '--cache'],
+                          ['-c', 'cs', '-s', 'stack', '--incremental'],
+                          ['-f', 'a.json', 'b.json']):
+                sys.argv = ['cfn-safeset', '--root-cause'] + extra
+                sys.stderr = io.StringIO() if sys.version_info[0] > 2 else io.BytesIO()
+                with self.assertRaises(SystemExit):
+                    cfnsafeset.core.get_args()
+                self.assertIn('--root-cause only applies', sys.stderr.getvalue())
+        finally:
+            sys.argv, sys.stderr = argv, stderr
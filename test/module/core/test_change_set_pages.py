@@ -0,0 +1,168 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import time
+import cfnsafeset.core  # pylint: disable=E0401
+from cfnsafeset.exceptions import ChangeSetRetrievalError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class FakeClient(object):
+    """Serve pre-built describe_change_set pages"""
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def describe_change_set(self, **kwargs):
+        """Return the page matching NextToken"""
+        self.calls.append(kwargs)
+        return self.pages[int(kwargs.get('NextToken', 0))]
+
+
+class TestChangeSetPages(BaseTestCase):
+    """Test paginated change set retrieval """
+
+    def test_follows_next_token(self):
+        """Test every page is retrieved"""
+        client = FakeClient([
+            {'Changes': [1, 2], 'NextToken': '1'},
+            {'Changes': [3], 'NextToken': '2'},
+            {'Changes': [4]},
+        ])
+        pages = list(cfnsafeset.core.iter_change_set_pages(client, 'cs', 'stack'))
+        self.assertEqual([page['Changes'] for page in pages], [[1, 2], [3], [4]])
+        self.assertEqual(len(client.calls), 3)
+        self.assertEqual(client.calls[2]['NextToken'], '2')
+
+    def test_prefetch_preserves_order(self):
+        """Test prefetched items arrive in order"""
+        self.assertEqual(list(cfnsafeset.core.prefetch(iter(range(50)))), list(range(50)))
+
+    def test_prefetch_reraises(self):
+        """Test producer errors reach the consumer"""
+        def failing():
+            """Yield once then fail"""
+            yield 1
+            raise ValueError('boom')
+
+        items = cfnsafeset.core.prefetch(failing())
+        self.assertEqual(next(items), 1)
+        with self.assertRaises(ValueError):
+            next(items)
+
+    def test_botocore_errors_are_typed(self):
+        """Test credential and connection errors raise ChangeSetRetrievalError"""
+        from botocore.exceptions import NoCredentialsError
+
+        class NoCredentials(object):
+            """Client without credentials"""
+            def describe_change_set(self, **kwargs):  # pylint: disable=W0613
+                """Fail like botocore does"""
+                raise NoCredentialsError()
+
+        with self.assertRaises(ChangeSetRetrievalError):
+            list(cfnsafeset.core.get_change_set(
+                'cs', 'stack', 'us-east-1', None, cf_client=NoCredentials()))
+
+    def test_bad_profile(self):
+        """Test a client for an unknown profile raises ChangeSetRetrievalError"""
+        with self.assertRaises(ChangeSetRetrievalError):
+            cfnsafeset.core.get_client(
+                'us-east-1', 'cfn-safeset-no-such-profile', 'http://127.0.0.1:1')
+
+
+class PendingClient(object):
+    """Report a change set as pending for a number of polls"""
+    def __init__(self, pending_polls, final):
+        self.pending_polls = pending_polls
+        self.final = final
+        self.calls = 0
+
+    def describe_change_set(self, **kwargs):  # pylint: disable=W0613
+        """Return a pending status until the polls run out"""
+        self.calls += 1
+        if self.calls <= self.pending_polls:
+            return {'Status': 'CREATE_IN_PROGRESS', 'ExecutionStatus': 'UNAVAILABLE',
+                    'Changes': []}
+        return self.final
+
+
+class TestWaitForChangeSet(BaseTestCase):
+    """Test waiting for pending change sets """
+
+    def setUp(self):
+        """Setup"""
+        self.now = [0.0]
+        self.pauses = []
+
+    def sleep(self, seconds):
+        """Advance the fake clock"""
+        self.pauses.append(seconds)
+        self.now[0] += seconds
+
+    def wait(self, client, timeout=600):
+        """Wait using the fake clock"""
+        return cfnsafeset.core.wait_for_change_set(
+            client, {'ChangeSetName': 'cs'}, timeout,
+            sleep=self.sleep, clock=lambda: self.now[0])
+
+    def test_ready_response_reused(self):
+        """Test the ready response is returned without another call"""
+        final = {'Status': 'CREATE_COMPLETE', 'Changes': [1]}
+        client = PendingClient(3, final)
+        self.assertIs(self.wait(client), final)
+        self.assertEqual(client.calls, 4)
+        self.assertEqual(len(self.pauses), 3)
+        self.assertTrue(self.pauses[2] > self.pauses[0])
+
+    def test_timeout(self):
+        """Test waiting stops at the timeout"""
+        client = PendingClient(1000, None)
+        with self.assertRaises(ChangeSetRetrievalError):
+            self.wait(client, timeout=60)
+        self.assertLessEqual(self.now[0], 60)
+        self.assertLess(client.calls, 10)
+
+    def test_failed(self):
+        """Test failed change sets raise unless nothing changed"""
+        with self.assertRaises(ChangeSetRetrievalError):
+            self.wait(PendingClient(0, {'Status': 'FAILED', 'StatusReason': 'Bad template'}))
+        response = self.wait(PendingClient(0, {
+            'Status': 'FAILED',
+            'StatusReason': "The submitted information didn't contain changes."}))
+        self.assertEqual(response['Changes'], [])
+
+
+class TestFailFast(BaseTestCase):
+    """Test --fail-fast short-circuits retrieval"""
+
+    def test_stops_fetching_pages(self):
+        """Test no further pages are requested after the first stateful change"""
+        removal = {'Type': 'Resource', 'ResourceChange': {
+            'Action': 'Remove', 'LogicalResourceId': 'Table',
+            'ResourceType': 'AWS::DynamoDB::Table', 'Details': []}}
+        client = FakeClient([
+            {'Changes': [removal], 'NextToken': str(page + 1)} for page in range(9)
+        ] + [{'Changes': []}])
+        config = cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE, use_cache=False)
+        changes = cfnsafeset.core.get_change_set(
+            'cs', 'stack', 'us-east-1', None, cf_client=client)
+        self.assertTrue(cfnsafeset.core.detect_stateful_replace(
+            changes, config['ChangeTypes'], set(config['StatefulResources']),
+            fail_fast=True))
+        # Give the prefetch thread time to notice it was stopped
+        time.sleep(0.3)
+        self.assertLessEqual(len(client.calls), 3)
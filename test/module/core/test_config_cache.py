@@ -0,0 +1,83 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import os
+import shutil
+import tempfile
+import cfnsafeset.cache  # pylint: disable=E0401
+import cfnsafeset.core  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+CONFIG_FILE = '/data/stateful-resources.yaml'
+
+
+class TestConfigCache(BaseTestCase):
+    """Test the compiled config cache """
+
+    def setUp(self):
+        """Setup"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.previous = os.environ.get('CFN_SAFESET_CACHE_DIR')
+        os.environ['CFN_SAFESET_CACHE_DIR'] = self.cache_dir
+
+    def tearDown(self):
+        """Teardown"""
+        if self.previous is None:
+            del os.environ['CFN_SAFESET_CACHE_DIR']
+        else:
+            os.environ['CFN_SAFESET_CACHE_DIR'] = self.previous
+        shutil.rmtree(self.cache_dir)
+
+    def test_cache_round_trip(self):
+        """Test the second load is served from the cache"""
+        parses = []
+        yaml_load = cfnsafeset.core.yaml.load
+
+        def counting_load(*args, **kwargs):
+            parses.append(args)
+            return yaml_load(*args, **kwargs)
+
+        cfnsafeset.core.yaml.load = counting_load
+        try:
+            uncached = cfnsafeset.core.init_config(CONFIG_FILE, use_cache=False)
+            self.assertEqual(os.listdir(self.cache_dir), [])
+            first = cfnsafeset.core.init_config(CONFIG_FILE)
+            self.assertEqual(len(parses), 2)
+            filename = os.path.join(os.path.dirname(os.path.abspath(cfnsafeset.core.__file__)),
+                                    CONFIG_FILE.lstrip('/'))
+            cache_path = cfnsafeset.cache._config_cache_path(filename)  # pylint: disable=W0212
+            self.assertTrue(os.path.isfile(cache_path))
+            second = cfnsafeset.core.init_config(CONFIG_FILE)
+            self.assertEqual(len(parses), 2)
+        finally:
+            cfnsafeset.core.yaml.load = yaml_load
+        self.assertEqual(first, uncached)
+        self.assertEqual(second, uncached)
+
+    def test_stale_entry(self):
+        """Test a changed digest or mtime misses the cache"""
+        cfnsafeset.cache.store_config('config.yaml', 1.0, 'abc', {'A': 1})
+        self.assertEqual(cfnsafeset.cache.load_config('config.yaml', 1.0, 'abc'), {'A': 1})
+        self.assertIsNone(cfnsafeset.cache.load_config('config.yaml', 1.0, 'abd'))
+        self.assertIsNone(cfnsafeset.cache.load_config('config.yaml', 2.0, 'abc'))
+
+    def test_corrupt_entry(self):
+        """Test a corrupt cache file is ignored"""
+        cfnsafeset.cache.store_config('config.yaml', 1.0, 'abc', {'A': 1})
+        for name in os.listdir(self.cache_dir):
+            with open(os.path.join(self.cache_dir, name), 'wb') as cache_file:
+                cache_file.write(b'\x00garbage')
+        self.assertIsNone(cfnsafeset.cache.load_config('config.yaml', 1.0, 'abc'))
@@ -0,0 +1,95 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import json
+import sys
+import cfnsafeset.core  # pylint: disable=E0401
+from cfnsafeset.exceptions import ChangeSetFileError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+FIXTURES = [
+    'fixtures/changesets/db-replace-change.json',
+    'fixtures/changesets/sample-parameter-change.json',
+    'fixtures/changesets/sample-replacement-change.json',
+    'fixtures/changesets/sample-template-change.json',
+]
+
+
+class TestLoadChangeSetFile(BaseTestCase):
+    """Test streaming change set file parser """
+
+    def test_matches_json_load(self):
+        """Test streamed changes match a full parse for any chunk size"""
+        for filename in FIXTURES:
+            with open(filename) as change_file:
+                expected = json.load(change_file)['Changes']
+            for chunk_size in [1, 7, 64, 65536]:
+                with open(filename) as change_file:
+                    changes = list(cfnsafeset.core.iter_json_list(
+                        change_file, 'Changes', chunk_size))
+                self.assertEqual(changes, expected)
+
+    def test_changes_key_anywhere(self):
+        """Test Changes before, between and after other keys"""
+        document = '{"A": [1, {"Changes": 2}], "Changes": [{"x": 10}, 2.5, true], "B": 12345}'
+        for chunk_size in [1, 3, 100]:
+            changes = list(cfnsafeset.core.iter_json_list(
+                io.StringIO(document), 'Changes', chunk_size))
+            self.assertEqual(changes, [{'x': 10}, 2.5, True])
+
+    def test_missing_changes(self):
+        """Test documents without a Changes list"""
+        with self.assertRaises(ValueError):
+            list(cfnsafeset.core.iter_json_list(io.StringIO('{"A": 1}'), 'Changes'))
+        with self.assertRaises(ValueError):
+            list(cfnsafeset.core.iter_json_list(io.StringIO('{"Changes": [1,'), 'Changes'))
+
+    def test_trailing_data(self):
+        """Test data after the closing brace is rejected"""
+        for chunk_size in [1, 3, 100]:
+            changes = list(cfnsafeset.core.iter_json_list(
+                io.StringIO('{"Changes": [1, 2]} \n\t'), 'Changes', chunk_size))
+            self.assertEqual(changes, [1, 2])
+            with self.assertRaises(ValueError):
+                list(cfnsafeset.core.iter_json_list(
+                    io.StringIO('{"Changes": [1, 2]} {"Changes": [3]}'), 'Changes', chunk_size))
+        stdin = sys.stdin
+        sys.stdin = io.StringIO('{"Changes": []}]')
+        try:
+            with self.assertRaises(ChangeSetFileError):
+                list(self.load_change_set('-'))
+        finally:
+            sys.stdin = stdin
+
+    def test_load_from_stdin(self):
+        """Test - reads the change set from standard input"""
+        with open(FIXTURES[0]) as change_file:
+            document = change_file.read()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO(document)
+        try:
+            changes = list(self.load_change_set('-'))
+        finally:
+            sys.stdin = stdin
+        self.assertEqual(len(changes), 2)
+
+    def test_file_not_found(self):
+        """Test unreadable files raise ChangeSetFileError"""
+        with self.assertRaises(ChangeSetFileError):
+            list(self.load_change_set('fixtures/changesets/not-found.json'))
+        with self.assertRaises(ChangeSetFileError):
+            list(self.load_change_set('fixtures/changesets'))
@@ -0,0 +1,66 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import os
+import subprocess
+import sys
+import time
+import cfnsafeset  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+# Cold start budget in seconds for runs that never touch AWS
+STARTUP_BUDGET = float(os.environ.get('CFN_SAFESET_STARTUP_BUDGET', '1.0'))
+HEAVY_MODULES = ['boto3', 'botocore', 'pkg_resources']
+
+PROBE = '''
+import sys
+import cfnsafeset.__main__
+sys.argv = ['cfn-safeset'] + sys.argv[1:]
+code = cfnsafeset.__main__.main()
+print('HEAVY:' + ','.join(sorted(m for m in %r if m in sys.modules)))
+sys.exit(code)
+''' % HEAVY_MODULES
+
+
+class TestStartup(BaseTestCase):
+    """Test cold start cost of runs that do not use AWS """
+
+    def run_cold(self, *args):
+        """Run cfn-safeset in a fresh interpreter and return (seconds, heavy modules)"""
+        env = dict(os.environ)
+        src = os.path.dirname(os.path.dirname(os.path.abspath(cfnsafeset.__file__)))
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [src, env.get('PYTHONPATH')]))
+        start = time.time()
+        process = subprocess.Popen(
+            [sys.executable, '-c', PROBE] + list(args),
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+        stdout, _ = process.communicate()
+        elapsed = time.time() - start
+        marker = [line for line in stdout.decode('utf-8').splitlines()
+                  if line.startswith('HEAVY:')]
+        return elapsed, marker[-1][len('HEAVY:'):]
+
+    def test_file_startup(self):
+        """Test -f stays off the AWS import path and within budget"""
+        elapsed, loaded = self.run_cold('-f', 'fixtures/changesets/db-replace-change.json')
+        self.assertEqual(loaded, '')
+        self.assertLess(elapsed, STARTUP_BUDGET)
+
+    def test_list_startup(self):
+        """Test -l stays off the AWS import path and within budget"""
+        elapsed, loaded = self.run_cold('-l')
+        self.assertEqual(loaded, '')
+        self.assertLess(elapsed, STARTUP_BUDGET)
@@ -0,0 +1,153 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import datetime
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from botocore.exceptions import ClientError, NoCredentialsError
+import cfnsafeset.clients  # pylint: disable=E0401
+import cfnsafeset.credentials  # pylint: disable=E0401
+from cfnsafeset.exceptions import CredentialsError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+ROLE = 'arn:aws:iam::111111111111:role/cfn-safeset-read'
+OTHER_ROLE = 'arn:aws:iam::222222222222:role/cfn-safeset-read'
+
+
+class FakeSts(object):
+    """Hand out numbered credentials and count AssumeRole calls"""
+    def __init__(self, lifetime=3600, error=None, clock=time.time):
+        self.lifetime = lifetime
+        self.clock = clock
+        self.error = error
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def assume_role(self, RoleArn, RoleSessionName, DurationSeconds):  # pylint: disable=C0103,W0613
+        """Return temporary credentials for a role"""
+        if self.error is not None:
+            raise self.error
+        with self.lock:
+            self.calls.append(RoleArn)
+            number = len(self.calls)
+        # Let concurrent callers pile up on the same role
+        time.sleep(0.01)
+        expiration = datetime.datetime.utcfromtimestamp(int(self.clock()) + self.lifetime)
+        return {'Credentials': {
+            'AccessKeyId': 'AKID%d' % number,
+            'SecretAccessKey': 'secret',
+            'SessionToken': 'token',
+            'Expiration': expiration,
+        }}
+
+
+class TestCredentials(BaseTestCase):
+    """Test role lists and the assumed role credential cache"""
+
+    def setUp(self):
+        """Setup"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.cache_dir, 'credentials')
+
+    def tearDown(self):
+        """Teardown"""
+        shutil.rmtree(self.cache_dir)
+
+    def test_load_roles(self):
+        """Test roles come from the command line and a file, without duplicates"""
+        filename = os.path.join(self.cache_dir, 'roles.txt')
+        with open(filename, 'w') as roles_file:
+            roles_file.write('# workload accounts\n%s\n\n%s\n' % (OTHER_ROLE, ROLE))
+        self.assertEqual(cfnsafeset.credentials.load_roles([ROLE], filename),
+                         [ROLE, OTHER_ROLE])
+        with self.assertRaises(ValueError):
+            cfnsafeset.credentials.load_roles(['111111111111'])
+        with self.assertRaises(ValueError):
+            cfnsafeset.credentials.load_roles(None, os.path.join(self.cache_dir, 'missing'))
+        self.assertEqual(cfnsafeset.credentials.account_id(ROLE), '111111111111')
+
+    def test_reuses_until_expiry(self):
+        """Test credentials are reused in memory and on disk until they expire"""
+        sts = FakeSts()
+        cache = cfnsafeset.credentials.CredentialCache(self.directory)
+        first = cache.get(ROLE, None, lambda: sts)
+        self.assertIs(cache.get(ROLE, None, lambda: sts), first)
+        # A later run finds them on disk
+        later = cfnsafeset.credentials.CredentialCache(self.directory)
+        self.assertEqual(later.get(ROLE, None, lambda: sts)['AccessKeyId'], 'AKID1')
+        self.assertEqual(sts.calls, [ROLE])
+        mode = os.stat(os.path.join(self.directory, os.listdir(self.directory)[0])).st_mode
+        self.assertEqual(stat.S_IMODE(mode), 0o600)
+        # Close to expiry they are assumed again
+        expiring = cfnsafeset.credentials.CredentialCache(
+            self.directory, clock=lambda: time.time() + 3500)
+        self.assertEqual(expiring.get(ROLE, None, lambda: sts)['AccessKeyId'], 'AKID2')
+
+    def test_keyed_by_profile(self):
+        """Test a role assumed from another profile is not reused"""
+        sts = FakeSts()
+        cache = cfnsafeset.credentials.CredentialCache(self.directory)
+        cache.get(ROLE, None, lambda: sts)
+        cache.get(ROLE, 'deploy', lambda: sts)
+        self.assertEqual(sts.calls, [ROLE, ROLE])
+
+    def test_concurrent_callers_assume_once(self):
+        """Test threads asking for the same role share one AssumeRole call"""
+        sts = FakeSts()
+        cache = cfnsafeset.credentials.CredentialCache(self.directory)
+        threads = [threading.Thread(target=cache.get, args=(role, None, lambda: sts))
+                   for role in [ROLE, OTHER_ROLE] * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(sts.calls), [ROLE, OTHER_ROLE])
+
+    def test_assume_role_error(self):
+        """Test STS errors raise CredentialsError"""
+        sts = FakeSts(error=ClientError(
+            {'Error': {'Code': 'AccessDenied', 'Message': 'Not authorized'}}, 'AssumeRole'))
+        cache = cfnsafeset.credentials.CredentialCache(self.directory)
+        with self.assertRaises(CredentialsError):
+            cache.get(ROLE, None, lambda: sts)
+
+    def test_no_source_credentials(self):
+        """Test missing source credentials or profiles raise CredentialsError"""
+        cache = cfnsafeset.credentials.CredentialCache(self.directory)
+        with self.assertRaises(CredentialsError):
+            cache.get(ROLE, None, lambda: FakeSts(error=NoCredentialsError()))
+        pool = cfnsafeset.clients.ClientPool(credentials=cache)
+        with self.assertRaises(CredentialsError):
+            pool.get('us-east-1', 'cfn-safeset-no-such-profile', ROLE)
+
+    def test_pool_replaces_client_on_renewal(self):
+        """Test the pool keeps one client per role and region until credentials renew"""
+        now = [time.time()]
+        sts = FakeSts(clock=lambda: now[0])
+        cache = cfnsafeset.credentials.CredentialCache(self.directory, clock=lambda: now[0])
+        pool = cfnsafeset.clients.ClientPool(credentials=cache)
+        pool.credentials.get(ROLE, None, lambda: sts)
+        client = pool.get('us-east-1', None, ROLE)
+        self.assertIs(pool.get('us-east-1', None, ROLE), client)
+        self.assertIsNot(pool.get('eu-west-1', None, ROLE), client)
+        now[0] += 3500
+        pool.credentials.get(ROLE, None, lambda: sts)
+        self.assertIsNot(pool.get('us-east-1', None, ROLE), client)
+        self.assertEqual(len(sts.calls), 2)
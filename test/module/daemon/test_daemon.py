@@ -0,0 +1,142 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import logging
+import os
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import cfnsafeset.__main__  # pylint: disable=E0401
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.daemon  # pylint: disable=E0401
+import cfnsafeset.files  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from cfnsafeset.exceptions import DaemonError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class TestDaemon(BaseTestCase):
+    """Test the check daemon and its client """
+
+    def setUp(self):
+        """Setup"""
+        self.directory = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.directory, 'daemon.sock')
+        config = cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False)
+        self.server = cfnsafeset.daemon.create_server(
+            self.socket_path, compile_config(config), None)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def tearDown(self):
+        """Teardown"""
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def request_file(self, filename, level=logging.WARNING):
+        """Check an exported change set through the daemon"""
+        with open(filename) as change_file:
+            request = {'Document': change_file.read(), 'LogLevel': level}
+        return cfnsafeset.daemon.request_check(request, self.socket_path)
+
+    def test_stateful_document(self):
+        """Test a stateful replacement returns exit code 2 and its warning"""
+        response = self.request_file('fixtures/changesets/db-replace-change.json')
+        self.assertEqual(response['ExitCode'], 2)
+        self.assertEqual(len(response['Log']), 1)
+        self.assertEqual(response['Log'][0][0], logging.WARNING)
+        self.assertIn('DBCluster', response['Log'][0][1])
+
+    def test_invalid_document(self):
+        """Test an unparsable document returns exit code 1"""
+        response = cfnsafeset.daemon.request_check(
+            {'Document': '{"Changes": ['}, self.socket_path)
+        self.assertEqual(response['ExitCode'], 1)
+
+    def test_no_daemon(self):
+        """Test the client reports a missing daemon"""
+        self.assertIsNone(cfnsafeset.daemon.request_check(
+            {'Document': '{}'}, os.path.join(self.directory, 'missing.sock')))
+        self.assertTrue(cfnsafeset.daemon.is_running(self.socket_path))
+
+    def forwards(self, argv):
+        """Whether a command line would be sent to the daemon"""
+        parser = cfnsafeset.core.create_parser()
+        args = parser.parse_args(argv + ['--use-daemon'])
+        filenames = cfnsafeset.files.expand_paths(args.file) if args.file else []
+        return cfnsafeset.daemon.can_forward(args, filenames, parser)
+
+    def test_forwards_plain_checks_only(self):
+        """Test only a single -f file or -c/-s check goes to the daemon"""
+        self.assertTrue(self.forwards(['-f', 'changes.json', '-i', '--fail-fast']))
+        self.assertTrue(self.forwards(['-c', 'cs', '-s', 'stack', '-r', 'eu-west-1', '--wait']))
+        self.assertFalse(self.forwards(['-f', 'a.json', 'b.json']))
+        self.assertFalse(self.forwards(['-c', 'cs']))
+        self.assertFalse(self.forwards(['-l']))
+        self.assertFalse(self.forwards(['-f', 'changes.json', '--root-cause']))
+        self.assertFalse(self.forwards(['-c', 'cs', '-s', 'stack', '--endpoint-url', 'http://x']))
+
+    def test_stdin_fallback(self):
+        """Test standard input read for the daemon is still checked in-process"""
+        parser = cfnsafeset.core.create_parser()
+        args = parser.parse_args([
+            '-f', '-', '--daemon-socket', os.path.join(self.directory, 'missing.sock')])
+        with open('fixtures/changesets/db-replace-change.json') as change_file:
+            document = change_file.read()
+        stdin = sys.stdin
+        sys.stdin = io.StringIO(document)
+        try:
+            self.assertIsNone(cfnsafeset.__main__.run_with_daemon(args))
+            self.assertEqual(len(list(cfnsafeset.core.load_cs_file('-'))), 2)
+        finally:
+            sys.stdin = stdin
+
+    def test_nested_stays_in_process(self):
+        """Test --nested is not sent to the daemon, which only checks the top stack"""
+        self.assertFalse(self.forwards(['-c', 'cs', '-s', 'stack', '--nested']))
+
+    def test_sweep_stays_in_process(self):
+        """Test --sweep is not sent to the daemon as a check without a change set"""
+        self.assertFalse(self.forwards(['--sweep']))
+        self.assertFalse(self.forwards(['--sweep', '--regions', 'us-east-1', 'eu-west-1']))
+
+    def test_predict_stays_in_process(self):
+        """Test --predict and --build-replacement-index are not sent to the daemon"""
+        self.assertFalse(self.forwards(['--predict', 'deployed.yaml', 'proposed.yaml']))
+        self.assertFalse(self.forwards(['--build-replacement-index', 'spec.json']))
+
+    def test_cache_stays_in_process(self):
+        """Test --cache runs use the local result cache instead of the daemon"""
+        self.assertFalse(self.forwards(['-c', 'cs', '-s', 'stack', '--cache']))
+        self.assertFalse(self.forwards(['-c', 'cs', '-s', 'stack', '--incremental']))
+
+    def test_unanswered_request(self):
+        """Test a daemon that does not answer in time is an error, not a fallback"""
+        path = os.path.join(self.directory, 'silent.sock')
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        try:
+            with self.assertRaises(DaemonError):
+                cfnsafeset.daemon.request_check({'Document': '{}'}, path, 0.2)
+        finally:
+            listener.close()
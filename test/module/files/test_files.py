@@ -0,0 +1,85 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import pickle
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.files  # pylint: disable=E0401
+from cfnsafeset.exceptions import ChangeSetFileError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+REPLACE = 'fixtures/changesets/db-replace-change.json'
+PARAMETER = 'fixtures/changesets/sample-parameter-change.json'
+
+
+class TestFiles(BaseTestCase):
+    """Test scanning many change set files"""
+
+    def setUp(self):
+        """Load the packaged config"""
+        self.config = cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE, use_cache=False)
+
+    def test_expand_paths(self):
+        """Test globs are expanded, sorted and de-duplicated"""
+        filenames = cfnsafeset.files.expand_paths(
+            [REPLACE, 'fixtures/changesets/*-change.json', 'missing.json'])
+        self.assertEqual(filenames[0], REPLACE)
+        self.assertEqual(filenames[-1], 'missing.json')
+        self.assertEqual(filenames.count(REPLACE), 1)
+        self.assertIn(PARAMETER, filenames)
+        self.assertEqual(filenames[1:-1], sorted(filenames[1:-1]))
+        with self.assertRaises(ChangeSetFileError):
+            cfnsafeset.files.expand_paths(['fixtures/changesets/*.nothing'])
+
+    def test_scan_files_in_order(self):
+        """Test results come back in input order across processes"""
+        filenames = [PARAMETER, REPLACE, 'missing.json'] * 4
+        results = list(cfnsafeset.files.scan_files(filenames, self.config, jobs=3))
+        self.assertEqual([result[0] for result in results], filenames)
+        by_name = dict((result[0], result) for result in results)
+        self.assertEqual(by_name[PARAMETER][1:], ([], None))
+        self.assertEqual([finding.logical_id for finding in by_name[REPLACE][1]],
+                         ['DBCluster'])
+        self.assertIn('not found', by_name['missing.json'][2])
+
+    def test_report_files(self):
+        """Test the combined exit code"""
+        config = self.config
+        self.assertEqual(cfnsafeset.files.report_files(
+            cfnsafeset.files.scan_files([PARAMETER, PARAMETER], config, jobs=1)), 0)
+        self.assertEqual(cfnsafeset.files.report_files(
+            cfnsafeset.files.scan_files([PARAMETER, 'missing.json'], config, jobs=1)), 1)
+        self.assertEqual(cfnsafeset.files.report_files(
+            cfnsafeset.files.scan_files(['missing.json', REPLACE], config, jobs=1)), 2)
+
+    def test_fail_fast(self):
+        """Test scanning stops at the first stateful file"""
+        scanned = []
+
+        def results():
+            """Record which files were consumed"""
+            for result in cfnsafeset.files.scan_files(
+                    [REPLACE, PARAMETER, 'missing.json'], self.config, jobs=1, fail_fast=True):
+                scanned.append(result[0])
+                yield result
+
+        self.assertEqual(cfnsafeset.files.report_files(results(), fail_fast=True), 2)
+        self.assertEqual(scanned, [REPLACE])
+
+    def test_finding_pickles(self):
+        """Test findings survive the trip back from a worker"""
+        finding = cfnsafeset.core.Finding('Db', 'AWS::RDS::DBCluster', 'Replace', ['Engine'])
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            self.assertEqual(pickle.loads(pickle.dumps(finding, protocol)), finding)
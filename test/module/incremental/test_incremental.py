@@ -0,0 +1,150 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import argparse
+import copy
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import cfnsafeset.classifier  # pylint: disable=E0401
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.incremental  # pylint: disable=E0401
+import cfnsafeset.results  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+FIXTURE = 'fixtures/changesets/db-replace-change.json'
+
+
+class FakeClient(object):
+    """Serve one change set document"""
+    def __init__(self, change_set):
+        self.change_set = change_set
+
+    def describe_change_set(self, **kwargs):  # pylint: disable=W0613
+        """Return the document"""
+        return self.change_set
+
+
+class TestIncremental(BaseTestCase):
+    """Test incremental re-evaluation of a stack's change sets"""
+
+    def setUp(self):
+        """Setup"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.previous = os.environ.get('CFN_SAFESET_CACHE_DIR')
+        os.environ['CFN_SAFESET_CACHE_DIR'] = self.cache_dir
+        self.config = cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False)
+        self.digest = cfnsafeset.results.config_digest(self.config)
+        self.classifier = cfnsafeset.classifier.compile_config(self.config)
+        with open(FIXTURE) as change_file:
+            self.change_set = json.load(change_file)
+
+    def tearDown(self):
+        """Teardown"""
+        if self.previous is None:
+            del os.environ['CFN_SAFESET_CACHE_DIR']
+        else:
+            os.environ['CFN_SAFESET_CACHE_DIR'] = self.previous
+        shutil.rmtree(self.cache_dir)
+
+    def check(self, change_set, digest=None, fail_fast=False):
+        """Run an incremental check and return the verdict and printed report"""
+        args = argparse.Namespace(
+            changeset=change_set['ChangeSetName'], stack='clusterTest',
+            region='us-east-2', profile=None, cache_max_age=3600,
+            cache_max_entries=10, wait_timeout=None)
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            verdict = cfnsafeset.incremental.check_change_set(
+                args, digest or self.digest, self.classifier,
+                cf_client=FakeClient(change_set), fail_fast=fail_fast)
+            return verdict, sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+
+    def recreated(self):
+        """Change set recreated after DBCluster no longer needs replacing"""
+        change_set = copy.deepcopy(self.change_set)
+        change_set['ChangeSetId'] = change_set['ChangeSetId'].replace('c050edb8', 'd161fec9')
+        resource_change = change_set['Changes'][0]['ResourceChange']
+        resource_change['Replacement'] = 'False'
+        resource_change['Details'] = resource_change['Details'][:1]
+        return change_set
+
+    def test_first_check_stores_fingerprints(self):
+        """Test the first check of a stack stores a fingerprint per entry"""
+        verdict, report = self.check(self.change_set)
+        self.assertTrue(verdict)
+        self.assertEqual(report, '')
+        state = cfnsafeset.incremental.load_state(self.change_set['StackId'], 3600)
+        self.assertEqual(state['ChangeSetId'], self.change_set['ChangeSetId'])
+        self.assertTrue(state['Verdict'])
+        self.assertEqual(list(state['Entries']), ['DBCluster', 'DBClusterSG'])
+        self.assertEqual(state['Entries']['DBCluster']['Finding'],
+                         ['Replace', ['DatabaseName']])
+
+    def test_fail_fast_keeps_state(self):
+        """Test --fail-fast stops at the first finding without storing a partial verdict"""
+        verdict, report = self.check(self.change_set, fail_fast=True)
+        self.assertTrue(verdict)
+        self.assertEqual(report, '')
+        self.assertIsNone(cfnsafeset.incremental.load_state(self.change_set['StackId'], 3600))
+        entries, _ = cfnsafeset.incremental.evaluate(
+            self.change_set['Changes'], self.classifier, fail_fast=True)
+        self.assertEqual(list(entries), ['DBCluster'])
+
+    def test_reports_changes_since_last_verdict(self):
+        """Test a recreated change set reports changed entries and the new verdict"""
+        self.check(self.change_set)
+        verdict, report = self.check(self.recreated())
+        self.assertFalse(verdict)
+        self.assertIn('Since change set %s:' % self.change_set['ChangeSetId'], report)
+        self.assertIn('~ DBCluster (AWS::RDS::DBCluster) Modify, Replacement False: '
+                      'Replacement, Details changed', report)
+        self.assertIn('resolved: Replace DBCluster (AWS::RDS::DBCluster)', report)
+        self.assertIn('1 unchanged (1 verdicts reused)', report)
+        self.assertIn('Verdict: no stateful changes (was: stateful changes)', report)
+
+    def test_unchanged_entries_are_not_classified(self):
+        """Test only entries with a new fingerprint are classified again"""
+        previous, _ = cfnsafeset.incremental.evaluate(
+            self.change_set['Changes'], self.classifier)
+        # Reused findings come from previous, not from classifying the change
+        previous['DBClusterSG']['Finding'] = ['Remove', []]
+        entries, reused = cfnsafeset.incremental.evaluate(
+            self.recreated()['Changes'], self.classifier, previous)
+        self.assertEqual(reused, 1)
+        self.assertEqual(entries['DBClusterSG']['Finding'], ['Remove', []])
+        self.assertIsNone(entries['DBCluster']['Finding'])
+
+    def test_config_change_reclassifies(self):
+        """Test verdicts are not reused under a different config"""
+        self.check(self.change_set, digest='other')
+        verdict, report = self.check(self.change_set)
+        self.assertTrue(verdict)
+        self.assertIn('2 unchanged (0 verdicts reused)', report)
+
+    def test_pending_change_set_not_stored(self):
+        """Test fingerprints are only stored for complete change sets"""
+        change_set = copy.deepcopy(self.change_set)
+        change_set['Status'] = 'CREATE_IN_PROGRESS'
+        self.assertTrue(self.check(change_set)[0])
+        self.assertIsNone(cfnsafeset.incremental.load_state(change_set['StackId'], 3600))
@@ -0,0 +1,122 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import os
+import shutil
+import socket
+import stat
+import tempfile
+import cfnsafeset.metrics  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class FakeClock(object):
+    """Clock that only moves when told to"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestMetrics(BaseTestCase):
+    """Test phase timers, counters and exporters"""
+
+    def test_nested_phases_are_exclusive(self):
+        """Test time in an inner phase is not charged to the outer one"""
+        clock = FakeClock()
+        metrics = cfnsafeset.metrics.Metrics(clock=clock)
+        with metrics.phase('detect'):
+            clock.now += 1.0
+            with metrics.phase('retrieve'):
+                clock.now += 3.0
+            clock.now += 0.5
+        self.assertEqual(metrics.snapshot()['phases'], {'detect': 1.5, 'retrieve': 3.0})
+
+    def test_timed_iter(self):
+        """Test time spent producing items is charged to the phase"""
+        clock = FakeClock()
+        metrics = cfnsafeset.metrics.Metrics(clock=clock)
+
+        def slow_items():
+            """Each item takes two seconds"""
+            for item in range(3):
+                clock.now += 2.0
+                yield item
+
+        with metrics.phase('detect'):
+            for _ in metrics.timed_iter(slow_items(), 'parse'):
+                clock.now += 0.25
+                metrics.incr('changes_scanned')
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['phases'], {'detect': 0.75, 'parse': 6.0})
+        self.assertEqual(snapshot['counters']['changes_scanned'], 3)
+
+    def test_parse_target(self):
+        """Test --metrics targets"""
+        parse = cfnsafeset.metrics.parse_target
+        self.assertEqual(parse('prometheus:/var/lib/node/cfn.prom'),
+                         ('prometheus', '/var/lib/node/cfn.prom'))
+        self.assertEqual(parse('statsd:localhost:8125'), ('statsd', ('localhost', 8125)))
+        self.assertEqual(parse('json:::1:9000'), ('json', ('::1', 9000)))
+        for value in ('graphite:localhost:2003', 'statsd:localhost', 'prometheus:'):
+            with self.assertRaises(ValueError):
+                parse(value)
+
+    def sample(self):
+        """A sample with one phase and one counter"""
+        metrics = cfnsafeset.metrics.Metrics()
+        metrics.record('detect', 0.25)
+        metrics.incr('stateful_hits')
+        return cfnsafeset.metrics.collect(metrics, {'api_calls': 4}, 2)
+
+    def test_format_statsd(self):
+        """Test StatsD lines"""
+        lines = cfnsafeset.metrics.format_statsd(self.sample()).split('\n')
+        self.assertIn('cfnsafeset.phase.detect:250.000|ms', lines)
+        self.assertIn('cfnsafeset.stateful_hits:1|c', lines)
+        self.assertIn('cfnsafeset.api_calls:4|c', lines)
+        self.assertIn('cfnsafeset.exit_code:2|g', lines)
+
+    def test_export_prometheus(self):
+        """Test the textfile is written world-readable"""
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'cfn-safeset.prom')
+            cfnsafeset.metrics.export(('prometheus', path), self.sample())
+            with open(path) as prom_file:
+                text = prom_file.read()
+            self.assertIn('cfnsafeset_phase_seconds{phase="detect"} 0.25\n', text)
+            self.assertIn('cfnsafeset_exit_code 2\n', text)
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o644)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_export_json(self):
+        """Test a JSON line is sent over UDP"""
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            receiver.bind(('127.0.0.1', 0))
+            receiver.settimeout(5)
+            cfnsafeset.metrics.export(
+                ('json', receiver.getsockname()), self.sample())
+            payload = json.loads(receiver.recv(65536).decode('utf-8'))
+        finally:
+            receiver.close()
+        self.assertEqual(payload['exit_code'], 2)
+        self.assertEqual(payload['phases'], {'detect': 0.25})
+        self.assertEqual(payload['counters']['api_calls'], 4)
@@ -0,0 +1,144 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.nested  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from cfnsafeset.exceptions import (  # pylint: disable=E0401
+    ChangeSetNotFoundError, ChangeSetRetrievalError)
+from testlib.testcase import BaseTestCase
+
+
+def stack_change(logical_id, change_set_id):
+    """Nested stack entry pointing at its own change set"""
+    return {'Type': 'Resource', 'ResourceChange': {
+        'Action': 'Modify', 'LogicalResourceId': logical_id,
+        'ResourceType': 'AWS::CloudFormation::Stack', 'Replacement': 'False',
+        'ChangeSetId': change_set_id, 'Details': []}}
+
+
+def table_change(logical_id):
+    """Stateful removal"""
+    return {'Type': 'Resource', 'ResourceChange': {
+        'Action': 'Remove', 'LogicalResourceId': logical_id,
+        'ResourceType': 'AWS::DynamoDB::Table', 'Details': []}}
+
+
+class FakeClient(object):
+    """Serve a tree of change sets by name"""
+    def __init__(self, change_sets):
+        self.change_sets = change_sets
+        self.lock = threading.Lock()
+        self.calls = []
+
+    def describe_change_set(self, ChangeSetName, **kwargs):  # pylint: disable=C0103,W0613
+        """Return the named change set"""
+        with self.lock:
+            self.calls.append(ChangeSetName)
+        if ChangeSetName not in self.change_sets:
+            raise ChangeSetNotFoundError(ChangeSetName)
+        return {'Changes': self.change_sets[ChangeSetName]}
+
+
+class PagedClient(FakeClient):
+    """Serve the root change set in two pages, holding back the second
+    until a nested change set has been requested"""
+    def __init__(self, change_sets):
+        super(PagedClient, self).__init__(change_sets)
+        self.child_requested = threading.Event()
+        self.child_first = False
+
+    def describe_change_set(self, ChangeSetName, **kwargs):  # pylint: disable=C0103
+        """Return the named change set, paging the root"""
+        if ChangeSetName != 'root':
+            self.child_requested.set()
+            return super(PagedClient, self).describe_change_set(ChangeSetName, **kwargs)
+        if 'NextToken' not in kwargs:
+            response = super(PagedClient, self).describe_change_set(ChangeSetName, **kwargs)
+            response['NextToken'] = 'page-2'
+            return response
+        self.child_first = self.child_requested.wait(10)
+        return {'Changes': []}
+
+
+class TestNested(BaseTestCase):
+    """Test recursive nested stack scanning """
+
+    def setUp(self):
+        """Setup"""
+        self.classifier = compile_config(cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False))
+
+    def test_tree(self):
+        """Test findings in grandchildren are reported with their path"""
+        client = FakeClient({
+            'root': [stack_change('Data', 'arn:data'), stack_change('App', 'arn:app')],
+            'arn:data': [stack_change('Tables', 'arn:tables')],
+            'arn:app': [],
+            'arn:tables': [table_change('Orders')],
+        })
+        nodes = cfnsafeset.nested.scan_tree(
+            'root', 'stack', 'us-east-1', None, client, self.classifier, jobs=4)
+        self.assertEqual(sorted(client.calls), ['arn:app', 'arn:data', 'arn:tables', 'root'])
+        self.assertEqual(cfnsafeset.nested.report_tree(nodes), 2)
+        tables = [node for node in nodes if node.path == ['Data', 'Tables']][0]
+        self.assertEqual(cfnsafeset.nested.qualified(tables.findings[0], tables.path).logical_id,
+                         'Data/Tables/Orders')
+
+    def test_children_scheduled_early(self):
+        """Test a nested change set is fetched before its parent's later pages"""
+        client = PagedClient({
+            'root': [stack_change('Data', 'arn:data')],
+            'arn:data': [table_change('Orders')],
+        })
+        nodes = cfnsafeset.nested.scan_tree(
+            'root', 'stack', 'us-east-1', None, client, self.classifier, jobs=2)
+        self.assertTrue(client.child_first)
+        self.assertEqual(cfnsafeset.nested.report_tree(nodes), 2)
+
+    def test_fail_fast(self):
+        """Test a finding in the root stops nested change sets being fetched"""
+        client = FakeClient({
+            'root': [table_change('Sessions'), stack_change('Data', 'arn:data')],
+            'arn:data': [table_change('Orders')],
+        })
+        nodes = cfnsafeset.nested.scan_tree(
+            'root', 'stack', 'us-east-1', None, client, self.classifier, fail_fast=True)
+        self.assertEqual(client.calls, ['root'])
+        self.assertEqual(cfnsafeset.nested.report_tree(nodes), 2)
+
+    def test_missing_child(self):
+        """Test an unreadable nested change set fails the check"""
+        client = FakeClient({'root': [stack_change('Data', 'arn:gone')]})
+        nodes = cfnsafeset.nested.scan_tree(
+            'root', 'stack', 'us-east-1', None, client, self.classifier)
+        self.assertEqual(cfnsafeset.nested.report_tree(nodes), 1)
+
+    def test_client_error(self):
+        """Test a client that cannot be created fails on the root change set"""
+        nodes = cfnsafeset.nested.scan_tree(
+            'root', 'stack', 'us-east-1', 'cfn-safeset-no-such-profile', None,
+            self.classifier)
+        with self.assertRaises(ChangeSetRetrievalError):
+            cfnsafeset.nested.report_tree(nodes)
+
+    def test_missing_root(self):
+        """Test an unreadable root change set raises"""
+        nodes = cfnsafeset.nested.scan_tree(
+            'root', 'stack', 'us-east-1', None, FakeClient({}), self.classifier)
+        with self.assertRaises(ChangeSetNotFoundError):
+            cfnsafeset.nested.report_tree(nodes)
@@ -0,0 +1,104 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import cfnsafeset.core  # pylint: disable=E0401
+from cfnsafeset.classifier import Classifier, Policies, TypePolicy  # pylint: disable=E0401
+from cfnsafeset.exceptions import ConfigError  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+SAMPLE = 'fixtures/changesets/sample-replacement-change.json'
+
+
+def detail(name, source='DirectModification', evaluation='Static', recreation='Always'):
+    """Property detail in describe_change_set form"""
+    return {'ChangeSource': source, 'Evaluation': evaluation, 'Target': {
+        'Attribute': 'Properties', 'Name': name, 'RequiresRecreation': recreation}}
+
+
+class TestPolicy(BaseTestCase):
+    """Test property-level replacement policies"""
+
+    def setUp(self):
+        """Packaged config"""
+        self.config = cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE, use_cache=False)
+
+    def findings(self, config):
+        """Findings for the sample EC2 replacement under a config"""
+        classifier = Classifier(
+            config['ChangeTypes'], config['StatefulResources'], config.get('Policies'))
+        return list(cfnsafeset.core.iter_findings(
+            self.load_change_set(SAMPLE), classifier.extractors, classifier))
+
+    def test_unconditional_rules(self):
+        """Test plain property lists are judged with set operations"""
+        policy = TypePolicy(allow=[['InstanceType', 'UserData']], deny=[['UserData']])
+        self.assertEqual(policy.allow_always, frozenset(['InstanceType', 'UserData']))
+        self.assertEqual(policy.allow_rules, ())
+        self.assertEqual(policy.unapproved([detail('InstanceType')]), frozenset())
+        self.assertEqual(policy.unapproved([detail('UserData'), detail('ImageId')]),
+                         frozenset(['UserData', 'ImageId']))
+        self.assertEqual(policy.unapproved([detail('InstanceType', recreation='Never')]),
+                         frozenset())
+
+    def test_conditional_rules(self):
+        """Test ChangeSource and Evaluation conditions apply per detail"""
+        policy = TypePolicy(
+            allow=[{'Properties': ['KeyName'], 'ChangeSource': 'ParameterReference'}],
+            deny=[{'Evaluation': ['Dynamic']}])
+        self.assertEqual(policy.unapproved([
+            detail('KeyName', 'ParameterReference')]), set())
+        # Every detail for a property must be approved
+        self.assertEqual(policy.unapproved([
+            detail('KeyName', 'ParameterReference'), detail('KeyName')]), set(['KeyName']))
+        self.assertEqual(policy.unapproved([
+            detail('KeyName', 'ParameterReference', 'Dynamic')]), set(['KeyName']))
+
+    def test_policy_lookup(self):
+        """Test exact types win over the longest namespace"""
+        policies = Policies({
+            'AWS::EC2::Instance': {'Allow': [['InstanceType']]},
+            'AWS::EC2::*': {'Deny': [{}]},
+            '*': {'Allow': [['Tags']]},
+        })
+        self.assertIs(policies.get('AWS::EC2::Instance'), policies.exact['AWS::EC2::Instance'])
+        self.assertTrue(policies.get('AWS::EC2::Volume').deny_all)
+        self.assertEqual(policies.get('AWS::RDS::DBCluster').allow_always, frozenset(['Tags']))
+
+    def test_invalid_policies(self):
+        """Test malformed policies are rejected"""
+        for policies in ({'AWS::EC2::Instance': {'Approve': []}},
+                         {'AWS::EC2::Inst*': {'Allow': []}},
+                         {'AWS::EC2::Instance': {'Allow': [{'ChangeSource': 'Manual'}]}},
+                         {'AWS::EC2::Instance': {'Allow': [{'Property': ['KeyName']}]}}):
+            with self.assertRaises(ConfigError):
+                Policies(policies)
+
+    def test_policy_file(self):
+        """Test a policy file narrows the finding to unapproved properties"""
+        self.assertEqual(self.findings(self.config)[0].properties, ('InstanceType', 'KeyName'))
+        config = cfnsafeset.core.load_policy(
+            self.config, 'fixtures/policies/ec2-instance.yaml')
+        findings = self.findings(config)
+        # KeyName is also modified directly, which the policy does not allow
+        self.assertEqual([finding.properties for finding in findings], [('KeyName',)])
+
+        config['Policies']['AWS::EC2::Instance']['Allow'].append(['KeyName'])
+        self.assertEqual(self.findings(config), [])
+
+    def test_missing_policy_file(self):
+        """Test an unreadable policy file is a config error"""
+        with self.assertRaises(ConfigError):
+            cfnsafeset.core.load_policy(self.config, 'fixtures/policies/missing.yaml')
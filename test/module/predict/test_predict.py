@@ -0,0 +1,166 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import logging
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.predict  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+DEPLOYED = 'fixtures/templates/deployed.yaml'
+PROPOSED = 'fixtures/templates/proposed.yaml'
+
+
+def by_id(changes):
+    """Index predicted changes by logical ID"""
+    return dict((change['ResourceChange']['LogicalResourceId'], change['ResourceChange'])
+                for change in changes)
+
+
+class ListHandler(logging.Handler):
+    """Keep formatted log messages"""
+    def __init__(self):
+        logging.Handler.__init__(self, logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        """Keep the message"""
+        self.messages.append(record.getMessage())
+
+
+class TestPredict(BaseTestCase):
+    """Test replacement prediction from template diffs"""
+
+    def test_short_form_intrinsics(self):
+        """Test !Ref and !GetAtt load as their long forms"""
+        template = cfnsafeset.predict.load_template(DEPLOYED)
+        props = template['Resources']['DBCluster']['Properties']
+        self.assertEqual(props['DBSubnetGroupName'], {'Ref': 'DBSubnets'})
+        self.assertEqual(props['VpcSecurityGroupIds'],
+                         [{'Fn::GetAtt': ['DBClusterSG', 'GroupId']}])
+
+    def test_predict_fixture(self):
+        """Test the packaged index flags the key schema change"""
+        changes = by_id(cfnsafeset.predict.predict(DEPLOYED, PROPOSED))
+        self.assertEqual(sorted(changes), ['DBCluster', 'DBSubnets', 'Queue', 'Sessions'])
+        self.assertEqual(changes['Queue']['Action'], 'Remove')
+        self.assertEqual(changes['Sessions']['Replacement'], 'True')
+        self.assertEqual(changes['DBCluster']['Replacement'], 'False')
+
+        config = cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE, use_cache=False)
+        classifier = compile_config(config)
+        findings = list(cfnsafeset.core.iter_findings(
+            cfnsafeset.predict.predict(DEPLOYED, PROPOSED),
+            classifier.extractors, classifier))
+        self.assertEqual([(finding.logical_id, finding.properties) for finding in findings],
+                         [('Sessions', ('KeySchema',))])
+
+    def test_replacement_propagates(self):
+        """Test replacing a resource replaces those whose immutable properties refer to it"""
+        index = {
+            'AWS::RDS::DBSubnetGroup': (frozenset(['SubnetIds']), frozenset()),
+            'AWS::RDS::DBCluster': (frozenset(['DBSubnetGroupName']), frozenset(['Engine'])),
+        }
+        deployed = cfnsafeset.predict.load_template(DEPLOYED)
+        proposed = cfnsafeset.predict.load_template(PROPOSED)
+        changes = by_id(cfnsafeset.predict.predict_changes(deployed, proposed, index))
+        self.assertEqual(changes['DBSubnets']['Replacement'], 'True')
+        cluster = changes['DBCluster']
+        self.assertEqual(cluster['Replacement'], 'True')
+        propagated = [detail for detail in cluster['Details']
+                      if detail['ChangeSource'] == 'ResourceReference']
+        self.assertEqual(len(propagated), 1)
+        self.assertEqual(propagated[0]['CausingEntity'], 'DBSubnets')
+        self.assertEqual(propagated[0]['Target']['Name'], 'DBSubnetGroupName')
+        # Mutable references to an unchanged resource stay put
+        self.assertNotIn('DBClusterSG', changes)
+
+    def test_conditional_and_type_change(self):
+        """Test conditional properties and resource type changes"""
+        index = {'AWS::RDS::DBCluster': (frozenset(), frozenset(['Engine']))}
+        deployed = {'Resources': {
+            'Db': {'Type': 'AWS::RDS::DBCluster', 'Properties': {'Engine': 'aurora'}},
+            'Disk': {'Type': 'AWS::EC2::Volume', 'Properties': {'Size': 10}}}}
+        proposed = {'Resources': {
+            'Db': {'Type': 'AWS::RDS::DBCluster', 'Properties': {'Engine': 'aurora-mysql'}},
+            'Disk': {'Type': 'AWS::EBS::Volume', 'Properties': {'Size': 10}}}}
+        changes = by_id(cfnsafeset.predict.predict_changes(deployed, proposed, index))
+        self.assertEqual(changes['Db']['Replacement'], 'Conditional')
+        self.assertEqual(changes['Db']['Details'][0]['Target']['RequiresRecreation'],
+                         'Conditionally')
+        self.assertEqual(changes['Disk']['Replacement'], 'True')
+
+    def test_unindexed_types(self):
+        """Test types missing from the index may be replaced, with a warning"""
+        index = {
+            'AWS::RDS::DBCluster': (frozenset(['DBSubnetGroupName']), frozenset()),
+            'AWS::SQS::Queue': (frozenset(['QueueName']), frozenset()),
+        }
+        deployed = {'Resources': {
+            'Subnet': {'Type': 'AWS::EC2::Subnet', 'Properties': {'CidrBlock': '10.0.0.0/24'}},
+            'Group': {'Type': 'AWS::RDS::DBSubnetGroup',
+                      'Properties': {'SubnetIds': [{'Ref': 'Subnet'}]}},
+            'Db': {'Type': 'AWS::RDS::DBCluster',
+                   'Properties': {'DBSubnetGroupName': {'Ref': 'Group'}}},
+            'Queue': {'Type': 'AWS::SQS::Queue', 'Properties': {'QueueName': 'a'}}}}
+        proposed = {'Resources': {
+            'Subnet': {'Type': 'AWS::EC2::Subnet', 'Properties': {'CidrBlock': '10.0.1.0/24'}},
+            'Group': {'Type': 'AWS::RDS::DBSubnetGroup',
+                      'Properties': {'SubnetIds': [{'Ref': 'Subnet'}]}},
+            'Db': {'Type': 'AWS::RDS::DBCluster',
+                   'Properties': {'DBSubnetGroupName': {'Ref': 'Group'}}},
+            'Queue': {'Type': 'AWS::SQS::Queue', 'Properties': {'QueueName': 'a'}}}}
+        handler = ListHandler()
+        logger = logging.getLogger('cfnsafeset')
+        logger.addHandler(handler)
+        try:
+            changes = by_id(cfnsafeset.predict.predict_changes(deployed, proposed, index))
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(len(handler.messages), 2)
+        self.assertIn('Subnet (AWS::EC2::Subnet)', handler.messages[0])
+        self.assertIn('Group (AWS::RDS::DBSubnetGroup)', handler.messages[1])
+        self.assertEqual(changes['Subnet']['Replacement'], 'Conditional')
+        self.assertEqual(changes['Group']['Replacement'], 'Conditional')
+        # The possible replacement reaches the stateful resource through the group
+        db_detail = changes['Db']['Details'][0]
+        self.assertEqual(changes['Db']['Replacement'], 'Conditional')
+        self.assertEqual(db_detail['CausingEntity'], 'Group')
+        self.assertEqual(db_detail['Target']['RequiresRecreation'], 'Conditionally')
+        self.assertNotIn('Queue', changes)
+
+        # Once the subnet is surely replaced, the cluster still only may be
+        index['AWS::EC2::Subnet'] = (frozenset(['CidrBlock']), frozenset())
+        changes = by_id(cfnsafeset.predict.predict_changes(deployed, proposed, index))
+        self.assertEqual(changes['Subnet']['Replacement'], 'True')
+        self.assertEqual(changes['Db']['Replacement'], 'Conditional')
+
+    def test_build_index(self):
+        """Test building an index from a resource specification"""
+        spec = {'ResourceSpecificationVersion': '1.2.3', 'ResourceTypes': {
+            'AWS::S3::Bucket': {'Properties': {
+                'BucketName': {'UpdateType': 'Immutable'},
+                'Tags': {'UpdateType': 'Mutable'}}},
+            'AWS::SNS::Topic': {'Properties': {'Tags': {'UpdateType': 'Mutable'}}}}}
+        index = cfnsafeset.predict.build_index(spec)
+        self.assertEqual(index, {'Source': '1.2.3', 'ResourceTypes': {
+            'AWS::S3::Bucket': {'Immutable': ['BucketName'], 'Conditional': []},
+            'AWS::SNS::Topic': {'Immutable': [], 'Conditional': []}}})
+
+    def test_missing_template(self):
+        """Test unreadable templates raise a TemplateError"""
+        with self.assertRaises(cfnsafeset.predict.TemplateError):
+            cfnsafeset.predict.load_template('fixtures/templates/missing.yaml')
@@ -0,0 +1,99 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.results  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+FIXTURE = 'fixtures/changesets/db-replace-change.json'
+
+
+class FakeClient(object):
+    """Serve one exported change set and count calls"""
+    def __init__(self, status='CREATE_COMPLETE'):
+        with open(FIXTURE) as change_file:
+            self.change_set = json.load(change_file)
+        self.change_set['Status'] = status
+        self.calls = 0
+
+    def describe_change_set(self, **kwargs):  # pylint: disable=W0613
+        """Return the fixture"""
+        self.calls += 1
+        return self.change_set
+
+
+class TestResultCache(BaseTestCase):
+    """Test the change set result cache """
+
+    def setUp(self):
+        """Setup"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.previous = os.environ.get('CFN_SAFESET_CACHE_DIR')
+        os.environ['CFN_SAFESET_CACHE_DIR'] = self.cache_dir
+        self.config = cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False)
+        self.digest = cfnsafeset.results.config_digest(self.config)
+        self.stateful = set(self.config['StatefulResources'])
+
+    def tearDown(self):
+        """Teardown"""
+        if self.previous is None:
+            del os.environ['CFN_SAFESET_CACHE_DIR']
+        else:
+            os.environ['CFN_SAFESET_CACHE_DIR'] = self.previous
+        shutil.rmtree(self.cache_dir)
+
+    def check(self, client, changeset):
+        """Run a cached check"""
+        args = argparse.Namespace(
+            changeset=changeset, stack='clusterTest', region='us-east-2', profile=None,
+            cache_max_age=3600, cache_max_entries=10, wait_timeout=None)
+        return cfnsafeset.results.check_change_set(
+            args, self.digest, self.config['ChangeTypes'], self.stateful, cf_client=client)
+
+    def test_hit_skips_api(self):
+        """Test a cached ARN is not fetched again"""
+        client = FakeClient()
+        arn = client.change_set['ChangeSetId']
+        self.assertTrue(self.check(client, 'db-replace-change'))
+        self.assertEqual(client.calls, 1)
+        self.assertTrue(self.check(client, arn))
+        self.assertEqual(client.calls, 1)
+        entry = cfnsafeset.results.load_result(arn, 3600)
+        self.assertEqual(entry['Verdicts'], {self.digest: True})
+
+    def test_pending_not_cached(self):
+        """Test change sets that are not complete are not cached"""
+        client = FakeClient('CREATE_IN_PROGRESS')
+        self.check(client, client.change_set['ChangeSetId'])
+        self.check(client, client.change_set['ChangeSetId'])
+        self.assertEqual(client.calls, 2)
+
+    def test_prune(self):
+        """Test entries beyond the limit are evicted"""
+        for index in range(5):
+            cfnsafeset.results.store_result(
+                {'ChangeSetId': 'arn:%d' % index, 'Changes': [], 'Verdicts': {}}, 3600, 3)
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, 'results'))), 3)
+        cfnsafeset.results.store_result(
+            {'ChangeSetId': 'arn:new', 'Changes': [], 'Verdicts': {}}, 3600, 3)
+        self.assertIsNotNone(cfnsafeset.results.load_result('arn:new', 3600))
+        self.assertIsNone(cfnsafeset.results.load_result('arn:new', -1))
@@ -0,0 +1,135 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import sys
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.rootcause  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from cfnsafeset.core import Finding  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+def detail(name, source, entity=None, recreation='Always', evaluation='Static'):
+    """Change detail for a property"""
+    result = {
+        'Target': {'Attribute': 'Properties', 'Name': name, 'RequiresRecreation': recreation},
+        'Evaluation': evaluation, 'ChangeSource': source}
+    if entity is not None:
+        result['CausingEntity'] = entity
+    return result
+
+
+def resource_change(logical_id, details, resource_type='AWS::EC2::SecurityGroup',
+                    replacement='True'):
+    """Monitored change of a resource"""
+    return {'Type': 'Resource', 'ResourceChange': {
+        'Action': 'Modify', 'LogicalResourceId': logical_id, 'ResourceType': resource_type,
+        'Replacement': replacement, 'Details': details}}
+
+
+class TestRootCause(BaseTestCase):
+    """Test tracing stateful replacements to their root changes"""
+
+    def setUp(self):
+        """Setup"""
+        self.classifier = compile_config(cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False))
+
+    def graph(self, changes):
+        """Graph of a list of changes"""
+        return cfnsafeset.rootcause.build_graph(changes, self.classifier.extractors)
+
+    def test_parameter_explains_dynamic_modification(self):
+        """Test a parameter edit is the only root of the db-replace fixture"""
+        changes = list(cfnsafeset.core.load_cs_file('fixtures/changesets/db-replace-change.json'))
+        graph = self.graph(changes)
+        finding = Finding('DBCluster', 'AWS::RDS::DBCluster', 'Replace', ['DatabaseName'])
+        self.assertEqual(graph.trace(finding), [(('Parameter', 'DatabaseName'), [])])
+        # The security group only changes a property that never forces replacement
+        self.assertEqual(list(graph.roots('DBCluster').items()), [
+            (('Template', 'DBClusterSG'), 'DBClusterSG'), (('Parameter', 'DatabaseName'), None)])
+
+    def test_sibling_replacement(self):
+        """Test a replacement is traced through the sibling that forces it"""
+        graph = self.graph([
+            resource_change('Database', [
+                detail('VpcSecurityGroupIds', 'ResourceAttribute', 'Group.GroupId'),
+                detail('Tags', 'DirectModification', recreation='Never')],
+                'AWS::RDS::DBInstance'),
+            resource_change('Group', [
+                detail('VpcId', 'ParameterReference', 'VpcId'),
+                detail('VpcId', 'DirectModification', evaluation='Dynamic')]),
+        ])
+        finding = Finding('Database', 'AWS::RDS::DBInstance', 'Replace', ['VpcSecurityGroupIds'])
+        self.assertEqual(graph.trace(finding), [(('Parameter', 'VpcId'), ['Group'])])
+
+    def test_approved_properties_ignored(self):
+        """Test only the properties left in the finding are traced"""
+        graph = self.graph([resource_change('Database', [
+            detail('DBInstanceClass', 'ParameterReference', 'InstanceClass'),
+            detail('Engine', 'DirectModification')], 'AWS::RDS::DBInstance')])
+        finding = Finding('Database', 'AWS::RDS::DBInstance', 'Replace', ['Engine'])
+        self.assertEqual(graph.trace(finding), [(('Template', 'Database'), [])])
+
+    def test_remove(self):
+        """Test a removal is its own root"""
+        graph = self.graph([])
+        finding = Finding('Table', 'AWS::DynamoDB::Table', 'Remove')
+        self.assertEqual(graph.trace(finding), [(('Removed', 'Table'), [])])
+
+    def test_cycle(self):
+        """Test a cycle of causes terminates"""
+        graph = self.graph([
+            resource_change('A', [detail('X', 'ResourceReference', 'B')]),
+            resource_change('B', [detail('X', 'ResourceReference', 'A'),
+                                  detail('Y', 'ParameterReference', 'P')]),
+        ])
+        self.assertEqual(list(graph.roots('A')), [('Parameter', 'P')])
+
+    def test_long_chain(self):
+        """Test a chain of 500 resources is traced without recursion"""
+        changes = [resource_change('R0', [detail('X', 'ParameterReference', 'P')])]
+        for index in range(1, 500):
+            changes.append(resource_change(
+                'R%d' % index, [detail('X', 'ResourceAttribute', 'R%d.Id' % (index - 1))]))
+        graph = self.graph(reversed(changes))
+        finding = Finding('R499', 'AWS::EC2::SecurityGroup', 'Replace', ['X'])
+        [(root, path)] = graph.trace(finding)
+        self.assertEqual(root, ('Parameter', 'P'))
+        self.assertEqual(len(path), 499)
+        self.assertEqual(path[0], 'R498')
+
+    def test_report(self):
+        """Test the printed report"""
+        changes = [
+            resource_change('Database', [
+                detail('VpcSecurityGroupIds', 'ResourceAttribute', 'Group.GroupId')],
+                'AWS::RDS::DBInstance'),
+            resource_change('Group', [detail('VpcId', 'DirectModification')]),
+        ]
+        stdout = sys.stdout
+        sys.stdout = io.StringIO()
+        try:
+            cfnsafeset.rootcause.report(changes, self.classifier)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        self.assertEqual(output.splitlines(), [
+            'Root causes:',
+            '  Replace Database (AWS::RDS::DBInstance):',
+            '    <- Group (Replace) <- template change to Group',
+        ])
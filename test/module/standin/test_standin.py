@@ -0,0 +1,129 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import xml.etree.ElementTree as ElementTree
+import cfnsafeset.standin  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+try:
+    from urllib.error import HTTPError
+    from urllib.parse import urlencode
+    from urllib.request import urlopen
+except ImportError:  # Python 2
+    from urllib import urlencode
+    from urllib2 import HTTPError, urlopen
+
+NS = '{%s}' % cfnsafeset.standin.NAMESPACE
+
+
+class TestStandIn(BaseTestCase):
+    """Test the local CloudFormation stand-in"""
+
+    def setUp(self):
+        """Serve a small account"""
+        self.server = cfnsafeset.standin.StandIn(
+            account=cfnsafeset.standin.Account(stacks=3, change_sets=2, changes=25,
+                                               nested_ratio=0.2),
+            page_size=10)
+        self.server.start()
+
+    def tearDown(self):
+        """Stop serving"""
+        self.server.stop()
+
+    def call(self, action, **params):
+        """POST a query protocol request and return (status, parsed XML)"""
+        params['Action'] = action
+        params['Version'] = '2010-05-15'
+        try:
+            response = urlopen(self.server.url, urlencode(params).encode('utf-8'), 5)
+            status = response.getcode()
+        except HTTPError as err:
+            response = err
+            status = err.code
+        return status, ElementTree.fromstring(response.read())
+
+    def result(self, action, **params):
+        """Result element of a successful call"""
+        status, root = self.call(action, **params)
+        self.assertEqual(status, 200)
+        return root.find(NS + action + 'Result')
+
+    def test_to_xml(self):
+        """Test lists become members and booleans are lower case"""
+        self.assertEqual(cfnsafeset.standin.to_xml({'Scope': ['Properties']}),
+                         '<Scope><member>Properties</member></Scope>')
+        self.assertEqual(cfnsafeset.standin.to_xml({'Done': True, 'Skip': None}),
+                         '<Done>true</Done>')
+        self.assertEqual(cfnsafeset.standin.to_xml('a<b'), 'a&lt;b')
+
+    def test_describe_pages(self):
+        """Test change sets are served in pages with NextToken"""
+        changes = []
+        token = None
+        pages = 0
+        while True:
+            params = {'ChangeSetName': 'stack-0001-cs-1', 'StackName': 'stack-0001'}
+            if token:
+                params['NextToken'] = token
+            result = self.result('DescribeChangeSet', **params)
+            changes.extend(result.find(NS + 'Changes'))
+            pages += 1
+            token = result.findtext(NS + 'NextToken')
+            if not token:
+                break
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(changes), 25)
+        self.assertEqual(result.findtext(NS + 'Status'), 'CREATE_COMPLETE')
+
+        # The same change set by ARN, and any nested change set it points at
+        arn = result.findtext(NS + 'ChangeSetId')
+        by_arn = self.result('DescribeChangeSet', ChangeSetName=arn)
+        self.assertEqual(by_arn.findtext(NS + 'ChangeSetName'), 'stack-0001-cs-1')
+        nested = [change.findtext('%sResourceChange/%sChangeSetId' % (NS, NS))
+                  for change in changes]
+        nested = [arn for arn in nested if arn]
+        self.assertTrue(nested)
+        self.assertEqual(self.result('DescribeChangeSet', ChangeSetName=nested[0])
+                         .findtext(NS + 'ChangeSetId'), nested[0])
+
+    def test_list_stacks_and_change_sets(self):
+        """Test the sweep endpoints"""
+        stacks = self.result('ListStacks').find(NS + 'StackSummaries')
+        self.assertEqual([stack.findtext(NS + 'StackName') for stack in stacks],
+                         ['stack-0000', 'stack-0001', 'stack-0002'])
+        summaries = self.result('ListChangeSets', StackName='stack-0002').find(NS + 'Summaries')
+        self.assertEqual([summary.findtext(NS + 'ExecutionStatus') for summary in summaries],
+                         ['AVAILABLE', 'AVAILABLE'])
+
+    def test_errors(self):
+        """Test unknown change sets and injected throttling"""
+        status, root = self.call('DescribeChangeSet', ChangeSetName='nope', StackName='x')
+        self.assertEqual(status, 404)
+        self.assertEqual(root.findtext('%sError/%sCode' % (NS, NS)), 'ChangeSetNotFound')
+
+        self.server.faults = cfnsafeset.standin.Faults(throttle_rate=1.0)
+        status, root = self.call('ListStacks')
+        self.assertEqual(status, 400)
+        self.assertEqual(root.findtext('%sError/%sCode' % (NS, NS)), 'Throttling')
+        self.assertEqual(self.server.stats.get('Throttling'), 1)
+
+    def test_rate_limit(self):
+        """Test requests beyond the rate limit are throttled"""
+        faults = cfnsafeset.standin.Faults(rate_limit=2)
+        codes = [faults.pick()[1] for _ in range(5)]
+        self.assertEqual(codes[:2], [None, None])
+        self.assertIn('Throttling', codes[2:])
@@ -0,0 +1,175 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import threading
+import time
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.sweep  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+def table_change(action):
+    """DynamoDB table change"""
+    return {'Type': 'Resource', 'ResourceChange': {
+        'Action': action, 'LogicalResourceId': 'Table', 'Replacement': 'False',
+        'ResourceType': 'AWS::DynamoDB::Table', 'Details': []}}
+
+
+class FakeClient(object):
+    """An account with a few stacks and change sets in one region"""
+    def __init__(self, stacks):
+        self.stacks = stacks
+
+    def list_stacks(self, **kwargs):
+        """Two stacks per page"""
+        start = int(kwargs.get('NextToken', 0))
+        names = sorted(self.stacks)
+        response = {'StackSummaries': [
+            {'StackName': name} for name in names[start:start + 2]]}
+        if start + 2 < len(names):
+            response['NextToken'] = str(start + 2)
+        return response
+
+    def list_change_sets(self, StackName):  # pylint: disable=C0103
+        """Change set summaries of a stack"""
+        return {'Summaries': [
+            {'ChangeSetId': name, 'ExecutionStatus': status}
+            for name, (status, _) in sorted(self.stacks[StackName].items())]}
+
+    def describe_change_set(self, ChangeSetName, **kwargs):  # pylint: disable=C0103,W0613
+        """Changes of a change set"""
+        for change_sets in self.stacks.values():
+            if ChangeSetName in change_sets:
+                return {'Changes': change_sets[ChangeSetName][1]}
+        raise KeyError(ChangeSetName)
+
+
+class FakePool(object):
+    """One fake client per region, or per role and region"""
+    def __init__(self, regions):
+        self.regions = regions
+
+    def get(self, region, profile=None, role=None):  # pylint: disable=W0613
+        """Client for a region"""
+        if role is not None:
+            return self.regions[(role, region)]
+        return self.regions[region]
+
+
+class TestSweep(BaseTestCase):
+    """Test account-wide sweeps """
+
+    def setUp(self):
+        """Setup"""
+        self.classifier = compile_config(cfnsafeset.core.init_config(
+            '/data/stateful-resources.yaml', use_cache=False))
+
+    def test_sweep(self):
+        """Test only AVAILABLE change sets are scanned across regions"""
+        east = FakeClient({
+            'a': {'a-1': ('AVAILABLE', [table_change('Remove')])},
+            'b': {'b-1': ('EXECUTE_COMPLETE', [table_change('Remove')]),
+                  'b-2': ('AVAILABLE', [table_change('Modify')])},
+            'c': {},
+        })
+        west = FakeClient({'d': {'d-1': ('AVAILABLE', [])}})
+        results = list(cfnsafeset.sweep.sweep(
+            ['us-east-1', 'us-west-2'], None, self.classifier, jobs=2,
+            clients=FakePool({'us-east-1': east, 'us-west-2': west})))
+        self.assertEqual(sorted(result.change_set for result in results),
+                         ['a-1', 'b-2', 'd-1'])
+        flagged = [result.change_set for result in results if result.findings]
+        self.assertEqual(flagged, ['a-1'])
+        self.assertEqual(cfnsafeset.sweep.report_sweep(results), 2)
+
+    def test_region_error(self):
+        """Test a failing region is reported without stopping the sweep"""
+        class Broken(object):
+            """Client whose ListStacks fails"""
+            def list_stacks(self, **kwargs):
+                """Fail"""
+                raise RuntimeError('denied')
+
+        results = list(cfnsafeset.sweep.sweep(
+            ['us-east-1', 'eu-west-1'], None, self.classifier,
+            clients=FakePool({'us-east-1': FakeClient({'a': {'a-1': ('AVAILABLE', [])}}),
+                              'eu-west-1': Broken()})))
+        self.assertEqual(len(results), 2)
+        self.assertEqual(cfnsafeset.sweep.report_sweep(results), 1)
+
+    def test_sweep_accounts(self):
+        """Test every region of every role's account is swept"""
+        first = 'arn:aws:iam::111111111111:role/read'
+        second = 'arn:aws:iam::222222222222:role/read'
+        results = list(cfnsafeset.sweep.sweep(
+            ['us-east-1', 'eu-west-1'], None, self.classifier, jobs=2,
+            clients=FakePool({
+                (first, 'us-east-1'): FakeClient({'a': {'a-1': ('AVAILABLE', [])}}),
+                (first, 'eu-west-1'): FakeClient({}),
+                (second, 'us-east-1'): FakeClient({}),
+                (second, 'eu-west-1'): FakeClient({
+                    'a': {'a-2': ('AVAILABLE', [table_change('Remove')])}}),
+            }), roles=[first, second]))
+        self.assertEqual(sorted((result.location, result.change_set) for result in results),
+                         [('111111111111/us-east-1', 'a-1'), ('222222222222/eu-west-1', 'a-2')])
+        self.assertEqual(cfnsafeset.sweep.report_sweep(results), 2)
+
+    def test_bounded_imap(self):
+        """Test the bounded map only pulls items as results are consumed"""
+        from multiprocessing.pool import ThreadPool
+        pulled = []
+
+        def items():
+            """Record every item pulled"""
+            for index in range(100):
+                pulled.append(index)
+                yield index
+
+        pool = ThreadPool(2)
+        try:
+            results = cfnsafeset.core.imap_unordered_bounded(pool, lambda x: x * 2, items(), 4)
+            first = next(results)
+            self.assertLessEqual(len(pulled), 5)
+            self.assertEqual(sorted([first] + list(results)), [x * 2 for x in range(100)])
+        finally:
+            pool.terminate()
+
+    def test_merge_is_bounded(self):
+        """Test merge drains many iterables on at most jobs threads and stops cleanly"""
+        lock = threading.Lock()
+        active = [0, 0]
+
+        def numbers(start):
+            """Count concurrently running iterables"""
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            try:
+                for offset in range(10):
+                    time.sleep(0.001)
+                    yield start + offset
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        merged = cfnsafeset.sweep.merge([numbers(start) for start in range(0, 200, 10)], 4, 3)
+        self.assertEqual(sorted(merged), list(range(200)))
+        self.assertLessEqual(active[1], 3)
+        # Abandoning the merge does not leave producers blocked on the buffer
+        merged = cfnsafeset.sweep.merge([numbers(start) for start in range(0, 200, 10)], 1, 3)
+        next(merged)
+        merged.close()
@@ -0,0 +1,53 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import io
+import json
+import cfnsafeset  # pylint: disable=E0401
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.synthetic  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class TestSynthetic(BaseTestCase):
+    """Test the synthetic change set generator """
+
+    def test_deterministic(self):
+        """Test the same seed gives the same change set"""
+        first = cfnsafeset.synthetic.generate_change_set(count=50, seed=7)
+        second = cfnsafeset.synthetic.generate_change_set(count=50, seed=7)
+        self.assertEqual(first, second)
+        self.assertEqual(len(first['Changes']), 50)
+
+    def test_written_document_parses(self):
+        """Test the streamed document matches the generated one"""
+        stream = io.StringIO()
+        cfnsafeset.synthetic.write_change_set(stream, count=200, seed=1)
+        stream.seek(0)
+        changes = list(cfnsafeset.core.iter_json_list(stream, 'Changes'))
+        self.assertEqual(changes, cfnsafeset.synthetic.generate_change_set(
+            count=200, seed=1)['Changes'])
+
+    def test_realistic_mix(self):
+        """Test the mix contains nested stacks and stateful findings"""
+        changes = cfnsafeset.synthetic.generate_change_set(count=500, seed=2)['Changes']
+        nested = [change for change in changes
+                  if change['ResourceChange']['ResourceType'] == 'AWS::CloudFormation::Stack']
+        self.assertTrue(nested)
+        self.assertTrue(all('ChangeSetId' in change['ResourceChange'] for change in nested
+                            if change['ResourceChange']['Action'] != 'Remove'))
+        self.assertTrue(cfnsafeset.scan(changes))
+        json.dumps(changes)
@@ -0,0 +1,128 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import cfnsafeset.throttle  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+
+class FakeEvents(object):
+    """Record registered botocore event handlers"""
+    def __init__(self):
+        self.handlers = {}
+
+    def register(self, event, handler):
+        """Register a handler"""
+        self.handlers[event] = handler
+
+    register_first = register
+
+
+class FakeMeta(object):  # pylint: disable=R0903
+    """Client meta with an event system"""
+    def __init__(self):
+        self.events = FakeEvents()
+
+
+class FakeClient(object):  # pylint: disable=R0903
+    """Client with meta.events only"""
+    def __init__(self):
+        self.meta = FakeMeta()
+
+
+class FakeResponse(object):  # pylint: disable=R0903
+    """HTTP response with a status code"""
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class TestThrottle(BaseTestCase):
+    """Test the shared rate limiter """
+
+    def setUp(self):
+        """Setup"""
+        self.now = [0.0]
+
+    def sleep(self, seconds):
+        """Advance the fake clock"""
+        self.now[0] += seconds
+
+    def bucket(self, **kwargs):
+        """Bucket on the fake clock"""
+        return cfnsafeset.throttle.TokenBucket(
+            clock=lambda: self.now[0], sleep=self.sleep, **kwargs)
+
+    def test_rate(self):
+        """Test acquisitions beyond the burst are paced at the rate"""
+        bucket = self.bucket(rate=10.0, burst=5)
+        for _ in range(25):
+            bucket.acquire()
+        self.assertAlmostEqual(self.now[0], 2.0, places=3)
+
+    def test_backoff_and_recovery(self):
+        """Test throttles halve the rate and successes raise it"""
+        bucket = self.bucket(rate=8.0, min_rate=1.0, recovery=2.0)
+        bucket.on_throttle()
+        self.now[0] += 2.0
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 2.0)
+        for _ in range(10):
+            self.now[0] += 2.0
+            bucket.on_throttle()
+        self.assertEqual(bucket.rate, 1.0)
+        self.now[0] += 1.0
+        bucket.on_success()
+        self.assertAlmostEqual(bucket.rate, 2 ** 0.5)
+
+    def test_recovery_after_burst(self):
+        """Test a burst of throttles slows calls for a few seconds only"""
+        bucket = self.bucket(rate=8.0, burst=8, max_rate=8.0)
+        for _ in range(3):
+            bucket.on_throttle()
+        # One burst halves the rate once
+        self.assertEqual(bucket.rate, 4.0)
+        # One doubling brings it back within a second
+        start = self.now[0]
+        for _ in range(12):
+            bucket.acquire()
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 8.0)
+        self.assertLess(self.now[0] - start, 2.5)
+        # Then calls are paced at the full rate again
+        start = self.now[0]
+        for _ in range(16):
+            bucket.acquire()
+            bucket.on_success()
+        self.assertAlmostEqual(self.now[0] - start, 2.0, places=3)
+
+    def test_instrument(self):
+        """Test the hooks count calls, attempts, throttles and retries"""
+        client = FakeClient()
+        bucket = self.bucket(rate=8.0)
+        stats = cfnsafeset.throttle.Stats()
+        cfnsafeset.throttle.instrument(client, bucket, stats)
+        handlers = client.meta.events.handlers
+        for _ in range(3):
+            handlers['request-created.cloudformation'](request=None)
+        throttled = {'Error': {'Code': 'Throttling'}}
+        handlers['needs-retry.cloudformation'](response=(FakeResponse(400), throttled))
+        handlers['needs-retry.cloudformation'](response=(FakeResponse(400), throttled))
+        handlers['after-call.cloudformation'](
+            http_response=FakeResponse(200),
+            parsed={'ResponseMetadata': {'RetryAttempts': 2}})
+        self.assertEqual(stats.snapshot(), {
+            'api_calls': 1, 'attempts': 3, 'throttles': 2, 'retries': 2})
+        # Both throttles are one burst
+        self.assertEqual(bucket.rate, 4.0)
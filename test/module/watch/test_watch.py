@@ -0,0 +1,146 @@
+"""
+  Copyright 2018 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+
+  Permission is hereby granted, free of charge, to any person obtaining a copy of this
+  software and associated documentation files (the "Software"), to deal in the Software
+  without restriction, including without limitation the rights to use, copy, modify,
+  merge, publish, distribute, sublicense, and/or sell copies of the Software, and to
+  permit persons to whom the Software is furnished to do so.
+
+  THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+  INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A
+  PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT
+  HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION
+  OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+  SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import cfnsafeset.core  # pylint: disable=E0401
+import cfnsafeset.watch  # pylint: disable=E0401
+from cfnsafeset.classifier import compile_config  # pylint: disable=E0401
+from testlib.testcase import BaseTestCase
+
+REPLACE = 'fixtures/changesets/db-replace-change.json'
+PARAMETER = 'fixtures/changesets/sample-parameter-change.json'
+
+
+class ListSink(object):
+    """Report sink that keeps records in memory"""
+    def __init__(self):
+        self.records = []
+
+    def write(self, record):
+        """Keep the record"""
+        self.records.append(record)
+
+
+class TestWatch(BaseTestCase):
+    """Test incremental scanning of a spool directory"""
+
+    def setUp(self):
+        """Empty spool and index"""
+        self.directory = tempfile.mkdtemp()
+        self.spool = os.path.join(self.directory, 'spool')
+        os.mkdir(self.spool)
+        self.index_path = os.path.join(self.directory, 'index', 'spool.json')
+        config = cfnsafeset.core.init_config(cfnsafeset.core.CONFIG_FILE, use_cache=False)
+        self.classifier = compile_config(config)
+        self.sink = ListSink()
+
+    def tearDown(self):
+        """Remove the spool"""
+        shutil.rmtree(self.directory)
+
+    def watcher(self, config='config'):
+        """Watcher with a freshly loaded index"""
+        index = cfnsafeset.watch.ScanIndex(self.index_path, config)
+        index.load()
+        return cfnsafeset.watch.Watcher(self.spool, self.classifier, index, self.sink)
+
+    def drop(self, source, name):
+        """Copy a fixture into the spool"""
+        shutil.copy(source, os.path.join(self.spool, name))
+
+    def scanned(self):
+        """Names of the files reported so far"""
+        return [os.path.basename(record['File']) for record in self.sink.records]
+
+    def test_only_new_files_are_scanned(self):
+        """Test unchanged files and copies are skipped, also after a restart"""
+        self.drop(PARAMETER, 'a.json')
+        self.drop(REPLACE, 'b.json')
+        self.watcher().rescan()
+        self.assertEqual(self.scanned(), ['a.json', 'b.json'])
+        self.assertEqual(self.sink.records[1]['ExitCode'], 2)
+        self.assertEqual(self.sink.records[1]['Findings'][0]['LogicalResourceId'], 'DBCluster')
+
+        watcher = self.watcher()
+        self.drop(REPLACE, 'c.json')
+        self.drop(PARAMETER, '.hidden.json')
+        watcher.rescan()
+        self.assertEqual(self.scanned(), ['a.json', 'b.json'])
+        self.assertEqual(watcher.index.entries['c.json']['ExitCode'], 2)
+
+        with open(os.path.join(self.spool, 'a.json'), 'w') as change_file:
+            change_file.write('{"Changes": [}')
+        watcher.rescan()
+        self.assertEqual(self.scanned(), ['a.json', 'b.json', 'a.json'])
+        self.assertEqual(self.sink.records[-1]['ExitCode'], 1)
+
+        os.remove(os.path.join(self.spool, 'b.json'))
+        watcher.rescan()
+        with open(self.index_path) as index_file:
+            self.assertEqual(sorted(json.load(index_file)), ['a.json', 'c.json'])
+
+    def test_config_change_rescans(self):
+        """Test files scanned under another config are scanned again"""
+        self.drop(REPLACE, 'b.json')
+        self.watcher().rescan()
+        self.watcher().rescan()
+        self.assertEqual(self.scanned(), ['b.json'])
+        watcher = self.watcher('other')
+        self.assertEqual(watcher.index.entries, {})
+        watcher.rescan()
+        self.assertEqual(self.scanned(), ['b.json', 'b.json'])
+        with open(self.index_path) as index_file:
+            self.assertEqual(json.load(index_file)['b.json']['Config'], 'other')
+
+    def test_unwritable_report(self):
+        """Test a report file that cannot be opened fails the run"""
+        report = os.path.join(self.directory, 'missing', 'scans.jsonl')
+        self.assertEqual(cfnsafeset.watch.watch(self.spool, 'config', self.classifier, report), 1)
+
+    def test_polling_waits_for_stable_files(self):
+        """Test a polled file is only scanned once it stops changing"""
+        watcher = self.watcher()
+        pending = {}
+        self.drop(REPLACE, 'b.json')
+        watcher.rescan(pending)
+        self.assertEqual(self.scanned(), [])
+        self.assertIn('b.json', pending)
+        watcher.rescan(pending)
+        self.assertEqual(self.scanned(), ['b.json'])
+        self.assertEqual(pending, {})
+
+    @unittest.skipUnless(sys.platform.startswith('linux'), 'inotify is Linux only')
+    def test_inotify_reports_closed_files(self):
+        """Test inotify reports files written or moved into the directory"""
+        inotify = cfnsafeset.watch.Inotify(self.spool)
+        try:
+            self.drop(REPLACE, 'b.json')
+            outside = os.path.join(self.directory, 'outside.json')
+            shutil.copy(PARAMETER, outside)
+            os.rename(outside, os.path.join(self.spool, 'moved.json'))
+            names = []
+            while len(names) < 2:
+                events = inotify.read(5)
+                self.assertTrue(events)
+                names.extend(events)
+        finally:
+            inotify.close()
+        self.assertEqual(sorted(names), ['b.json', 'moved.json'])